@@ -134,6 +134,20 @@ html, body, [data-testid="stAppViewContainer"] {
 </style>
 """, unsafe_allow_html=True)
 
+# Precàrrega dels models OCR en segon pla (un cop per procés)
+try:
+    from services.ocr import warm_up_in_background
+    warm_up_in_background()
+except ImportError:
+    pass
+
+# Preus PVPC refrescats i precalculats en segon pla (un cop per procés)
+try:
+    from services.price_refresher import start_price_refresher
+    start_price_refresher()
+except ImportError:
+    pass
+
 # Sidebar
 try:
     from services.ui import render_sidebar_nav
@@ -0,0 +1,68 @@
+"""
+Microbenchmark de services.bill_uncertainty.simular_incertesa_estalvi.
+
+Amb una llavor fixa, comprova que el resultat és reproduïble i mesura el
+temps de 10.000 escenaris amb remostreig d'un històric sintètic de 3 anys i
+amb el model paramètric. Objectiu: menys de 100 ms.
+
+Ús: python benchmarks/bench_bill_uncertainty.py [--escenaris N] [--seed S]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.bill_uncertainty import N_ESCENARIS, simular_incertesa_estalvi  # noqa: E402
+
+OBJECTIU_MS = 100.0
+
+
+def historic_sintetic(dies: int = 3 * 365, seed: int = 0) -> np.ndarray:
+    """Preus diaris relatius amb estacionalitat anual i soroll autocorrelat."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(dies)
+    soroll = np.convolve(rng.normal(0, 0.15, dies + 6), np.ones(7) / 7, mode="valid")
+    preus = np.exp(0.2 * np.cos(2 * np.pi * t / 365) + soroll)
+    return preus / preus.mean()
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--escenaris", type=int, default=N_ESCENARIS)
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--repeticions", type=int, default=20)
+    args = ap.parse_args()
+
+    historic = historic_sintetic()
+    kwargs = dict(
+        consum_anual_kwh=3500, potencia_kw=4.6, preu_actual=0.15, preu_nova=0.16,
+        escenaris=args.escenaris, seed=args.seed,
+    )
+    a = simular_incertesa_estalvi(historic=historic, **kwargs)
+    b = simular_incertesa_estalvi(historic=historic, **kwargs)
+    assert a == b, "el resultat amb la mateixa llavor ha de ser idèntic"
+    print(f"Estalvi P5/P50/P95: {a.estalvi[5]:.0f} / {a.estalvi[50]:.0f} / {a.estalvi[95]:.0f} €"
+          f"  (prob. estalvi {a.prob_estalvi:.0%})")
+
+    ok = True
+    for nom, hist in (("històric", historic), ("paramètric", np.empty(0))):
+        temps = []
+        for _ in range(args.repeticions):
+            t0 = time.perf_counter()
+            simular_incertesa_estalvi(historic=hist, **kwargs)
+            temps.append((time.perf_counter() - t0) * 1000)
+        mediana = float(np.median(temps))
+        ok &= mediana < OBJECTIU_MS
+        print(f"{args.escenaris} escenaris ({nom}): {mediana:6.1f} ms (mediana de {args.repeticions})")
+    print("Objectiu < 100 ms:", "OK" if ok else "NO")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""
+Microbenchmark de services.solar_simulation.
+
+Mesura la primera simulació d'unes entrades (dimensionat, potència òptima i
+bateria) i les repeticions amb les mateixes entrades, que són les que fa
+Streamlit a cada interacció i han de sortir de la memòria. Objectiu: menys
+d'1 ms per repetició.
+
+Ús: python benchmarks/bench_solar_simulation.py [--regio R] [--consum KWH]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.solar_simulation import (  # noqa: E402
+    dimensionar, simular_bateria_solar, simular_solar,
+)
+
+OBJECTIU_MS = 1.0
+
+
+def executa(entrades: tuple) -> float:
+    """Una passada de la pàgina: escombrat, potència òptima i bateries. Retorna ms."""
+    t0 = time.perf_counter()
+    kwp = dimensionar(*entrades).kwp_optim
+    simular_solar(*entrades, kwp)
+    simular_bateria_solar(*entrades, kwp)
+    return (time.perf_counter() - t0) * 1000
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--regio", default="Catalunya")
+    ap.add_argument("--consum", type=float, default=6000.0)
+    ap.add_argument("--superficie", type=float, default=50.0)
+    ap.add_argument("--preu", type=float, default=0.18)
+    ap.add_argument("--repeticions", type=int, default=200)
+    args = ap.parse_args()
+
+    entrades = (args.regio, "Sud", args.superficie, args.consum, args.preu, None)
+    primera = executa(entrades)
+    sim = simular_solar(*entrades)
+    print(f"{sim.kwp:g} kWp: {sim.produccio_kwh:.0f} kWh, estalvi {sim.estalvi_any1:.0f} €/any,"
+          f" VAN {sim.van:.0f} €, retorn {sim.retorn_anys:.1f} anys")
+    print(f"Primera simulació: {primera:8.1f} ms")
+
+    mediana = float(np.median([executa(entrades) for _ in range(args.repeticions)]))
+    print(f"Mateixes entrades: {mediana:8.4f} ms (mediana de {args.repeticions})")
+    ok = mediana < OBJECTIU_MS
+    print(f"Objectiu < {OBJECTIU_MS:g} ms:", "OK" if ok else "NO")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
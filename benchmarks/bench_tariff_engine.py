@@ -0,0 +1,70 @@
+"""
+Microbenchmark de services.invoice_simulator.simular_factures_lot.
+
+Compara la simulació en lot (N clients × M tarifes en arrays) amb el bucle
+de `simular_factura` cel·la a cel·la, i comprova que tots els conceptes del
+desglossament són idèntics bit a bit.
+
+Ús: python benchmarks/bench_tariff_engine.py [--clients N] [--tarifes M]
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from dataclasses import asdict
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.invoice_simulator import simular_factura, simular_factures_lot  # noqa: E402
+
+
+def make_inputs(n: int, m: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    consum = rng.uniform(0, 2000, n).round(1)
+    consum[: max(1, n // 50)] = 0  # factures sense consum
+    potencia = rng.choice([2.3, 3.45, 4.6, 5.75, 6.9, 9.2], n)
+    dies = rng.integers(1, 400, n)
+    preus = rng.uniform(0.05, 0.40, m)
+    return consum, potencia, dies, preus
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    ap.add_argument("--clients", type=int, default=2000)
+    ap.add_argument("--tarifes", type=int, default=1000)
+    ap.add_argument("--check", type=int, default=200, help="clients a comparar amb la versió escalar")
+    args = ap.parse_args()
+
+    consum, potencia, dies, preus = make_inputs(args.clients, args.tarifes)
+    lot = simular_factures_lot(consum, potencia, dies, preus)
+    n_check = min(args.check, args.clients)
+    for i in range(n_check):
+        for j in range(args.tarifes):
+            escalar = simular_factura(float(consum[i]), float(potencia[i]), int(dies[i]), float(preus[j]))
+            assert asdict(escalar) == asdict(lot.factura(i, j)), (i, j)
+    print(f"Igualtat bit a bit: OK ({n_check} × {args.tarifes} factures)")
+
+    # Bucle escalar sobre una mostra, extrapolat a la matriu sencera
+    sample = min(50, args.clients)
+    t0 = time.perf_counter()
+    for i in range(sample):
+        for j in range(args.tarifes):
+            simular_factura(float(consum[i]), float(potencia[i]), int(dies[i]), float(preus[j]))
+    t_loop = (time.perf_counter() - t0) * args.clients / sample
+
+    t0 = time.perf_counter()
+    lot = simular_factures_lot(consum, potencia, dies, preus)
+    lot.millor_tarifa()
+    t_lot = time.perf_counter() - t0
+    print(
+        f"{args.clients} clients × {args.tarifes} tarifes: "
+        f"bucle ~{t_loop:7.2f} s  lot {t_lot * 1000:8.1f} ms  x{t_loop / t_lot:6.0f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
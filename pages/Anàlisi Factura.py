@@ -5,11 +5,11 @@ if str(_root) not in sys.path:
     sys.path.insert(0, str(_root))
 
 import streamlit as st
-import fitz  # PyMuPDF - no requereix Poppler
-import easyocr
-import numpy as np
 
-from services.invoice_parser import parse_invoice_text
+from services.invoice_cache import extraction_options, get_invoice_cache, pdf_sha256
+from services.invoice_parser import parse_invoice_pages
+from services.ocr import get_reader_pool, warm_up_in_background
+from services.pdf_ocr import SOURCE_BLANK, SOURCE_OCR, SOURCE_TEXT, iter_page_texts
 
 try:
     from services.ui import inject_global_css, render_sidebar_nav
@@ -18,6 +18,9 @@ try:
 except ImportError:
     pass  # App corre sense estils personalitzats
 
+# Si s'entra directament a aquesta pàgina, comencem a carregar els models ja
+warm_up_in_background()
+
 # Idioma
 lang = st.session_state.get("lang", "ca")
 if lang == "ca":
@@ -60,35 +63,55 @@ st.divider()
 uploaded_pdf = st.file_uploader("Puja factura en PDF", type=["pdf"])
 
 if uploaded_pdf:
-    st.info("Convertint PDF a imatges...")
+    st.info("Llegint la factura...")
+
+    # Lectors EasyOCR compartits pel procés: els models només es carreguen un
+    # cop, i només si alguna pàgina no té capa de text
+    pool = get_reader_pool()
 
     try:
-        pdf_bytes = uploaded_pdf.read()
-        doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-        images = []
-        for page_num in range(len(doc)):
-            page = doc.load_page(page_num)
-            pix = page.get_pixmap(dpi=150, alpha=False)
-            img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
-            images.append(img_array)
-        doc.close()
+        # Vista sobre el buffer de l'upload: el PDF no es copia en memòria
+        pdf_bytes = uploaded_pdf.getbuffer()
     except Exception as e:
         st.error(f"Error al llegir el PDF: {e}")
         st.stop()
 
-    st.info("Inicialitzant OCR (EasyOCR)...")
-    reader = easyocr.Reader(["es", "ca"])
-
-    text_total = ""
+    # Memòria cau per hash del PDF: tornar a pujar la mateixa factura és immediat
+    pdf_hash = pdf_sha256(pdf_bytes)
+    dpi = 150
+    opcions = extraction_options(dpi=dpi)
+    cache = get_invoice_cache()
+    cached = cache.get(pdf_hash, opcions) if cache else None
 
-    for img_array in images:
-        img_array = np.ascontiguousarray(img_array)
-        results = reader.readtext(img_array)
-        for (bbox, text, prob) in results:
-            text_total += text + "\n"
-
-    # Parsejar amb el servei millorat
-    data = parse_invoice_text(text_total)
+    if cached:
+        data, sources = cached.data, cached.sources
+        n_pages = None
+    else:
+        try:
+            # Capa de text del PDF si n'hi ha; si no, rasterització + OCR en
+            # paral·lel. El parser s'atura en quant té consum, potència, import i període
+            pages = iter_page_texts(pdf_bytes, dpi=dpi, pool=pool)
+            data = parse_invoice_pages(pages)
+        except Exception as e:
+            st.error(f"Error al llegir el PDF: {e}")
+            st.stop()
+        sources, n_pages = pages.sources, pages.n_pages
+        if pages.truncated:
+            st.warning(f"La factura té moltes pàgines: només s'han analitzat les primeres {n_pages}.")
+        if cache:
+            cache.put(pdf_hash, data.raw_text, data, sources, opcions)
+    text_total = data.raw_text
+
+    n_text = sum(1 for s in sources.values() if s == SOURCE_TEXT)
+    n_ocr = sum(1 for s in sources.values() if s == SOURCE_OCR)
+    n_blank = sum(1 for s in sources.values() if s == SOURCE_BLANK)
+    st.caption(
+        f"Pàgines llegides: {n_text + n_ocr + n_blank}"
+        + (f" de {n_pages}" if n_pages else "")
+        + f" ({n_text} amb text digital, {n_ocr} amb OCR"
+        + (f", {n_blank} en blanc)" if n_blank else ")")
+        + (". Resultat recuperat de la memòria cau." if cached else ".")
+    )
 
     st.markdown(
         '<h3 class="app-section-title">Text extret de la factura</h3>',
@@ -8,9 +8,15 @@ if str(_root) not in sys.path:
 import streamlit as st
 import plotly.graph_objects as go
 
-from services.invoice_simulator import simular_factura, simular_factura_discriminacio, comparar_tarifes
+from services.invoice_simulator import (
+    simular_factura, simular_factura_horaria, comparar_tarifes,
+)
+from services.load_curve import read_load_curve
 from services.electricity_companies import TARIFA_INFO, get_price_factor
 from services.electricity_prices import get_live_price_by_region
+from services.price_refresher import get_period_factors, start_price_refresher
+from services.tariff_optimizer import ESTALVI_MINIM, optimitzar_contracte, preus_efectius
+from services.tariff_periods import PERIOD_LLANO, PERIOD_PUNTA, PERIOD_VALLE
 
 try:
     from services.ui import inject_global_css, render_sidebar_nav
@@ -117,6 +123,7 @@ with col_reg:
         ],
     )
 
+start_price_refresher()
 preu_pvpc, msg_actualitzacio = get_live_price_by_region(region)
 
 with col_tar:
@@ -135,33 +142,62 @@ discriminacio = st.checkbox(
     value=False,
     help="Punta, llano i valle tenen preus diferents. Si consumes més de nit, pots estalviar.",
 )
+corba = None
 if discriminacio:
-    st.caption("Indica aproximadament com es reparteix el teu consum:")
-    cp, cl, cv = st.columns(3)
-    with cp:
-        pct_punta = st.slider("% Punta (dia car)", 0, 50, 25, 5) / 100
-    with cl:
-        pct_llano = st.slider("% Llano (intermitjà)", 0, 50, 35, 5) / 100
-    with cv:
-        pct_valle = max(0, 1.0 - pct_punta - pct_llano)
-        total_pct = pct_punta + pct_llano + pct_valle
-        if total_pct > 0:
-            pct_punta, pct_llano, pct_valle = pct_punta / total_pct, pct_llano / total_pct, pct_valle / total_pct
-        st.metric("% Valle (nit barat)", f"{int(pct_valle * 100)}%")
-    # Factors PVPC típics: punta ~1.4x, llano 1.0x, valle ~0.6x
-    preu_punta = preu_kwh * 1.4
-    preu_llano = preu_kwh * 1.0
-    preu_valle = preu_kwh * 0.6
+    corba_csv = st.file_uploader(
+        "Corba de consum horària o quarthorària (opcional)",
+        type=["csv"],
+        help="CSV de la distribuïdora o de Datadis. Es calcula interval a interval amb el calendari 2.0TD.",
+    )
+    if corba_csv is not None:
+        try:
+            corba = read_load_curve(corba_csv.getvalue())
+        except ValueError as e:
+            st.warning(f"No s'ha pogut llegir la corba de consum: {e}")
+    if corba is None:
+        st.caption("Indica aproximadament com es reparteix el teu consum:")
+        cp, cl, cv = st.columns(3)
+        with cp:
+            pct_punta = st.slider("% Punta (dia car)", 0, 50, 25, 5) / 100
+        with cl:
+            pct_llano = st.slider("% Llano (intermitjà)", 0, 50, 35, 5) / 100
+        with cv:
+            pct_valle = max(0, 1.0 - pct_punta - pct_llano)
+            total_pct = pct_punta + pct_llano + pct_valle
+            if total_pct > 0:
+                pct_punta, pct_llano, pct_valle = pct_punta / total_pct, pct_llano / total_pct, pct_valle / total_pct
+            st.metric("% Valle (nit barat)", f"{int(pct_valle * 100)}%")
+    # Factors del perfil PVPC d'avui si ja està precalculat; si no, típics:
+    # punta ~1.4x, llano 1.0x, valle ~0.6x
+    factors_periode = get_period_factors(region) or {PERIOD_PUNTA: 1.4, PERIOD_LLANO: 1.0, PERIOD_VALLE: 0.6}
+    # Amb el mateix criteri que l'optimitzador: una tarifa de preu fix cobra
+    # igual a tots els períodes
+    per_periode_actual = TARIFA_INFO[tarifa_actual].get("per_periode", True)
+    factors_actual = factors_periode if per_periode_actual else {p: 1.0 for p in factors_periode}
+    preu_punta = preu_kwh * factors_actual[PERIOD_PUNTA]
+    preu_llano = preu_kwh * factors_actual[PERIOD_LLANO]
+    preu_valle = preu_kwh * factors_actual[PERIOD_VALLE]
 
 st.divider()
 
 # Simular
-if discriminacio:
-    desglos = simular_factura_discriminacio(
-        consum_kwh, potencia_kw, dies,
-        preu_punta, preu_llano, preu_valle,
-        pct_punta, pct_llano, pct_valle,
+if corba is not None:
+    horaria = simular_factura_horaria(
+        corba.timestamps, corba.kwh,
+        {PERIOD_PUNTA: preu_punta, PERIOD_LLANO: preu_llano, PERIOD_VALLE: preu_valle},
+        potencia_kw,
     )
+    desglos = horaria.desglos
+    pct = horaria.pct_periode
+    st.caption(
+        f"Corba de consum: {desglos.consum_kwh:.0f} kWh en {desglos.dies} dies "
+        f"({corba.interval_minutes} min) — punta {pct['punta']:.0%}, llano {pct['llano']:.0%}, valle {pct['valle']:.0%}"
+    )
+elif discriminacio:
+    preu_mitja = preus_efectius(
+        preu_pvpc, [factor], (pct_punta, pct_llano, pct_valle), factors_periode, [0.0], [per_periode_actual],
+    )[0, 0]
+    desglos = simular_factura(consum_kwh, potencia_kw, dies, float(preu_mitja))
 else:
     desglos = simular_factura(consum_kwh, potencia_kw, dies, preu_kwh)
 
@@ -234,8 +270,25 @@ st.markdown(
     "El [Comparador oficial de la CNMC](https://comparador.cnmc.gob.es/) ofereix més de 800 ofertes verificades."
 )
 
+# Amb la corba, el consum, els dies i el repartiment per períodes són els seus
+if not discriminacio:
+    pct_opt, consum_opt, dies_opt = None, consum_kwh, dies
+elif corba is not None:
+    pct_opt = (pct["punta"], pct["llano"], pct["valle"])
+    consum_opt, dies_opt = desglos.consum_kwh, desglos.dies
+else:
+    pct_opt = (pct_punta, pct_llano, pct_valle)
+    consum_opt, dies_opt = consum_kwh, dies
 factors = {nom: info["factor"] for nom, info in TARIFA_INFO.items()}
-comparacions = comparar_tarifes(consum_kwh, potencia_kw, dies, preu_pvpc, factors)
+tarifes_per_periode = {nom for nom, info in TARIFA_INFO.items() if info.get("per_periode")}
+preus_tarifa = preus_efectius(
+    preu_pvpc, list(factors.values()), pct_opt, factors_periode if discriminacio else None,
+    [0.0], [nom in tarifes_per_periode for nom in factors],
+)[:, 0]
+comparacions = comparar_tarifes(
+    consum_opt, potencia_kw, dies_opt, preu_pvpc, factors,
+    preus_kwh=dict(zip(factors, preus_tarifa.tolist())),
+)
 
 # Taula comparativa
 import pandas as pd
@@ -280,7 +333,7 @@ teva = comparacions[teva_idx]
 estalvi_anual = 0.0
 if teva_idx > 0:
     estalvi = teva.desglos.total - millor.desglos.total
-    estalvi_anual = estalvi * (365 / dies)
+    estalvi_anual = estalvi * (365 / dies_opt)
     st.markdown("---")
     st.markdown(
         f'<div style="background: linear-gradient(135deg, rgba(34,197,94,0.2), rgba(15,23,42,0.9)); '
@@ -294,6 +347,70 @@ if teva_idx > 0:
 else:
     st.success("La teva tarifa actual és la més econòmica d'aquestes opcions.")
 
+# Optimització del contracte: potència × tarifa × desplaçament de consum
+st.markdown("**Optimització del contracte**")
+st.markdown(
+    "Prova tots els esglaons de potència normalitzats amb cada tarifa i, si tens discriminació horària, "
+    "quina part del consum en punta et convindria passar a valle."
+)
+col_dem, col_desp = st.columns(2)
+with col_dem:
+    default_demanda = min(potencia_kw, round(corba.peak_kw, 2)) if corba is not None else potencia_kw
+    demanda_kw = st.number_input(
+        "Potència màxima que necessites (kW)",
+        min_value=1.0,
+        max_value=15.0,
+        value=float(default_demanda),
+        step=0.1,
+        help="Només es proposen potències que la cobreixin. Si tens la corba de consum, "
+        "per defecte és el pic de la corba (mitjana de l'interval, els pics reals poden ser més alts).",
+    )
+if discriminacio:
+    with col_desp:
+        max_desp = st.slider("Consum de punta que podries passar a valle (%)", 0, 50, 20, 10) / 100
+    desplacaments = [d / 10 for d in range(int(round(max_desp * 10)) + 1)]
+else:
+    desplacaments = [0.0]
+
+opcions = optimitzar_contracte(
+    consum_opt, dies_opt, preu_pvpc, factors,
+    potencia_minima_kw=demanda_kw,
+    pct_periode=pct_opt,
+    factors_periode=factors_periode if discriminacio else None,
+    tarifes_per_periode=tarifes_per_periode,
+    desplacaments=desplacaments,
+    top=5,
+)
+if opcions and desglos.total - opcions[0].desglos.total < ESTALVI_MINIM:
+    st.info(
+        "No hi ha estalvi a guanyar: cap combinació de potència, tarifa i horari "
+        "abarateix la teva factura actual."
+    )
+elif opcions:
+    millor = opcions[0]
+    st.success(
+        f"Millor opció: **{millor.potencia_kw:g} kW** amb **{millor.nom_tarifa}**"
+        + (f", passant un {millor.desplacament:.0%} del consum de punta a valle" if millor.desplacament else "")
+        + f": estalvi de **{desglos.total - millor.desglos.total:.2f} €** per factura."
+    )
+    st.dataframe(
+        pd.DataFrame([
+            {
+                "Potència": f"{o.potencia_kw:g} kW",
+                "Tarifa": o.nom_tarifa,
+                "Punta → valle": f"{o.desplacament:.0%}",
+                "Preu energia €/kWh": f"{o.preu_kwh_energia:.3f}",
+                "Total factura": f"{o.desglos.total:.2f} €",
+                "Estalvi": f"{desglos.total - o.desglos.total:.2f} €",
+            }
+            for o in opcions
+        ]),
+        use_container_width=True,
+        hide_index=True,
+    )
+else:
+    st.info("Cap potència normalitzada de 2.0TD (fins a 15 kW) cobreix la demanda indicada.")
+
 # Avis bono social
 consum_mensual = consum_kwh * (30 / dies) if dies > 0 else consum_kwh
 if potencia_kw <= 3.45 and consum_mensual < 150:
@@ -8,7 +8,9 @@ import streamlit as st
 import plotly.graph_objects as go
 import pandas as pd
 import numpy as np
-from services.solar import solar_production_by_region
+from services.battery import COST_KWH, MIDES_KWH
+from services.pv_sizing import DEGRADACIO_PANELLS, PUJADA_PREU, TAXA_DESCOMPTE, VIDA_ANYS
+from services.solar_simulation import dimensionar, simular_bateria_solar, simular_solar
 from services.electricity_prices import electricity_price_by_region, get_live_price_by_region
 from services.electricity_companies import TARIFA_INFO, get_price_factor, get_tarifa_description
 try:
@@ -120,6 +122,11 @@ with col1:
     )
     if st.session_state.invoice_consum_anual:
         st.caption("Valor detectat de la factura")
+    corba_csv = st.file_uploader(
+        "Corba de consum horària o quarthorària (opcional)",
+        type=["csv"],
+        help="CSV de la distribuïdora o de Datadis. Sense corba, es fa servir un perfil estàndard de REE.",
+    )
 
 with col2:
     default_preu = st.session_state.invoice_preu_kwh or float(preu_recomanat)
@@ -130,55 +137,44 @@ with col2:
         float(default_preu),
     )
 
-cost_instalacio_kw = 1200
-
-# ---------------- POTÈNCIA ----------------
-
-kw_instalables = mida_teulada / 5
-
-# ---------------- PRODUCCIÓ ----------------
-
-produccio_kw = solar_production_by_region(region)
-produccio_anual = kw_instalables * produccio_kw
-
-orientation_factor = {
-    "Sud": 1.0,
-    "Sud-Est / Sud-Oest": 0.92,
-    "Est / Oest": 0.80,
-    "Nord": 0.60,
-}
-
-produccio_anual *= orientation_factor[orientacio]
-
-# pèrdues sistema
-produccio_anual *= 0.86
-
-# ---------------- AUTOCONSUM REALISTA ----------------
-
-ratio = produccio_anual / consum_anual
-
-# model estadístic realista
-autoconsum_ratio = max(0.3, min(0.8, 0.8 - 0.5 * (ratio - 1)))
+# ---------------- SIMULACIÓ ----------------
+# Tot el càlcul és a services.solar_simulation, memoritzat per les entrades:
+# les reexecucions de Streamlit amb les mateixes entrades no recalculen res.
 
-autoconsum = produccio_anual * autoconsum_ratio
-autoconsum = min(autoconsum, consum_anual)
-
-excedent = max(produccio_anual - autoconsum, 0)
-
-percent_autoconsum = (autoconsum / produccio_anual) * 100
-
-# ---------------- ECONOMIA ----------------
-
-preu_excedent = min(preu_kwh * 0.5, 0.12)
-
-estalvi_autoconsum = autoconsum * preu_kwh
-ingressos_excedent = excedent * preu_excedent
-
-estalvi_total = estalvi_autoconsum + ingressos_excedent
-
-cost_total = kw_instalables * cost_instalacio_kw
+entrades = (
+    region, orientacio, mida_teulada, float(consum_anual), float(preu_kwh),
+    corba_csv.getvalue() if corba_csv is not None else None,
+)
+dim = dimensionar(*entrades)
+if dim.avis_corba:
+    st.warning(f"No s'ha pogut llegir la corba de consum: {dim.avis_corba}")
+elif dim.kwh_corba is not None:
+    st.caption(f"Corba de consum: {dim.kwh_corba:.0f} kWh llegits, {dim.consum_anual_kwh:.0f} kWh/any un cop completada")
+consum_anual = dim.consum_anual_kwh
+dimensionat = dim.corba
+
+opcions_kwp = dim.opcions_kwp
+kwp_optim = dim.kwp_optim
+kw_instalables = st.select_slider(
+    "Potència a instal·lar (kWp)",
+    options=opcions_kwp,
+    value=kwp_optim,
+    help=f"Fins a {opcions_kwp[-1]:g} kWp caben a la teulada. Per defecte, la potència amb més VAN.",
+)
+st.caption(
+    f"Potència òptima: {kwp_optim:g} kWp — VAN {dimensionat.van[dimensionat.millor]:.0f} €"
+    f" a {VIDA_ANYS} anys (descompte {TAXA_DESCOMPTE:.0%}, pujada de preus {PUJADA_PREU:.0%}/any,"
+    f" degradació panells {DEGRADACIO_PANELLS:.1%}/any)"
+)
 
-roi_anys = cost_total / estalvi_total if estalvi_total > 0 else 0
+sim = simular_solar(*entrades, kw_instalables)
+produccio_anual = sim.produccio_kwh
+autoconsum = sim.autoconsum_kwh
+excedent = sim.excedent_kwh
+estalvi_total = sim.estalvi_any1
+cost_total = sim.cost
+roi_anys = sim.retorn_anys
+estalvi_acumulat_fv = sim.estalvi_acumulat
 
 # ---------------- RESULTATS ----------------
 
@@ -190,48 +186,64 @@ st.markdown(
 col1, col2, col3, col4 = st.columns(4)
 
 col1.metric("Producció anual estimada", f"{produccio_anual:.0f} kWh")
-col2.metric("Autoconsum real", f"{percent_autoconsum:.1f}%")
+col2.metric("Autoconsum real", f"{sim.pct_autoconsum:.1%}")
 col3.metric("Estalvi anual", f"{estalvi_total:.0f} €")
-col4.metric("Retorn inversió", f"{roi_anys:.1f} anys")
+col4.metric("Retorn inversió", f"{roi_anys:.1f} anys" if np.isfinite(roi_anys) else "No es recupera")
 
 col1b, col2b, col3b, col4b = st.columns(4)
 
-cost_factura_actual = consum_anual * preu_kwh
-percent_estalvi = (estalvi_total / cost_factura_actual * 100) if cost_factura_actual > 0 else 0
-co2_estalvi = produccio_anual * 0.25
-
-col1b.metric("Cost anual sense solar", f"{cost_factura_actual:.0f} €")
-col2b.metric("Estalvi anual (%)", f"{percent_estalvi:.1f}%")
-col3b.metric("CO₂ estalviat", f"{co2_estalvi:.0f} kg")
+col1b.metric("Cost anual sense solar", f"{sim.cost_sense_solar:.0f} €")
+col2b.metric("Estalvi anual (%)", f"{sim.pct_estalvi:.1%}")
+col3b.metric("CO₂ estalviat", f"{sim.co2_kg:.0f} kg")
 col4b.metric("Cost instal·lació", f"{cost_total:.0f} €")
 
 # Estadístiques d'estalvi a futur
 st.markdown("**Estalvi projectat**")
-c1, c2, c3 = st.columns(3)
-c1.metric("En 1 any", f"{estalvi_total:.0f} €")
-c2.metric("En 5 anys", f"{estalvi_total * 5:.0f} €")
-c3.metric("En 10 anys", f"{estalvi_total * 10:.0f} €")
+c1, c2, c3, c4 = st.columns(4)
+c1.metric("En 1 any", f"{estalvi_acumulat_fv[0]:.0f} €")
+c2.metric("En 5 anys", f"{estalvi_acumulat_fv[4]:.0f} €")
+c3.metric("En 10 anys", f"{estalvi_acumulat_fv[9]:.0f} €")
+c4.metric("VAN / TIR", f"{sim.van:.0f} €", f"TIR {sim.tir:.1%}" if np.isfinite(sim.tir) else None)
+
+# ---------------- CORBA DE DIMENSIONAT ----------------
+
+st.markdown("### Quina potència et convé?")
+fig_dim = go.Figure()
+fig_dim.add_trace(go.Bar(
+    x=dimensionat.kwp,
+    y=dimensionat.van,
+    name="VAN (€)",
+    marker_color=["#22c55e" if k == kw_instalables else "#64748b" for k in opcions_kwp],
+))
+fig_dim.add_trace(go.Scatter(
+    x=dimensionat.kwp,
+    y=np.where(np.isfinite(dimensionat.retorn_anys), dimensionat.retorn_anys, None),
+    mode="lines+markers",
+    name="Retorn (anys)",
+    yaxis="y2",
+    line=dict(color="#f97316", width=2),
+))
+fig_dim.update_layout(
+    template="plotly_dark",
+    xaxis_title="Potència instal·lada (kWp)",
+    yaxis=dict(title="VAN (€)"),
+    yaxis2=dict(title="Retorn (anys)", overlaying="y", side="right"),
+    legend=dict(orientation="h", yanchor="bottom", y=1.02),
+)
+st.plotly_chart(fig_dim, use_container_width=True)
+st.caption(
+    "Més potència produeix més, però l'excedent es compensa a menys preu i com a molt fins al cost "
+    "de l'energia comprada cada mes: a partir d'una mida, cada kWp extra aporta poc."
+)
 
 st.divider()
 
 # ---------------- ESTALVI PER MESOS ----------------
 
 MESOS = ["Gen", "Feb", "Mar", "Abr", "Mai", "Jun", "Jul", "Ago", "Sep", "Oct", "Nov", "Des"]
-# Distribució mensual solar Espanya (% anual per mes)
-DIST_SOLAR = [0.04, 0.05, 0.07, 0.08, 0.10, 0.11, 0.12, 0.11, 0.09, 0.07, 0.05, 0.04]
-# Consum mensual típic (més calor/aire a estiu)
-DIST_CONSUM = [0.09, 0.08, 0.08, 0.08, 0.08, 0.08, 0.09, 0.09, 0.08, 0.08, 0.08, 0.09]
-
-produccio_mensual = [produccio_anual * d for d in DIST_SOLAR]
-consum_mensual = [consum_anual * d for d in DIST_CONSUM]
-
-estalvi_mensual = []
-for i in range(12):
-    prod_m = produccio_mensual[i]
-    autoc_m = autoconsum * DIST_SOLAR[i]
-    exc_m = max(prod_m - autoc_m, 0)
-    est = autoc_m * preu_kwh + exc_m * preu_excedent
-    estalvi_mensual.append(est)
+produccio_mensual = sim.produccio_mensual.tolist()
+consum_mensual = sim.consum_mensual.tolist()
+estalvi_mensual = sim.estalvi_mensual.tolist()
 
 df_mensual = pd.DataFrame({
     "Mes": MESOS,
@@ -266,9 +278,9 @@ st.plotly_chart(fig1, use_container_width=True)
 
 st.markdown("### Estalvi acumulat en els pròxims anys")
 
-anys_mostrar = min(25, max(15, int(roi_anys) + 5))
+anys_mostrar = len(estalvi_acumulat_fv)
 anys = list(range(1, anys_mostrar + 1))
-estalvi_acumulat = [estalvi_total * a for a in anys]
+estalvi_acumulat = estalvi_acumulat_fv.tolist()
 inversio_linea = [cost_total] * anys_mostrar
 
 fig2 = go.Figure()
@@ -348,7 +360,7 @@ st.plotly_chart(fig4, use_container_width=True)
 
 st.markdown("### Balanç energètic")
 
-grid_necessari = max(consum_anual - autoconsum, 0)
+grid_necessari = sim.importacio_kwh
 labels_pie = ["Autoconsum solar", "Xarxa elèctrica", "Excedent venut"]
 values_pie = [autoconsum, grid_necessari, excedent]
 colors_pie = ["#22c55e", "#f97316", "#38bdf8"]
@@ -368,6 +380,56 @@ fig5.update_layout(
 )
 st.plotly_chart(fig5, use_container_width=True)
 
+# ---------------- BATERIA ----------------
+
+st.markdown("### Bateria")
+st.markdown(
+    "La bateria guarda l'excedent solar del dia per fer-lo servir al vespre i a la nit. "
+    "Es simula hora a hora tot l'any per a cada mida, amb pèrdues de càrrega i descàrrega i degradació."
+)
+col_bat1, col_bat2 = st.columns(2)
+with col_bat1:
+    cost_bateria_kwh = st.number_input("Cost bateria (€ / kWh instal·lat)", 200, 1500, int(COST_KWH), step=50)
+corba_bat = simular_bateria_solar(*entrades, kw_instalables, cost_bateria_kwh)
+with col_bat2:
+    capacitat_bat = st.select_slider(
+        "Capacitat de la bateria (kWh)",
+        options=[m for m in MIDES_KWH if m > 0],
+        value=5.0,
+    )
+i_bat = int(np.searchsorted(corba_bat.capacitat_kwh, capacitat_bat))
+retorn_bat = corba_bat.retorn_anys[i_bat]
+
+cb1, cb2, cb3, cb4 = st.columns(4)
+cb1.metric("Estalvi extra (1r any)", f"{corba_bat.estalvi_any1[i_bat]:.0f} €")
+cb2.metric("Cost bateria", f"{corba_bat.cost[i_bat]:.0f} €")
+cb3.metric("Retorn bateria", f"{retorn_bat:.1f} anys" if np.isfinite(retorn_bat) else "No es recupera")
+cb4.metric("Cicles / any", f"{corba_bat.cicles[i_bat]:.0f}")
+
+mides_bat = corba_bat.capacitat_kwh[1:]
+fig_bat = go.Figure()
+fig_bat.add_trace(go.Bar(
+    x=mides_bat,
+    y=corba_bat.estalvi_vida[1:],
+    name="Estalvi en la vida útil (€)",
+    marker_color="#22c55e",
+))
+fig_bat.add_trace(go.Scatter(
+    x=mides_bat,
+    y=corba_bat.cost[1:],
+    mode="lines",
+    name="Cost bateria (€)",
+    line=dict(color="#f97316", width=2, dash="dash"),
+))
+fig_bat.update_layout(
+    template="plotly_dark",
+    xaxis_title="Capacitat (kWh)",
+    yaxis_title="€",
+    legend=dict(orientation="h", yanchor="bottom", y=1.02),
+)
+st.plotly_chart(fig_bat, use_container_width=True)
+st.caption("Quan les barres superen la línia, la bateria es paga sola abans d'acabar la seva vida útil.")
+
 st.divider()
 
 if roi_anys < 7:
@@ -377,7 +439,7 @@ elif roi_anys < 12:
 else:
     st.warning("ROI llarg. Revisa subvencions.")
 
-st.caption("Model d'autoconsum basat en simulacions residencials europees.")
+st.caption("Autoconsum calculat hora a hora creuant la producció solar amb el consum (corba pròpia o perfil estàndard de REE).")
 
 # Bloc comercial: estudi personalitzat de plaques
 st.markdown("---")
@@ -0,0 +1,469 @@
+"""
+Processament en lot de factures en PDF (sense Streamlit).
+
+Accepta directoris (es busquen PDFs recursivament), fitxers ZIP i llistes de
+camins. Cada factura es processa en un procés del pool amb el mateix camí
+que la pàgina d'anàlisi (capa de text o OCR + `parse_invoice_pages`) i el
+resultat s'escriu en quant està llest a JSONL o Parquet.
+
+Un fitxer de checkpoint (`<sortida>.done`) guarda les factures ja fetes:
+si el procés s'interromp, tornar-lo a llançar continua on era. Les files
+d'errors i temps límit de l'execució anterior es treuen de la sortida,
+perquè aquestes factures es tornen a provar.
+
+El temps límit es comprova al procés entre pàgines i, a més, des del procés
+principal: si una factura el passa de llarg (una pàgina penjada), es maten
+els processos del pool i se'n crea un de nou. Si un procés cau, les
+factures que hi havia en curs es tornen a provar d'una en una per saber
+quina l'ha fet caure.
+
+Ús:
+    python -m services.batch_invoices factures/ arxiu.zip -o resultats.jsonl
+    python -m services.batch_invoices factures/ -o resultats.parquet --workers 8 --timeout 120
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+DEFAULT_TIMEOUT_S = 300.0
+MARGE_TEMPS_LIMIT_S = 30.0  # marge del procés principal sobre el límit que es comprova entre pàgines
+_ZIP_SEP = "::"  # identificador d'un PDF dins d'un ZIP: "arxiu.zip::carpeta/factura.pdf"
+
+
+@dataclass(frozen=True)
+class InvoiceSource:
+    """Una factura a processar: un fitxer PDF o un membre d'un ZIP."""
+    path: str
+    member: Optional[str] = None
+
+    @property
+    def id(self) -> str:
+        return f"{self.path}{_ZIP_SEP}{self.member}" if self.member else self.path
+
+    def read_bytes(self) -> bytes:
+        if self.member is None:
+            return Path(self.path).read_bytes()
+        with zipfile.ZipFile(self.path) as zf:
+            return zf.read(self.member)
+
+
+def collect_sources(inputs: Iterable[Union[str, Path]]) -> list[InvoiceSource]:
+    """Expandeix directoris, ZIPs i fitxers en una llista ordenada de factures."""
+    sources: list[InvoiceSource] = []
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            sources.extend(
+                InvoiceSource(str(p)) for p in sorted(path.rglob("*"))
+                if p.is_file() and p.suffix.lower() == ".pdf"
+            )
+        elif path.suffix.lower() == ".zip":
+            with zipfile.ZipFile(path) as zf:
+                sources.extend(
+                    InvoiceSource(str(path), name) for name in sorted(zf.namelist())
+                    if name.lower().endswith(".pdf") and not name.endswith("/")
+                )
+        else:
+            sources.append(InvoiceSource(str(path)))
+    return sources
+
+
+def _pages_until(pages: Iterator, deadline: float) -> Iterator:
+    """Passa les pàgines i llança TimeoutError si s'ha superat el temps límit."""
+    try:
+        for page in pages:
+            if time.monotonic() > deadline:
+                raise TimeoutError
+            yield page
+    finally:
+        pages.close()
+
+
+def process_invoice(
+    source: InvoiceSource,
+    timeout_s: float = DEFAULT_TIMEOUT_S,
+    dpi: int = 150,
+    use_cache: bool = True,
+    include_text: bool = False,
+) -> dict[str, Any]:
+    """
+    Processa una factura i retorna un registre pla (serialitzable a JSON).
+    Mai llança excepcions: els errors es reflecteixen a `status` i `error`.
+    """
+    from services.invoice_cache import extraction_options, get_invoice_cache, pdf_sha256
+    from services.invoice_parser import parse_invoice_pages
+    from services.pdf_ocr import SOURCE_BLANK, SOURCE_OCR, SOURCE_TEXT, iter_page_texts
+
+    t0 = time.monotonic()
+    record: dict[str, Any] = {"file": source.id, "sha256": None, "status": "ok", "error": None}
+    data = None
+    sources: dict[int, str] = {}
+    try:
+        pdf_bytes = source.read_bytes()
+        record["sha256"] = sha = pdf_sha256(pdf_bytes)
+        options = extraction_options(dpi=dpi)
+        cache = get_invoice_cache() if use_cache else None
+        cached = cache.get(sha, options) if cache else None
+        if cached:
+            data, sources = cached.data, cached.sources
+        else:
+            pages = iter_page_texts(pdf_bytes, dpi=dpi)
+            data = parse_invoice_pages(_pages_until(pages, t0 + timeout_s))
+            sources = pages.sources
+            if cache:
+                cache.put(sha, data.raw_text, data, sources, options)
+    except TimeoutError:
+        record.update(status="timeout", error=f"Temps límit de {timeout_s:g} s superat")
+    except Exception as e:
+        record.update(status="error", error=f"{type(e).__name__}: {e}")
+
+    record.update(
+        consum_kwh=data.consum_kwh if data else None,
+        potencia_kw=data.potencia_kw if data else None,
+        import_total=data.import_total if data else None,
+        periode_inici=data.periode_inici if data else None,
+        periode_fi=data.periode_fi if data else None,
+        pages_text=sum(1 for s in sources.values() if s == SOURCE_TEXT),
+        pages_ocr=sum(1 for s in sources.values() if s == SOURCE_OCR),
+        pages_blank=sum(1 for s in sources.values() if s == SOURCE_BLANK),
+        seconds=round(time.monotonic() - t0, 3),
+    )
+    if include_text:
+        record["text"] = data.raw_text if data else ""
+    return record
+
+
+def _failed_record(source: InvoiceSource, status: str, error: str, include_text: bool) -> dict[str, Any]:
+    """Registre d'una factura que no ha retornat del procés (penjada o caiguda)."""
+    record: dict[str, Any] = {
+        "file": source.id, "sha256": None, "status": status, "error": error,
+        "consum_kwh": None, "potencia_kw": None, "import_total": None,
+        "periode_inici": None, "periode_fi": None,
+        "pages_text": 0, "pages_ocr": 0, "pages_blank": 0, "seconds": None,
+    }
+    if include_text:
+        record["text"] = ""
+    return record
+
+
+class _JsonlWriter:
+    def __init__(self, path: Path, append: bool):
+        self._f = open(path, "a" if append else "w", encoding="utf-8")
+
+    def write(self, record: dict[str, Any]) -> None:
+        self._f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._f.flush()
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class _ParquetWriter:
+    """
+    Escriu per blocs de files. En reprendre, cada execució escriu un fitxer
+    nou (`resultats.partN.parquet`) perquè Parquet no admet afegir files.
+    """
+
+    def __init__(self, path: Path, append: bool, batch_size: int = 256):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise RuntimeError("La sortida Parquet requereix pyarrow (pip install pyarrow)") from e
+        if append and path.exists():
+            n = 1
+            while path.with_name(f"{path.stem}.part{n}{path.suffix}").exists():
+                n += 1
+            path = path.with_name(f"{path.stem}.part{n}{path.suffix}")
+        self.path = path
+        self._batch: list[dict[str, Any]] = []
+        self._batch_size = batch_size
+        self._writer = None
+
+    def write(self, record: dict[str, Any]) -> None:
+        self._batch.append(record)
+        if len(self._batch) >= self._batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if not self._batch:
+            return
+        schema = _parquet_schema("text" in self._batch[0])
+        table = pa.Table.from_pylist(self._batch, schema=schema)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, schema)
+        self._writer.write_table(table)
+        self._batch = []
+
+    def close(self) -> None:
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+
+
+def _parquet_schema(include_text: bool):
+    import pyarrow as pa
+
+    fields = [
+        ("file", pa.string()), ("sha256", pa.string()), ("status", pa.string()), ("error", pa.string()),
+        ("consum_kwh", pa.float64()), ("potencia_kw", pa.float64()), ("import_total", pa.float64()),
+        ("periode_inici", pa.string()), ("periode_fi", pa.string()),
+        ("pages_text", pa.int32()), ("pages_ocr", pa.int32()), ("pages_blank", pa.int32()),
+        ("seconds", pa.float64()),
+    ]
+    if include_text:
+        fields.append(("text", pa.string()))
+    return pa.schema(fields)
+
+
+def _checkpoint_path(output: Path) -> Path:
+    return output.with_name(output.name + ".done")
+
+
+def _load_checkpoint(path: Path) -> set[str]:
+    if not path.exists():
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+def _output_parts(output: Path) -> list[Path]:
+    """Fitxers `resultats.partN.parquet` de represes anteriors, per ordre de N."""
+    parts = []
+    for path in output.parent.glob(f"{output.stem}.part*{output.suffix}"):
+        n = path.name[len(output.stem) + len(".part"):len(path.name) - len(output.suffix)]
+        if n.isdigit():
+            parts.append((int(n), path))
+    return [path for _, path in sorted(parts)]
+
+
+def _prune_output(output: Path, fmt: str, keep: set[str]) -> None:
+    """
+    Deixa a la sortida d'una execució anterior només les factures de `keep`
+    (el checkpoint): les files d'errors i temps límit es tornaran a escriure.
+    """
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        for path in [output, *_output_parts(output)]:
+            if not path.exists():
+                continue
+            table = pq.read_table(path)
+            mask = pc.is_in(table["file"], value_set=pa.array(sorted(keep), type=pa.string()))
+            if pc.all(mask).as_py():
+                continue
+            tmp = path.with_name(path.name + ".tmp")
+            pq.write_table(table.filter(mask), tmp)
+            os.replace(tmp, path)
+        return
+
+    if not output.exists():
+        return
+    tmp = output.with_name(output.name + ".tmp")
+    with open(output, encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+        for line in src:
+            if line.strip() and json.loads(line)["file"] in keep:
+                dst.write(line)
+    os.replace(tmp, output)
+
+
+def _kill_pool(executor: ProcessPoolExecutor) -> None:
+    """Atura el pool sense esperar les tasques en curs."""
+    # Abans de Python 3.14 no hi ha API pública per matar els processos
+    processes = list((getattr(executor, "_processes", None) or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.kill()
+
+
+def run_batch(
+    inputs: Iterable[Union[str, Path]],
+    output: Union[str, Path],
+    fmt: Optional[str] = None,
+    workers: Optional[int] = None,
+    timeout_s: float = DEFAULT_TIMEOUT_S,
+    resume: bool = True,
+    use_cache: bool = True,
+    include_text: bool = False,
+    progress: Optional[Callable[[int, int, dict[str, Any]], None]] = None,
+) -> dict[str, int]:
+    """
+    Processa totes les factures d'`inputs` en paral·lel i escriu els resultats.
+
+    Args:
+        output: fitxer de sortida (.jsonl o .parquet)
+        fmt: "jsonl" o "parquet" (per defecte, segons l'extensió)
+        workers: processos (per defecte, nombre de CPUs)
+        timeout_s: temps màxim per factura; es comprova entre pàgines, i si una
+            pàgina es penja es mata el procés
+        resume: saltar les factures del checkpoint d'una execució anterior
+        progress: callback(fets, total, registre) després de cada factura
+
+    Returns:
+        Recompte per estat: {"ok": n, "error": n, "timeout": n, "skipped": n}
+    """
+    output = Path(output)
+    fmt = fmt or ("parquet" if output.suffix.lower() == ".parquet" else "jsonl")
+    checkpoint = _checkpoint_path(output)
+    done_ids = _load_checkpoint(checkpoint) if resume else set()
+    append = resume and bool(done_ids)
+
+    all_sources = collect_sources(inputs)
+    pending = [s for s in all_sources if s.id not in done_ids]
+    counts = {"ok": 0, "error": 0, "timeout": 0, "skipped": len(all_sources) - len(pending)}
+    total = len(pending)
+    if total == 0:
+        return counts
+
+    if append:
+        _prune_output(output, fmt, done_ids)
+    writer = _ParquetWriter(output, append) if fmt == "parquet" else _JsonlWriter(output, append)
+    if fmt == "parquet" and not append:
+        # Sense represa la sortida torna a començar: fora les parts d'abans
+        for path in _output_parts(output):
+            path.unlink()
+    workers = workers or os.cpu_count() or 1
+    ctx = multiprocessing.get_context("spawn")  # sense fork: EasyOCR/torch no el toleren bé
+
+    n_done = 0
+    executor: Optional[ProcessPoolExecutor] = None
+    try:
+        with open(checkpoint, "a" if append else "w", encoding="utf-8") as ckpt:
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+            queue = deque(pending)
+            # Futur -> (factura, instant límit). Una factura per procés, de manera
+            # que cada tasca comença en enviar-la i el límit es pot comprovar aquí.
+            in_flight: dict[Future, tuple[InvoiceSource, float]] = {}
+            suspects: set[str] = set()  # en curs quan ha caigut un procés: van soles
+
+            def _finish(record: dict[str, Any]) -> None:
+                nonlocal n_done
+                writer.write(record)
+                # Els errors i temps límit no es marquen: es tornen a provar en reprendre
+                if record["status"] == "ok":
+                    ckpt.write(record["file"] + "\n")
+                    ckpt.flush()
+                counts[record["status"]] += 1
+                n_done += 1
+                if progress:
+                    progress(n_done, total, record)
+
+            while queue or in_flight:
+                while queue and len(in_flight) < workers:
+                    if queue[0].id in suspects and in_flight:
+                        break
+                    source = queue.popleft()
+                    fut = executor.submit(process_invoice, source, timeout_s, 150, use_cache, include_text)
+                    in_flight[fut] = (source, time.monotonic() + timeout_s + MARGE_TEMPS_LIMIT_S)
+                    if source.id in suspects:
+                        break
+
+                next_deadline = min(deadline for _, deadline in in_flight.values())
+                finished, _ = wait(
+                    in_flight, timeout=max(next_deadline - time.monotonic(), 0), return_when=FIRST_COMPLETED,
+                )
+                recycle = False
+                for fut in finished:
+                    source, _ = in_flight.pop(fut)
+                    try:
+                        record = fut.result()
+                    except BrokenProcessPool as e:
+                        recycle = True
+                        if source.id in suspects:  # anava sola: és la culpable
+                            _finish(_failed_record(
+                                source, "error", f"{type(e).__name__}: el procés ha caigut", include_text,
+                            ))
+                        else:
+                            suspects.add(source.id)
+                            queue.appendleft(source)
+                        continue
+                    _finish(record)
+
+                now = time.monotonic()
+                for fut in [f for f, (_, deadline) in in_flight.items() if deadline <= now]:
+                    source, _ = in_flight.pop(fut)
+                    _finish(_failed_record(
+                        source, "timeout", f"Temps límit de {timeout_s:g} s superat", include_text,
+                    ))
+                    recycle = True
+
+                if recycle:
+                    # Les altres factures en curs no en tenen la culpa: es tornen a enviar
+                    queue.extendleft(source for source, _ in reversed(list(in_flight.values())))
+                    in_flight.clear()
+                    _kill_pool(executor)
+                    executor = ProcessPoolExecutor(max_workers=workers, mp_context=ctx)
+            executor.shutdown()
+            executor = None
+    finally:
+        if executor is not None:
+            _kill_pool(executor)
+        writer.close()
+    return counts
+
+
+def _print_progress(done: int, total: int, record: dict[str, Any]) -> None:
+    detail = record["error"] or (
+        f"consum={record['consum_kwh']} potència={record['potencia_kw']} "
+        f"import={record['import_total']} ({record['seconds']:.1f} s)"
+    )
+    print(f"[{done}/{total}] {record['status']:<7} {record['file']} — {detail}", file=sys.stderr)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Processa factures elèctriques en PDF en lot (directoris, ZIPs o fitxers).",
+    )
+    parser.add_argument("inputs", nargs="+", help="Directoris, fitxers .zip o fitxers .pdf")
+    parser.add_argument("-o", "--output", required=True, help="Fitxer de sortida (.jsonl o .parquet)")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], help="Format de sortida")
+    parser.add_argument("--workers", type=int, help="Processos en paral·lel (per defecte, CPUs)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT_S, help="Segons màxims per factura")
+    parser.add_argument("--no-resume", action="store_true", help="Ignora el checkpoint i torna a començar")
+    parser.add_argument("--no-cache", action="store_true", help="No usa la memòria cau de factures")
+    parser.add_argument("--include-text", action="store_true", help="Inclou el text extret a la sortida")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Sense progrés per stderr")
+    args = parser.parse_args(argv)
+
+    t0 = time.monotonic()
+    counts = run_batch(
+        args.inputs,
+        args.output,
+        fmt=args.format,
+        workers=args.workers,
+        timeout_s=args.timeout,
+        resume=not args.no_resume,
+        use_cache=not args.no_cache,
+        include_text=args.include_text,
+        progress=None if args.quiet else _print_progress,
+    )
+    print(
+        f"Fet en {time.monotonic() - t0:.1f} s: {counts['ok']} correctes, {counts['error']} errors, "
+        f"{counts['timeout']} temps límit, {counts['skipped']} ja processades.",
+        file=sys.stderr,
+    )
+    return 0 if counts["error"] == 0 and counts["timeout"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
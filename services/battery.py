@@ -0,0 +1,222 @@
+"""
+Simulació de bateria domèstica sobre els perfils horaris de consum i
+producció solar (`services.self_consumption`).
+
+Estratègia d'autoconsum: la bateria es carrega amb l'excedent solar i es
+descarrega quan el consum supera la producció, amb límit de potència,
+eficiència de càrrega/descàrrega (arrel de la d'anada i tornada) i una
+càrrega mínima per protegir-la.
+
+L'estat de càrrega segueix s_t = mín(màx, màx(mín, s_{t-1} + x_t)), on x_t
+és el flux desitjat de l'hora, que no depèn de l'estat. Cada pas és una
+funció "desplaçar i retallar", i la composició de dues també ho és: es
+compon la funció de cada dia per a tots els dies i mides alhora, i només
+cal encadenar 365 funcions diàries en lloc de 8760 hores.
+
+La degradació es modela com a pèrdua lineal de capacitat per any i per
+cicle equivalent; l'estalvi de cada any s'interpola sobre la corba
+d'estalvi per capacitat de l'escombrat. L'estalvi es calcula amb el mateix
+criteri que el dimensionat fotovoltaic (`services.pv_sizing`): compensació
+de l'excedent limitada cada mes al cost de l'energia comprada i pujada
+anual del preu.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+
+from services.investment import anys_retorn
+from services.pv_sizing import PUJADA_PREU
+from services.solar_profile import monthly_totals
+
+EFICIENCIA_ANADA_TORNADA = 0.90
+C_RATE = 0.5  # potència màxima (kW) per kWh de capacitat
+SOC_MINIM = 0.10  # fracció de la capacitat que no es fa servir
+DEGRADACIO_ANUAL = 0.01  # pèrdua de capacitat per any de calendari
+DEGRADACIO_CICLE = 0.00004  # pèrdua de capacitat per cicle equivalent complet
+VIDA_ANYS = 15
+COST_KWH = 550.0  # € per kWh instal·lat
+MIDES_KWH: tuple[float, ...] = tuple(float(k) for k in range(0, 21))
+
+
+@dataclass
+class ResultatBateria:
+    """Fluxos horaris (K mides, hores) en kWh i totals per mida."""
+    capacitat_kwh: np.ndarray  # (K,)
+    soc: np.ndarray  # estat de càrrega al final de cada hora
+    carrega: np.ndarray  # kWh d'excedent solar que entren a la bateria
+    descarrega: np.ndarray  # kWh que la bateria lliura a casa
+    importacio: np.ndarray
+    excedent: np.ndarray
+
+    @property
+    def importacio_kwh(self) -> np.ndarray:
+        return self.importacio.sum(axis=-1)
+
+    @property
+    def excedent_kwh(self) -> np.ndarray:
+        return self.excedent.sum(axis=-1)
+
+    @property
+    def descarrega_kwh(self) -> np.ndarray:
+        return self.descarrega.sum(axis=-1)
+
+    @property
+    def cicles(self) -> np.ndarray:
+        """Cicles equivalents complets a l'any (energia lliurada / capacitat nominal)."""
+        cap = self.capacitat_kwh
+        return np.divide(self.descarrega_kwh, cap, out=np.zeros_like(cap), where=cap > 0)
+
+
+@dataclass
+class CorbaBateria:
+    """Economia de cada mida de bateria de l'escombrat."""
+    capacitat_kwh: np.ndarray
+    estalvi_any1: np.ndarray  # €
+    estalvi_vida: np.ndarray  # € acumulats en la vida útil, amb degradació
+    cost: np.ndarray  # €
+    retorn_anys: np.ndarray  # anys fins a recuperar la inversió (inf si no s'hi arriba)
+    cicles: np.ndarray
+
+
+def _clamp_scan(x: np.ndarray, lo: np.ndarray, hi: np.ndarray, s0: np.ndarray, block: int = 24) -> np.ndarray:
+    """
+    Resol s_t = clip(s_{t-1} + x_t, lo, hi) per a cada fila de `x` (K, T).
+
+    Les hores s'agrupen en blocs (dies): primer es compon la funció de cada
+    bloc per a tots els blocs alhora, després es propaga l'estat d'un bloc
+    al següent i finalment es recorre cada bloc amb l'estat inicial conegut.
+    Cap bucle passa de `block` o del nombre de blocs.
+    """
+    k, n = x.shape
+    nb = -(-n // block)
+    xb = np.zeros((k, nb * block))
+    xb[:, :n] = x  # flux 0 al farciment: no canvia l'estat
+    xb = xb.reshape(k, nb, block)
+
+    # Funció composta de cada bloc: s -> clip(s + a, low, high)
+    a = np.zeros((k, nb))
+    low = np.full((k, nb), -np.inf)
+    high = np.full((k, nb), np.inf)
+    for j in range(block):
+        xj = xb[:, :, j]
+        a += xj
+        low = np.minimum(np.maximum(low + xj, lo), hi)
+        high = np.minimum(np.maximum(high + xj, lo), hi)
+
+    # Estat a l'inici de cada bloc
+    start = np.empty((k, nb))
+    state = s0[:, 0]
+    for b in range(nb):
+        start[:, b] = state
+        state = np.minimum(np.maximum(state + a[:, b], low[:, b]), high[:, b])
+
+    soc = np.empty_like(xb)
+    state = start
+    for j in range(block):
+        state = np.minimum(np.maximum(state + xb[:, :, j], lo), hi)
+        soc[:, :, j] = state
+    return soc.reshape(k, -1)[:, :n]
+
+
+def simular_bateria(
+    consum_kwh,
+    produccio_kwh,
+    capacitats_kwh: Sequence[float] = MIDES_KWH,
+    eficiencia: float = EFICIENCIA_ANADA_TORNADA,
+    c_rate: float = C_RATE,
+    potencia_kw: Optional[float] = None,
+    soc_minim: float = SOC_MINIM,
+) -> ResultatBateria:
+    """
+    Simula l'any hora a hora amb cada capacitat de bateria alhora.
+
+    Args:
+        consum_kwh, produccio_kwh: Perfils horaris alineats (T,)
+        capacitats_kwh: Capacitats nominals a simular (K,)
+        eficiencia: Eficiència d'anada i tornada
+        c_rate: Potència màxima per kWh de capacitat (si no es dona `potencia_kw`)
+        potencia_kw: Potència màxima de càrrega i descàrrega, igual per a totes les mides
+        soc_minim: Fracció de la capacitat que no es descarrega
+    """
+    consum = np.asarray(consum_kwh, dtype=np.float64)
+    produccio = np.asarray(produccio_kwh, dtype=np.float64)
+    cap = np.asarray(capacitats_kwh, dtype=np.float64).reshape(-1, 1)
+    potencia = cap * c_rate if potencia_kw is None else np.full_like(cap, potencia_kw)
+    eta = np.sqrt(eficiencia)
+
+    sobrant = np.maximum(produccio - consum, 0)
+    deficit = np.maximum(consum - produccio, 0)
+    # Flux desitjat cap a la bateria (kWh emmagatzemats), sense límit de capacitat
+    x = eta * np.minimum(sobrant, potencia) - np.minimum(deficit, potencia) / eta
+
+    minim = cap * soc_minim
+    soc = _clamp_scan(x, minim, cap, minim)
+    delta = np.diff(soc, axis=-1, prepend=minim)
+    carrega = np.maximum(delta, 0) / eta
+    descarrega = np.maximum(-delta, 0) * eta
+    return ResultatBateria(
+        capacitat_kwh=cap.ravel(),
+        soc=soc,
+        carrega=carrega,
+        descarrega=descarrega,
+        importacio=deficit - descarrega,
+        excedent=sobrant - carrega,
+    )
+
+
+def corba_amortitzacio(
+    consum_kwh,
+    produccio_kwh,
+    preu_kwh: float,
+    preu_excedent: float,
+    capacitats_kwh: Sequence[float] = MIDES_KWH,
+    cost_kwh: float = COST_KWH,
+    vida_anys: int = VIDA_ANYS,
+    degradacio_anual: float = DEGRADACIO_ANUAL,
+    degradacio_cicle: float = DEGRADACIO_CICLE,
+    pujada_preu: float = PUJADA_PREU,
+    compensacio_limitada: bool = True,
+    **kwargs,
+) -> CorbaBateria:
+    """
+    Estalvi i retorn de cada mida de bateria respecte de no tenir-ne.
+
+    El cost d'energia de cada mes és la importació menys l'excedent
+    compensat (amb `compensacio_limitada`, com a molt fins al cost de la
+    importació del mes); l'estalvi és la diferència amb no tenir bateria.
+    Cada any la capacitat baixa segons la degradació, l'estalvi es llegeix
+    (interpolat) de la corba estalvi-capacitat i els preus pugen `pujada_preu`.
+    Els perfils han d'estar alineats amb l'any de referència
+    (`services.solar_profile.hourly_timestamps`). Els `kwargs` es passen a
+    `simular_bateria`.
+    """
+    mides = np.unique(np.concatenate([[0.0], np.asarray(capacitats_kwh, dtype=np.float64)]))
+    resultat = simular_bateria(consum_kwh, produccio_kwh, mides, **kwargs)
+    importacio = monthly_totals(resultat.importacio) * preu_kwh
+    compensacio = monthly_totals(resultat.excedent) * preu_excedent
+    if compensacio_limitada:
+        compensacio = np.minimum(compensacio, importacio)
+    cost_energia = (importacio - compensacio).sum(axis=-1)
+    estalvi = cost_energia[0] - cost_energia
+
+    anys = np.arange(vida_anys)
+    fade = degradacio_anual + degradacio_cicle * resultat.cicles
+    retinguda = np.clip(1 - np.outer(fade, anys), 0, 1)  # (K, anys)
+    per_any = np.interp(mides[:, None] * retinguda, mides, estalvi) * (1 + pujada_preu) ** anys
+    acumulat = np.cumsum(per_any, axis=1)
+    cost = mides * cost_kwh
+
+    retorn = anys_retorn(per_any, cost)
+
+    keep = np.isin(mides, np.asarray(capacitats_kwh, dtype=np.float64))
+    return CorbaBateria(
+        capacitat_kwh=mides[keep],
+        estalvi_any1=estalvi[keep],
+        estalvi_vida=acumulat[keep, -1],
+        cost=cost[keep],
+        retorn_anys=retorn[keep],
+        cicles=resultat.cicles[keep],
+    )
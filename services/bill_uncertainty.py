@@ -0,0 +1,140 @@
+"""
+Incertesa de la factura anual i de l'estalvi en canviar de tarifa (Monte Carlo).
+
+`estimar_estalvi_canvi_tarifa` dona un sol valor amb un sol preu PVPC. Aquí
+es generen milers d'escenaris d'una vegada:
+- Preu: camins diaris de preu relatiu (preu del dia / mitjana) remostrejats
+  per blocs de 7 dies de l'històric PVPC del magatzem local. Si no n'hi ha
+  prou, model paramètric lognormal del nivell anual.
+- Consum: soroll lognormal multiplicatiu sobre el consum anual.
+
+Les tarifes indexades (PVPC, indexada) segueixen el camí de preus; les fixes
+no. Els costos es calculen amb `simular_factures_lot` (una fila per escenari),
+i el resultat són percentils del cost anual i de l'estalvi.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from services.invoice_simulator import simular_factures_lot
+
+PERCENTILS: tuple[int, ...] = (5, 25, 50, 75, 95)
+N_ESCENARIS = 10_000
+BLOC_DIES = 7
+MIN_DIES_HISTORIC = 90
+HISTORIC_ANYS = 3
+VOLATILITAT_PREU = 0.20  # desviació del logaritme del nivell anual (model paramètric)
+SOROLL_CONSUM = 0.10  # desviació del logaritme del consum anual
+
+
+@dataclass
+class BandesFactura:
+    """Percentils ({p: €}) del cost anual amb cada tarifa i de l'estalvi."""
+    cost_actual: dict[int, float]
+    cost_nova: dict[int, float]
+    estalvi: dict[int, float]
+    prob_estalvi: float  # fracció d'escenaris en què la tarifa nova surt més barata
+    escenaris: int
+    font_preus: str  # "historic" o "parametric"
+
+
+@lru_cache(maxsize=8)
+def _historic_relatiu(geo_id: int, dia: date) -> Optional[np.ndarray]:
+    """Preu mitjà diari / mitjana del període, dels darrers anys del magatzem (o None)."""
+    try:
+        from services.price_store import get_price_store
+
+        start = datetime(dia.year - HISTORIC_ANYS, dia.month, 1, tzinfo=timezone.utc)
+        end = datetime(dia.year, dia.month, dia.day, tzinfo=timezone.utc) + timedelta(days=1)
+        series = get_price_store().resample(1001, geo_id, "day", start, end)
+    except (ImportError, OSError):
+        return None
+    values = series.values[np.isfinite(series.values) & (series.values > 0)]
+    if len(values) < MIN_DIES_HISTORIC:
+        return None
+    relatiu = values / values.mean()
+    relatiu.setflags(write=False)
+    return relatiu
+
+
+def mostrejar_nivell_preu(
+    n: int,
+    rng: np.random.Generator,
+    historic: Optional[np.ndarray] = None,
+    volatilitat: float = VOLATILITAT_PREU,
+    dies: int = 365,
+) -> np.ndarray:
+    """
+    Nivell de preu mitjà relatiu (mitjana 1) de `n` escenaris d'un any.
+
+    Amb `historic` (preus diaris relatius), cada escenari és un camí d'uns
+    `dies` dies (blocs sencers de 7) fet de blocs consecutius de l'històric
+    triats a l'atzar, que conserva la correlació entre dies propers; si no,
+    lognormal amb `volatilitat`.
+    """
+    if historic is None or len(historic) < BLOC_DIES:
+        sigma = volatilitat
+        return rng.lognormal(-sigma * sigma / 2, sigma, n)
+    # Tots els blocs tenen la mateixa llargada: la mitjana del camí és la
+    # mitjana de les mitjanes dels blocs, precalculades per a cada inici
+    acumulat = np.concatenate([[0.0], np.cumsum(historic)])
+    mitjanes_bloc = (acumulat[BLOC_DIES:] - acumulat[:-BLOC_DIES]) / BLOC_DIES
+    blocs = max(1, round(dies / BLOC_DIES))
+    inicis = rng.integers(0, len(mitjanes_bloc), size=(n, blocs))
+    return mitjanes_bloc[inicis].mean(axis=1)
+
+
+def simular_incertesa_estalvi(
+    consum_anual_kwh: float,
+    potencia_kw: float,
+    preu_actual: float,
+    preu_nova: float,
+    indexada_actual: bool = True,
+    indexada_nova: bool = False,
+    escenaris: int = N_ESCENARIS,
+    soroll_consum: float = SOROLL_CONSUM,
+    historic: Optional[np.ndarray] = None,
+    geo_id: int = 8741,
+    seed: Optional[int] = None,
+) -> BandesFactura:
+    """
+    Monte Carlo de l'estalvi anual en canviar de tarifa.
+
+    Args:
+        consum_anual_kwh: Consum anual esperat
+        potencia_kw: Potència contractada
+        preu_actual, preu_nova: Preu mitjà esperat €/kWh de cada tarifa
+        indexada_actual, indexada_nova: Si el preu de la tarifa segueix el mercat
+        escenaris: Nombre d'escenaris
+        soroll_consum: Desviació del logaritme del consum anual
+        historic: Preus diaris relatius per al remostreig; per defecte, els del
+            magatzem local per a `geo_id`, o el model paramètric si no n'hi ha
+        seed: Llavor del generador (resultats reproduïbles)
+    """
+    rng = np.random.default_rng(seed)
+    if historic is None:
+        historic = _historic_relatiu(geo_id, date.today())
+    font = "parametric" if historic is None or len(historic) < BLOC_DIES else "historic"
+
+    nivell = mostrejar_nivell_preu(escenaris, rng, historic)
+    consum = consum_anual_kwh * rng.lognormal(-soroll_consum * soroll_consum / 2, soroll_consum, escenaris)
+    preus = np.empty((escenaris, 2))
+    preus[:, 0] = preu_actual * nivell if indexada_actual else preu_actual
+    preus[:, 1] = preu_nova * nivell if indexada_nova else preu_nova
+
+    total = simular_factures_lot(consum, potencia_kw, 365, preus).total
+    estalvi = total[:, 0] - total[:, 1]
+    q = np.percentile(np.column_stack([total, estalvi]), PERCENTILS, axis=0)
+    return BandesFactura(
+        cost_actual={p: float(v) for p, v in zip(PERCENTILS, q[:, 0])},
+        cost_nova={p: float(v) for p, v in zip(PERCENTILS, q[:, 1])},
+        estalvi={p: float(v) for p, v in zip(PERCENTILS, q[:, 2])},
+        prob_estalvi=float((estalvi > 0).mean()),
+        escenaris=escenaris,
+        font_preus=font,
+    )
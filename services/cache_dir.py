@@ -0,0 +1,17 @@
+"""
+Directori de dades en disc compartit per les memòries cau de l'app.
+
+Per defecte ~/.cache/elrata; es pot canviar amb ELRATA_CACHE_DIR (útil a
+Streamlit Cloud o per compartir-lo entre processos d'un mateix node).
+"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+
+def get_cache_dir() -> Path:
+    """Retorna (i crea si cal) el directori de memòria cau."""
+    path = Path(os.environ.get("ELRATA_CACHE_DIR") or Path.home() / ".cache" / "elrata")
+    path.mkdir(parents=True, exist_ok=True)
+    return path
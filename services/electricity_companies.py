@@ -8,21 +8,27 @@ Fonts: CNMC, estudis comparatius, dades 2024-2025.
 # Factor sobre el preu PVPC de referència segons tipus de tarifa i companyia.
 # PVPC = 1.0 (preu de referència del mercat regulat)
 # Mercat lliure: pot ser més car (fix) o similar (indexat)
+# per_periode: el preu varia segons el període horari (PVPC i indexades); les
+# tarifes fixes cobren el mateix preu a totes hores
 TARIFA_INFO = {
     "PVPC (tarifa regulada)": {
         "factor": 1.0,
+        "per_periode": True,
         "desc": "Preu hora a hora segons mercat. Sovint la més barata. Sense permanència.",
     },
     "Mercat lliure - Tarifa indexada": {
         "factor": 1.02,
+        "per_periode": True,
         "desc": "Preu variable segons OMIE. Similar al PVPC, pot tenir petits marges.",
     },
     "Mercat lliure - Tarifa fixa (mitjana)": {
         "factor": 1.15,
+        "per_periode": False,
         "desc": "Preu fix. Previsibilitat, però sol ser més car que PVPC.",
     },
     "Mercat lliure - Tarifa cara": {
         "factor": 1.35,
+        "per_periode": False,
         "desc": "Ofertes amb marges alts. Revisa la teva factura.",
     },
 }
@@ -0,0 +1,429 @@
+"""
+Client HTTP asíncron per a l'API ESIOS (Red Eléctrica).
+
+- HTTP/1.1 sobre `asyncio` amb connexions keep-alive reutilitzades (no es
+  torna a negociar TLS a cada consulta).
+- Reintents limitats amb espera exponencial i jitter per a errors de xarxa,
+  temps d'espera i respostes 429/5xx.
+- Interruptor de circuit: després de diverses consultes fallides seguides
+  l'API es dona per caiguda i les crides fallen a l'instant (el cridador fa
+  servir el preu de referència) fins que passa `reset_after_s`.
+
+`EsiosClient` és la façana síncrona per a Streamlit: executa el client en un
+bucle d'esdeveniments propi en un fil de fons. La URL base es pot canviar
+(per exemple, per provar-lo contra un servidor HTTP local).
+
+Configuració: ELRATA_ESIOS_URL, ELRATA_ESIOS_TIMEOUT_S (per intent, 5),
+ELRATA_ESIOS_RETRIES (2), ELRATA_ESIOS_DEADLINE_S (total per consulta, 10).
+Token: ESIOS_API_KEY o ESIOS_TOKEN.
+"""
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import os
+import random
+import ssl
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Optional
+from urllib.parse import urlencode, urlsplit
+
+DEFAULT_BASE_URL = "https://api.esios.ree.es"
+DEFAULT_TIMEOUT_S = 5.0
+DEFAULT_RETRIES = 2
+DEFAULT_DEADLINE_S = 10.0
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+MAX_BODY_BYTES = 32 * 1024 * 1024
+KEEPALIVE_IDLE_S = 30.0
+
+
+class EsiosError(Exception):
+    """La consulta a ESIOS no ha donat una resposta vàlida."""
+
+
+class CircuitOpenError(EsiosError):
+    """L'interruptor és obert: no s'intenta la consulta."""
+
+
+class NoValuesError(EsiosError):
+    """L'API ha respost però no hi ha valors per al rang demanat."""
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class CircuitBreaker:
+    """
+    Interruptor de circuit tancat / obert / mig obert.
+
+    S'obre després de `failure_threshold` errors seguits. Passat
+    `reset_after_s` deixa passar una sola consulta de prova: si va bé es
+    tanca, si falla es torna a obrir.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_after_s: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_after_s = reset_after_s
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """Cert si ara mateix una consulta fallaria sense intentar-ho."""
+        with self._lock:
+            if self._state == self.OPEN:
+                return time.monotonic() - self._opened_at < self.reset_after_s
+            return self._state == self.HALF_OPEN  # la prova ja és en curs
+
+    def allow(self) -> bool:
+        """Decideix si es pot fer una consulta (i, si cal, passa a mig obert)."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_after_s:
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+@dataclass
+class _Response:
+    status: int
+    headers: dict[str, str]
+    body: bytes
+    keep_alive: bool
+
+
+async def _read_chunked(reader: asyncio.StreamReader) -> bytes:
+    parts = []
+    total = 0
+    while True:
+        size_line = await reader.readline()
+        if not size_line:
+            raise asyncio.IncompleteReadError(b"", None)
+        size = int(size_line.split(b";", 1)[0].strip(), 16)
+        if size == 0:
+            break
+        total += size
+        if total > MAX_BODY_BYTES:
+            raise ValueError("resposta massa gran")
+        parts.append(await reader.readexactly(size))
+        await reader.readexactly(2)  # \r\n
+    # Capçaleres finals (trailers) fins a la línia buida
+    while (await reader.readline()).strip():
+        pass
+    return b"".join(parts)
+
+
+async def _read_response(reader: asyncio.StreamReader) -> _Response:
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("connexió tancada pel servidor")
+    version, status, *_ = status_line.decode("latin-1").split(" ", 2)
+    headers: dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        body = await _read_chunked(reader)
+    elif "content-length" in headers:
+        length = int(headers["content-length"])
+        if length > MAX_BODY_BYTES:
+            raise ValueError("resposta massa gran")
+        body = await reader.readexactly(length)
+    else:
+        # Sense longitud: el cos acaba quan el servidor tanca la connexió
+        parts = []
+        total = 0
+        while True:
+            chunk = await reader.read(65536)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > MAX_BODY_BYTES:
+                raise ValueError("resposta massa gran")
+            parts.append(chunk)
+        body = b"".join(parts)
+        keep_alive = False
+    if headers.get("content-encoding", "").lower() == "gzip":
+        body = gzip.decompress(body)
+    return _Response(int(status), headers, body, keep_alive)
+
+
+class _ConnectionPool:
+    """Connexions keep-alive inactives cap a un mateix host (només des del bucle)."""
+
+    def __init__(self, host: str, port: int, ssl_context: Optional[ssl.SSLContext], max_idle: int):
+        self.host = host
+        self.port = port
+        self.ssl_context = ssl_context
+        self.max_idle = max_idle
+        self._idle: list[tuple[asyncio.StreamReader, asyncio.StreamWriter, float]] = []
+        self.opened = 0  # connexions noves obertes (mètrica)
+
+    async def acquire(self) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, bool]:
+        """Retorna (reader, writer, reutilitzada)."""
+        now = time.monotonic()
+        while self._idle:
+            reader, writer, last_used = self._idle.pop()
+            if now - last_used < KEEPALIVE_IDLE_S and not reader.at_eof() and not writer.is_closing():
+                return reader, writer, True
+            writer.close()
+        reader, writer = await asyncio.open_connection(
+            self.host,
+            self.port,
+            ssl=self.ssl_context,
+            server_hostname=self.host if self.ssl_context else None,
+        )
+        self.opened += 1
+        return reader, writer, False
+
+    def release(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, reusable: bool) -> None:
+        if reusable and len(self._idle) < self.max_idle and not writer.is_closing():
+            self._idle.append((reader, writer, time.monotonic()))
+        else:
+            writer.close()
+
+    def close(self) -> None:
+        for _, writer, _ in self._idle:
+            writer.close()
+        self._idle.clear()
+
+
+class AsyncEsiosClient:
+    """Client asíncron de l'API ESIOS. S'ha de fer servir sempre des del mateix bucle."""
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        timeout_s: Optional[float] = None,
+        retries: Optional[int] = None,
+        deadline_s: Optional[float] = None,
+        backoff_s: float = 0.25,
+        max_backoff_s: float = 4.0,
+        pool_size: int = 4,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        url = urlsplit(base_url or os.environ.get("ELRATA_ESIOS_URL") or DEFAULT_BASE_URL)
+        self.host = url.hostname or "localhost"
+        secure = url.scheme == "https"
+        self.port = url.port or (443 if secure else 80)
+        default_port = self.port == (443 if secure else 80)
+        self.host_header = self.host if default_port else f"{self.host}:{self.port}"
+        self.base_path = url.path.rstrip("/")
+        self.timeout_s = timeout_s if timeout_s is not None else _env_float(
+            "ELRATA_ESIOS_TIMEOUT_S", DEFAULT_TIMEOUT_S
+        )
+        self.retries = retries if retries is not None else int(
+            _env_float("ELRATA_ESIOS_RETRIES", DEFAULT_RETRIES)
+        )
+        self.deadline_s = deadline_s if deadline_s is not None else _env_float(
+            "ELRATA_ESIOS_DEADLINE_S", DEFAULT_DEADLINE_S
+        )
+        self.backoff_s = backoff_s
+        self.max_backoff_s = max_backoff_s
+        self.breaker = breaker or CircuitBreaker()
+        self._pool = _ConnectionPool(
+            self.host, self.port, ssl.create_default_context() if secure else None, pool_size
+        )
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._pool_size = pool_size
+
+    @property
+    def connections_opened(self) -> int:
+        return self._pool.opened
+
+    def _backoff(self, attempt: int) -> float:
+        """Espera abans del reintent `attempt` (1, 2, ...): exponencial amb jitter complet."""
+        return random.uniform(0, min(self.max_backoff_s, self.backoff_s * 2 ** (attempt - 1)))
+
+    def _build_request(self, target: str) -> bytes:
+        lines = [
+            f"GET {target} HTTP/1.1",
+            f"Host: {self.host_header}",
+            "Accept: application/json; application/vnd.esios-api-v1+json",
+            "Accept-Encoding: gzip",
+            "Connection: keep-alive",
+        ]
+        token = os.environ.get("ESIOS_API_KEY") or os.environ.get("ESIOS_TOKEN")
+        if token:
+            lines.append(f"x-api-key: {token}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _request(self, target: str) -> _Response:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._pool_size)
+        request = self._build_request(target)
+        async with self._slots:
+            while True:
+                reader, writer, reused = await self._pool.acquire()
+                try:
+                    writer.write(request)
+                    await writer.drain()
+                    response = await _read_response(reader)
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    writer.close()
+                    if reused:
+                        continue  # el servidor havia tancat la connexió inactiva: una de nova
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                self._pool.release(reader, writer, response.keep_alive)
+                return response
+
+    async def get_json(self, path: str, params: Optional[dict[str, str]] = None) -> Any:
+        """
+        GET `path` i JSON de la resposta. Llança `CircuitOpenError` a l'instant
+        si l'API es dona per caiguda, o `EsiosError` si s'esgoten els reintents.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError("API ESIOS no disponible (interruptor obert)")
+        target = self.base_path + path + (f"?{urlencode(params)}" if params else "")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline_s
+        last_error: Optional[BaseException] = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                delay = self._backoff(attempt)
+                if loop.time() + delay >= deadline:
+                    break
+                await asyncio.sleep(delay)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                response = await asyncio.wait_for(
+                    self._request(target), min(self.timeout_s, remaining)
+                )
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+                last_error = e
+                continue
+            if response.status in RETRY_STATUSES:
+                last_error = EsiosError(f"HTTP {response.status}")
+                continue
+            if response.status >= 400:
+                # L'API respon: és un error de la petició, no cal obrir el circuit
+                self.breaker.record_success()
+                raise EsiosError(f"HTTP {response.status}")
+            try:
+                data = json.loads(response.body)
+            except ValueError as e:
+                last_error = e
+                continue
+            self.breaker.record_success()
+            return data
+        self.breaker.record_failure()
+        raise EsiosError(f"consulta fallida: {last_error!r}") from last_error
+
+    async def get_indicator(self, indicator_id: int, start: datetime, end: datetime) -> list[dict]:
+        """Valors (`values`) d'un indicador ESIOS entre `start` i `end`."""
+        data = await self.get_json(
+            f"/indicators/{indicator_id}",
+            {
+                "start_date": start.strftime("%Y-%m-%dT%H:%M"),
+                "end_date": end.strftime("%Y-%m-%dT%H:%M"),
+            },
+        )
+        if not isinstance(data, dict):
+            raise EsiosError("resposta inesperada")
+        indicator = data.get("indicator") or data
+        values = indicator.get("values")
+        if not values or not isinstance(values, list):
+            raise NoValuesError("resposta sense valors")
+        return values
+
+    def close(self) -> None:
+        self._pool.close()
+
+
+class EsiosClient:
+    """
+    Façana síncrona de `AsyncEsiosClient`: les consultes s'executen al bucle
+    d'un fil de fons propi, de manera que les connexions keep-alive es
+    reutilitzen entre crides des de qualsevol fil.
+    """
+
+    def __init__(self, **kwargs: Any):
+        self._client = AsyncEsiosClient(**kwargs)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="esios-client", daemon=True)
+        self._thread.start()
+
+    @property
+    def breaker(self) -> CircuitBreaker:
+        return self._client.breaker
+
+    @property
+    def available(self) -> bool:
+        """Fals mentre l'interruptor és obert (les consultes fallarien a l'instant)."""
+        return not self._client.breaker.is_open
+
+    @property
+    def connections_opened(self) -> int:
+        return self._client.connections_opened
+
+    def get_json(self, path: str, params: Optional[dict[str, str]] = None) -> Any:
+        return asyncio.run_coroutine_threadsafe(
+            self._client.get_json(path, params), self._loop
+        ).result()
+
+    def get_indicator(self, indicator_id: int, start: datetime, end: datetime) -> list[dict]:
+        return asyncio.run_coroutine_threadsafe(
+            self._client.get_indicator(indicator_id, start, end), self._loop
+        ).result()
+
+    def close(self) -> None:
+        self._loop.call_soon_threadsafe(self._client.close)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+
+
+_CLIENT: Optional[EsiosClient] = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_esios_client() -> EsiosClient:
+    """Client compartit del procés (configurat amb les variables d'entorn)."""
+    global _CLIENT
+    if _CLIENT is None:
+        with _CLIENT_LOCK:
+            if _CLIENT is None:
+                _CLIENT = EsiosClient()
+    return _CLIENT
@@ -0,0 +1,256 @@
+"""
+Memòria cau en disc dels resultats d'anàlisi de factures.
+
+Les entrades es guarden per SHA-256 del PDF pujat en una base SQLite: el text
+(OCR o capa de text, comprimit) i les `InvoiceData` en JSON. Quan es torna a
+pujar la mateixa factura (un rerun, o tornar d'un simulador) la resposta és
+immediata.
+
+Cada entrada guarda dues versions. Si canvien els patrons del parser, no
+cal tornar a fer OCR: només es torna a parsejar el text guardat. Si canvia
+l'extracció de text (el codi de la capa de text, renderitzat o OCR, o les
+opcions de la crida: dpi, capa de text, anàlisi adaptativa, parada
+anticipada), el text guardat ja no val i l'entrada es descarta. Amb parada
+anticipada el text només arriba fins on el parser anterior en tenia prou,
+i per això un canvi de parser també descarta aquestes entrades.
+La mida total està limitada i s'esborren les entrades menys usades (LRU).
+
+Configuració: ELRATA_INVOICE_CACHE_MB (per defecte 64).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Iterator, Optional
+
+from services.cache_dir import get_cache_dir
+from services.invoice_parser import InvoiceData, parse_invoice_text
+
+DEFAULT_MAX_MB = 64
+_DB_NAME = "invoices.sqlite3"
+
+
+def pdf_sha256(pdf_bytes: bytes) -> str:
+    """Clau de la memòria cau: SHA-256 hexadecimal del contingut del PDF."""
+    return hashlib.sha256(pdf_bytes).hexdigest()
+
+
+def _source_hash(*modules) -> str:
+    digest = hashlib.sha256()
+    for module in modules:
+        digest.update(Path(module.__file__).read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def parser_version() -> str:
+    """
+    Versió del parser: hash del codi font de `services/invoice_parser.py`.
+    Qualsevol canvi de patrons invalida els resultats parsejats.
+    """
+    import services.invoice_parser as parser_module
+
+    return _source_hash(parser_module)
+
+
+def extraction_version() -> str:
+    """
+    Versió de l'extracció de text: hash de `services/pdf_ocr.py` i
+    `services/ocr.py`. Qualsevol canvi invalida el text guardat.
+    """
+    import services.ocr as ocr_module
+    import services.pdf_ocr as pdf_ocr_module
+
+    return _source_hash(pdf_ocr_module, ocr_module)
+
+
+def extraction_options(
+    dpi: Optional[int] = None,
+    text_layer: bool = True,
+    adaptive: bool = True,
+    stop_early: bool = True,
+) -> str:
+    """
+    Opcions de `iter_page_texts` i `parse_invoice_pages` que canvien el text
+    obtingut (per defecte, les de les dues funcions), com a etiqueta.
+    """
+    if dpi is None:
+        from services.pdf_ocr import DEFAULT_DPI
+
+        dpi = DEFAULT_DPI
+    return f"dpi={dpi},text={int(text_layer)},adaptive={int(adaptive)},stop={int(stop_early)}"
+
+
+def _is_prefix(options: str) -> bool:
+    """Cert si el text guardat amb aquestes opcions pot ser només un prefix del document."""
+    return "stop=1" in options.split(",")
+
+
+@dataclass
+class CachedInvoice:
+    """Entrada recuperada de la memòria cau."""
+    text: str
+    data: InvoiceData
+    sources: dict[int, str] = field(default_factory=dict)  # índex pàgina -> camí
+
+
+def _env_max_bytes() -> int:
+    try:
+        return int(float(os.environ.get("ELRATA_INVOICE_CACHE_MB", DEFAULT_MAX_MB)) * 1024 * 1024)
+    except ValueError:
+        return DEFAULT_MAX_MB * 1024 * 1024
+
+
+class InvoiceCache:
+    """Memòria cau SQLite de factures, limitada per mida amb expulsió LRU."""
+
+    def __init__(self, path: Optional[Path] = None, max_bytes: Optional[int] = None):
+        self.path = Path(path) if path else get_cache_dir() / _DB_NAME
+        self.max_bytes = max_bytes if max_bytes is not None else _env_max_bytes()
+        self.version = parser_version()
+        self.extraction = extraction_version()
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS invoices ("
+                " sha256 TEXT PRIMARY KEY,"
+                " parser_version TEXT NOT NULL,"
+                " text BLOB NOT NULL,"
+                " data TEXT NOT NULL,"
+                " sources TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON invoices(last_access)")
+
+    def _stored_version(self, options: str) -> str:
+        """Valor de la columna `parser_version`: "<extracció>;<opcions>/<parser>"."""
+        return f"{self.extraction};{options}/{self.version}"
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:  # commit o rollback
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, sha256: str, options: Optional[str] = None) -> Optional[CachedInvoice]:
+        """
+        Retorna l'entrada o None (també si ha canviat l'extracció de text o
+        si es va desar amb unes altres `options`, vegeu `extraction_options`).
+        Torna a parsejar si el parser ha canviat.
+        """
+        try:
+            return self._get(sha256, options or extraction_options())
+        except (sqlite3.Error, zlib.error, ValueError, TypeError):
+            return None  # entrada il·legible o base bloquejada: com si no hi fos
+
+    def _get(self, sha256: str, options: str) -> Optional[CachedInvoice]:
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT parser_version, text, data, sources FROM invoices WHERE sha256 = ?",
+                (sha256,),
+            ).fetchone()
+            if row is None:
+                return None
+            stored, text_blob, data_json, sources_json = row
+            extraction, _, version = stored.rpartition("/")
+            if extraction != f"{self.extraction};{options}" or (version != self.version and _is_prefix(options)):
+                conn.execute("DELETE FROM invoices WHERE sha256 = ?", (sha256,))
+                return None  # text d'una altra extracció (o un prefix massa curt): cal tornar-la a fer
+            text = zlib.decompress(text_blob).decode("utf-8")
+            if version == self.version:
+                fields = json.loads(data_json)
+                data = InvoiceData(raw_text=text, **fields)
+                conn.execute(
+                    "UPDATE invoices SET last_access = ? WHERE sha256 = ?",
+                    (time.time(), sha256),
+                )
+            else:
+                data = parse_invoice_text(text)
+                conn.execute(
+                    "UPDATE invoices SET parser_version = ?, data = ?, last_access = ? WHERE sha256 = ?",
+                    (self._stored_version(options), _data_to_json(data), time.time(), sha256),
+                )
+        sources = {int(k): v for k, v in json.loads(sources_json).items()}
+        return CachedInvoice(text=text, data=data, sources=sources)
+
+    def put(
+        self,
+        sha256: str,
+        text: str,
+        data: InvoiceData,
+        sources: Optional[dict[int, str]] = None,
+        options: Optional[str] = None,
+    ) -> None:
+        """
+        Desa (o substitueix) una entrada i aplica el límit de mida; `options`
+        són les de l'extracció (`extraction_options`, per defecte les habituals).
+        Els errors de disc s'ignoren: la memòria cau és opcional.
+        """
+        stored_version = self._stored_version(options or extraction_options())
+        text_blob = zlib.compress(text.encode("utf-8"), 6)
+        data_json = _data_to_json(data)
+        sources_json = json.dumps({str(k): v for k, v in (sources or {}).items()})
+        size = len(text_blob) + len(data_json) + len(sources_json)
+        try:
+            with self._lock, self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO invoices VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (sha256, stored_version, text_blob, data_json, sources_json, size, time.time()),
+                )
+                self._evict(conn)
+        except sqlite3.Error:
+            pass
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM invoices").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        to_delete = []
+        for sha, size in conn.execute("SELECT sha256, size FROM invoices ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            to_delete.append((sha,))
+            total -= size
+        conn.executemany("DELETE FROM invoices WHERE sha256 = ?", to_delete)
+
+    def clear(self) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM invoices")
+
+
+def _data_to_json(data: InvoiceData) -> str:
+    fields = asdict(data)
+    fields.pop("raw_text", None)  # el text ja es guarda comprimit a part
+    return json.dumps(fields, separators=(",", ":"))
+
+
+_INVOICE_CACHE: Optional[InvoiceCache] = None
+_INVOICE_CACHE_LOCK = threading.Lock()
+
+
+def get_invoice_cache() -> Optional[InvoiceCache]:
+    """
+    Retorna la memòria cau compartida del procés, o None si el disc no és
+    utilitzable (l'anàlisi funciona igual, sense memòria cau).
+    """
+    global _INVOICE_CACHE
+    if _INVOICE_CACHE is None:
+        with _INVOICE_CACHE_LOCK:
+            if _INVOICE_CACHE is None:
+                try:
+                    _INVOICE_CACHE = InvoiceCache()
+                except (OSError, sqlite3.Error):
+                    return None
+    return _INVOICE_CACHE
@@ -4,7 +4,7 @@ Suporta múltiples formats i companyies (Endesa, Iberdrola, Naturgy, etc.)
 """
 import re
 from dataclasses import dataclass
-from typing import Optional
+from typing import Any, Iterable, Optional, Union
 
 
 @dataclass
@@ -18,80 +18,160 @@ class InvoiceData:
     raw_text: str = ""
 
 
+# Els patrons es compilen un sol cop en importar el mòdul. Cada patró porta
+# els literals que necessàriament apareixen en qualsevol coincidència: si un
+# literal no és al text, el patró ni s'executa. Els patrons que comencen per
+# un número són els cars (el motor prova a cada xifra), i sovint es descarten
+# així sense recórrer el text.
+_Pattern = tuple[re.Pattern, tuple[str, ...]]
+
+
+def _compile(patterns: list[tuple[str, tuple[str, ...]]]) -> tuple[_Pattern, ...]:
+    return tuple((re.compile(p, re.IGNORECASE), literals) for p, literals in patterns)
+
+
+# --- CONSUM (kWh) ---
+# Patrons comuns: "150 kWh", "150kWh", "Consumo: 150 kWh", "Energía activa: 150"
+_CONSUM_PATTERNS = _compile([
+    (r"consumo\s*(?:activo|activa)?\s*[:\s]*(\d+(?:[.,]\d+)?)\s*k?wh", ("consumo", "wh")),
+    (r"energ[ií]a\s*activa\s*[:\s]*(\d+(?:[.,]\d+)?)\s*k?wh", ("energ", "activa", "wh")),
+    (r"(\d+(?:[.,]\d+)?)\s*kwh", ("kwh",)),
+    (r"(\d+(?:[.,]\d+)?)\s*k\s*wh", ("wh",)),
+    (r"consum\s*[:\s]*(\d+(?:[.,]\d+)?)", ("consum",)),
+])
+
+# --- POTÈNCIA (kW) ---
+_POTENCIA_PATTERNS = _compile([
+    (r"potencia\s*contractada\s*[:\s]*(\d+(?:[.,]\d+)?)\s*kw", ("potencia", "contractada", "kw")),
+    (r"potencia\s*[:\s]*(\d+(?:[.,]\d+)?)\s*kw", ("potencia", "kw")),
+    (r"(\d+(?:[.,]\d+)?)\s*kw\s*(?:contractada|contratada)?", ("kw",)),
+    (r"(\d[,.]?\d)\s*kw", ("kw",)),
+])
+
+# --- IMPORT TOTAL (€) ---
+# Aquí es vol l'última coincidència de cada patró. Cada patró té una àncora
+# que no pot tornar a aparèixer dins d'una coincidència: o la comença
+# ("total", "importe") o n'és l'únic "€". Així es pot buscar l'última
+# coincidència des del final del text en lloc de recórrer-lo sencer.
+_ANCHOR_START = "start"  # la coincidència comença a l'àncora
+_ANCHOR_EURO = "euro"  # la coincidència conté exactament un "€"
+
+_IMPORT_PATTERNS = tuple(
+    (rx, literals, anchor, kind)
+    for (rx, literals), (anchor, kind) in zip(
+        _compile([
+            (r"total\s*(?:a\s*pagar|factura)?\s*[:\s]*(\d+(?:[.,]\d+)?)\s*€?", ("total",)),
+            (r"importe\s*total\s*[:\s]*(\d+(?:[.,]\d+)?)", ("importe", "total")),
+            (r"(\d+(?:[.,]\d+)?)\s*€\s*(?:total|final)?", ("€",)),
+            (r"total\s*[:\s]*(\d+(?:[.,]\d+)?)\s*eur", ("total", "eur")),
+            (r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*€", ("€",)),
+        ]),
+        [
+            ("total", _ANCHOR_START),
+            ("importe", _ANCHOR_START),
+            ("€", _ANCHOR_EURO),
+            ("total", _ANCHOR_START),
+            ("€", _ANCHOR_EURO),
+        ],
+    )
+)
+
+# --- PERÍODE (dates) ---
+_DATE_PATTERNS = _compile([
+    (r"(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})\s*[-a]\s*(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})", ()),
+    (r"desde\s*(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})\s*hasta\s*(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})", ("desde", "hasta")),
+    (r"periodo\s*[:\s]*(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})\s*[-a]\s*(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})", ("periodo",)),
+])
+
+
+def _candidates(patterns: tuple[_Pattern, ...], literal_text: str):
+    for rx, literals in patterns:
+        if all(lit in literal_text for lit in literals):
+            yield rx
+
+
+def _last_group(
+    rx: re.Pattern, text: str, literal_text: str, anchor: str, kind: str
+) -> Optional[str]:
+    """Grup 1 de l'última coincidència de `rx` (com `rx.findall(text)[-1]`)."""
+    end = len(literal_text)
+    if kind == _ANCHOR_START:
+        # Provem cada aparició de l'àncora, de dreta a esquerra
+        while True:
+            pos = literal_text.rfind(anchor, 0, end)
+            if pos < 0:
+                return None
+            m = rx.match(text, pos)
+            if m:
+                return m.group(1)
+            end = pos
+    # Entre dos "€" hi cap com a molt una coincidència; la busquem entre
+    # l'anterior i l'actual, començant per l'últim
+    euro = literal_text.rfind(anchor)
+    while euro >= 0:
+        prev = literal_text.rfind(anchor, 0, euro)
+        m = rx.search(text, prev + 1, euro + 1)
+        if m:
+            return m.group(1)
+        euro = prev
+    return None
+
+
 def parse_invoice_text(text: str) -> InvoiceData:
     """
     Extreu consum, potència, import i dates del text OCR d'una factura.
+
+    Per a cada camp es proven els patrons per ordre de prioritat; el primer
+    amb un valor dins de rang guanya.
     """
     result = InvoiceData(raw_text=text)
     text_lower = text.lower()
-    text_clean = text.replace(",", ".").replace(" ", "")
-
-    # --- CONSUM (kWh) ---
-    # Patrons comuns: "150 kWh", "150kWh", "Consumo: 150 kWh", "Energía activa: 150"
-    consum_patterns = [
-        r"consumo\s*(?:activo|activa)?\s*[:\s]*(\d+(?:[.,]\d+)?)\s*k?wh",
-        r"energ[ií]a\s*activa\s*[:\s]*(\d+(?:[.,]\d+)?)\s*k?wh",
-        r"(\d+(?:[.,]\d+)?)\s*kwh",
-        r"(\d+(?:[.,]\d+)?)\s*k\s*wh",
-        r"consum\s*[:\s]*(\d+(?:[.,]\d+)?)",
-    ]
-    for pattern in consum_patterns:
-        matches = re.findall(pattern, text_lower, re.IGNORECASE)
-        if matches:
+    # Amb IGNORECASE, "ı" i "ſ" coincideixen amb "i" i "s" però lower() no els
+    # converteix; els normalitzem (caràcter a caràcter, mateixes posicions) per
+    # buscar literals.
+    literal_text = text_lower
+    if "ı" in text_lower or "ſ" in text_lower:
+        literal_text = text_lower.replace("ı", "i").replace("ſ", "s")
+
+    # Consum i potència: primera coincidència del patró (search s'atura aquí)
+    for rx in _candidates(_CONSUM_PATTERNS, literal_text):
+        m = rx.search(text_lower)
+        if m:
             try:
-                val = float(matches[0].replace(",", "."))
+                val = float(m.group(1).replace(",", "."))
                 if 1 < val < 100000:  # rang raonable kWh
                     result.consum_kwh = val
                     break
             except ValueError:
                 pass
 
-    # --- POTÈNCIA (kW) ---
-    potencia_patterns = [
-        r"potencia\s*contractada\s*[:\s]*(\d+(?:[.,]\d+)?)\s*kw",
-        r"potencia\s*[:\s]*(\d+(?:[.,]\d+)?)\s*kw",
-        r"(\d+(?:[.,]\d+)?)\s*kw\s*(?:contractada|contratada)?",
-        r"(\d[,.]?\d)\s*kw",
-    ]
-    for pattern in potencia_patterns:
-        matches = re.findall(pattern, text_lower, re.IGNORECASE)
-        if matches:
+    for rx in _candidates(_POTENCIA_PATTERNS, literal_text):
+        m = rx.search(text_lower)
+        if m:
             try:
-                val = float(matches[0].replace(",", "."))
+                val = float(m.group(1).replace(",", "."))
                 if 1.0 <= val <= 15.0:
                     result.potencia_kw = val
                     break
             except ValueError:
                 pass
 
-    # --- IMPORT TOTAL (€) ---
-    import_patterns = [
-        r"total\s*(?:a\s*pagar|factura)?\s*[:\s]*(\d+(?:[.,]\d+)?)\s*€?",
-        r"importe\s*total\s*[:\s]*(\d+(?:[.,]\d+)?)",
-        r"(\d+(?:[.,]\d+)?)\s*€\s*(?:total|final)?",
-        r"total\s*[:\s]*(\d+(?:[.,]\d+)?)\s*eur",
-        r"(\d{1,3}(?:[.,]\d{3})*(?:[.,]\d{2})?)\s*€",
-    ]
-    for pattern in import_patterns:
-        matches = re.findall(pattern, text_lower, re.IGNORECASE)
-        if matches:
+    # Import: l'última coincidència (el total sol anar al final)
+    for rx, literals, anchor, kind in _IMPORT_PATTERNS:
+        if not all(lit in literal_text for lit in literals):
+            continue
+        raw = _last_group(rx, text_lower, literal_text, anchor, kind)
+        if raw is not None:
             try:
-                raw = matches[-1].replace(".", "").replace(",", ".")
-                val = float(raw)
+                val = float(raw.replace(".", "").replace(",", "."))
                 if 1 < val < 5000:
                     result.import_total = val
                     break
             except ValueError:
                 pass
 
-    # --- PERÍODE (dates) ---
-    date_patterns = [
-        r"(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})\s*[-a]\s*(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})",
-        r"desde\s*(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})\s*hasta\s*(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})",
-        r"periodo\s*[:\s]*(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})\s*[-a]\s*(\d{1,2}[/\-]\d{1,2}[/\-]\d{2,4})",
-    ]
-    for pattern in date_patterns:
-        match = re.search(pattern, text_lower, re.IGNORECASE)
+    for rx in _candidates(_DATE_PATTERNS, literal_text):
+        match = rx.search(text_lower)
         if match:
             result.periode_inici = match.group(1)
             result.periode_fi = match.group(2)
@@ -99,3 +179,59 @@ def parse_invoice_text(text: str) -> InvoiceData:
 
     return result
 
+
+def is_complete(data: InvoiceData) -> bool:
+    """Cert si ja s'han trobat consum, potència, import i període."""
+    return (
+        data.consum_kwh is not None
+        and data.potencia_kw is not None
+        and data.import_total is not None
+        and data.periode_inici is not None
+    )
+
+
+def parse_invoice_pages(
+    pages: Iterable[Union[str, tuple[int, str], Any]],
+    stop_early: bool = True,
+) -> InvoiceData:
+    """
+    Parseja el text d'una factura que arriba pàgina a pàgina.
+
+    `pages` pot donar cadenes (en ordre), parells (índex, text) o objectes
+    amb `index` i `text` en qualsevol ordre, com els `PageText` de
+    `services.pdf_ocr.iter_page_texts`. El text es
+    recompon en ordre de pàgina. Amb `stop_early`, cada cop que creix el
+    tram de pàgines consecutives des de la 0 es parseja aquest tram, i en
+    quant hi ha totes les dades es deixa de consumir (i es tanca)
+    l'iterador, de manera que les pàgines pendents no s'arriben a processar.
+    El resultat no depèn de l'ordre en què arriben les pàgines.
+    """
+    texts: dict[int, str] = {}
+    prefix: list[str] = []  # text de les pàgines 0..len(prefix)-1
+    result = InvoiceData()
+    complete = False
+    it = iter(pages)
+    try:
+        for n, page in enumerate(it):
+            if isinstance(page, str):
+                index, text = n, page
+            elif isinstance(page, tuple):
+                index, text = page
+            else:
+                index, text = page.index, page.text
+            texts[index] = text
+            if not stop_early or len(prefix) not in texts:
+                continue
+            while len(prefix) in texts:
+                prefix.append(texts[len(prefix)])
+            result = parse_invoice_text("".join(prefix))
+            if is_complete(result):
+                complete = True
+                break
+    finally:
+        close = getattr(it, "close", None)
+        if close is not None:
+            close()
+    if not complete and len(texts) > len(prefix):
+        result = parse_invoice_text("".join(texts[i] for i in sorted(texts)))
+    return result
@@ -6,11 +6,18 @@ Permet:
 - Desglossar la factura (energia, potencia, peaje, impostos)
 - Comparar el cost amb diferents tipus de tarifa (PVPC, indexada, fixa, cara)
 - Estimar l'estalvi canviant de tarifa
+- Simular en lot moltes tarifes per a molts clients (`simular_factures_lot`)
+- Simular la factura amb una corba de consum horària o quarthorària
+  (`simular_factura_horaria`)
 """
 from __future__ import annotations
 
 from dataclasses import dataclass
-from typing import Optional
+from typing import Optional, Union
+
+import numpy as np
+
+from services.tariff_periods import PERIOD_NAMES, classify_periods
 
 # Peaje potencia: ~0.04-0.05 €/kW/dia (regulat CNMC, 2.0TD)
 PEAJE_POTENCIA_EUR_KW_DIA = 0.048
@@ -92,12 +99,125 @@ def simular_factura(
     )
 
 
+@dataclass
+class DesglosLot:
+    """
+    Desglossament de N clients × M tarifes en columnes: cada camp és un array
+    (N, M). Fila i, columna j: client i amb la tarifa j.
+    """
+    terme_energia: np.ndarray
+    terme_potencia: np.ndarray
+    alquiler_comptador: np.ndarray
+    base_imposable: np.ndarray
+    impost_electricitat: np.ndarray
+    iva: np.ndarray
+    total: np.ndarray
+    consum_kwh: np.ndarray  # (N, 1)
+    potencia_kw: np.ndarray  # (N, 1)
+    dies: np.ndarray  # (N, 1)
+    preu_kwh_efectiu: np.ndarray
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return self.total.shape
+
+    def ordre(self) -> np.ndarray:
+        """Índexs de tarifa de cada client, de la més barata a la més cara (N, M)."""
+        return np.argsort(self.total, axis=1, kind="stable")
+
+    def millor_tarifa(self) -> np.ndarray:
+        """Índex de la tarifa més barata de cada client (N,)."""
+        return np.argmin(self.total, axis=1)
+
+    def factura(self, i: int, j: int) -> DesglosFactura:
+        """Desglossament del client `i` amb la tarifa `j`."""
+        return DesglosFactura(
+            terme_energia=float(self.terme_energia[i, j]),
+            terme_potencia=float(self.terme_potencia[i, j]),
+            alquiler_comptador=float(self.alquiler_comptador[i, j]),
+            base_imposable=float(self.base_imposable[i, j]),
+            impost_electricitat=float(self.impost_electricitat[i, j]),
+            iva=float(self.iva[i, j]),
+            total=float(self.total[i, j]),
+            consum_kwh=float(self.consum_kwh[i, 0]),
+            potencia_kw=float(self.potencia_kw[i, 0]),
+            dies=int(self.dies[i, 0]),
+            preu_kwh_efectiu=float(self.preu_kwh_efectiu[i, j]),
+        )
+
+
+def simular_factures_lot(
+    consum_kwh,
+    potencia_kw,
+    dies,
+    preus_kwh,
+    preus_potencia_kw_dia=None,
+) -> DesglosLot:
+    """
+    Simula en un sol pas les factures de N clients amb M tarifes.
+
+    Els càlculs segueixen el mateix ordre d'operacions que `simular_factura`,
+    de manera que cada cel·la és idèntica (bit a bit) a la versió escalar.
+
+    Args:
+        consum_kwh, potencia_kw, dies: arrays (N,) o escalars
+        preus_kwh: preus €/kWh de les tarifes, (M,) per a tots els clients o (N, M)
+        preus_potencia_kw_dia: €/kW/dia del terme de potència per tarifa, (M,) o
+            (N, M); per defecte el peatge regulat (PEAJE_POTENCIA_EUR_KW_DIA)
+
+    Returns:
+        DesglosLot amb arrays (N, M)
+    """
+    consum, potencia, n_dies = np.broadcast_arrays(
+        np.atleast_1d(np.asarray(consum_kwh, dtype=np.float64)),
+        np.atleast_1d(np.asarray(potencia_kw, dtype=np.float64)),
+        np.atleast_1d(np.asarray(dies, dtype=np.float64)),
+    )
+    consum = consum.reshape(-1, 1)
+    potencia = potencia.reshape(-1, 1)
+    n_dies = n_dies.reshape(-1, 1)
+    preus = np.atleast_2d(np.asarray(preus_kwh, dtype=np.float64))
+    preu_potencia = (
+        PEAJE_POTENCIA_EUR_KW_DIA if preus_potencia_kw_dia is None
+        else np.atleast_2d(np.asarray(preus_potencia_kw_dia, dtype=np.float64))
+    )
+
+    terme_energia = consum * preus
+    terme_potencia = np.broadcast_to(potencia * n_dies * preu_potencia, terme_energia.shape)
+    alquiler = np.broadcast_to(n_dies * ALQUILER_COMPTADOR_EUR_DIA, terme_energia.shape)
+
+    base_imposable = terme_energia + terme_potencia + alquiler
+    impost_elec = base_imposable * IMPOST_ELECTRICITAT
+    base_amb_impost = base_imposable + impost_elec
+    iva = base_amb_impost * IVA_DOMESTIC
+    total = base_amb_impost + iva
+
+    preu_efectiu = np.divide(
+        total, consum, out=np.zeros_like(total), where=np.broadcast_to(consum > 0, total.shape)
+    )
+
+    return DesglosLot(
+        terme_energia=terme_energia,
+        terme_potencia=terme_potencia,
+        alquiler_comptador=alquiler,
+        base_imposable=base_imposable,
+        impost_electricitat=impost_elec,
+        iva=iva,
+        total=total,
+        consum_kwh=consum,
+        potencia_kw=potencia,
+        dies=n_dies,
+        preu_kwh_efectiu=preu_efectiu,
+    )
+
+
 def comparar_tarifes(
     consum_kwh: float,
     potencia_kw: float,
     dies: int,
     preu_pvpc: float,
     factors_tarifa: dict[str, float],
+    preus_kwh: Optional[dict[str, float]] = None,
 ) -> list[ComparacioTarifa]:
     """
     Compara el cost de la factura amb diferents tipus de tarifa.
@@ -108,21 +228,26 @@ def comparar_tarifes(
         dies: Dies del període
         preu_pvpc: Preu de referència PVPC €/kWh
         factors_tarifa: Dict {nom_tarifa: factor} (ex: {"PVPC": 1.0, "Fixa": 1.15})
+        preus_kwh: Preu efectiu €/kWh de cada tarifa si el consum es reparteix
+            per períodes; per defecte preu_pvpc × factor
 
     Returns:
         Llista de ComparacioTarifa ordenada per total (menor primer)
     """
+    noms = list(factors_tarifa)
+    if preus_kwh is None:
+        preus = [preu_pvpc * factors_tarifa[nom] for nom in noms]
+    else:
+        preus = [preus_kwh[nom] for nom in noms]
+    lot = simular_factures_lot(consum_kwh, potencia_kw, dies, preus)
     resultats = []
-    for nom, factor in factors_tarifa.items():
-        preu = preu_pvpc * factor
-        desglos = simular_factura(consum_kwh, potencia_kw, dies, preu)
+    for j in lot.ordre()[0]:
         resultats.append(ComparacioTarifa(
-            nom_tarifa=nom,
-            preu_kwh=preu,
-            desglos=desglos,
-            factor_vs_pvpc=factor,
+            nom_tarifa=noms[j],
+            preu_kwh=preus[j],
+            desglos=lot.factura(0, j),
+            factor_vs_pvpc=factors_tarifa[noms[j]],
         ))
-    resultats.sort(key=lambda x: x.desglos.total)
     return resultats
 
 
@@ -145,6 +270,16 @@ def simular_factura_discriminacio(
     consum_llano = consum_kwh * pct_llano
     consum_valle = consum_kwh * pct_valle
     terme_energia = consum_punta * preu_punta + consum_llano * preu_llano + consum_valle * preu_valle
+    return _desglos_des_de_energia(terme_energia, consum_kwh, potencia_kw, dies)
+
+
+def _desglos_des_de_energia(
+    terme_energia: float,
+    consum_kwh: float,
+    potencia_kw: float,
+    dies: int,
+) -> DesglosFactura:
+    """Completa el desglossament (potència, lloguer, impostos) a partir del terme d'energia."""
     terme_potencia = potencia_kw * dies * PEAJE_POTENCIA_EUR_KW_DIA
     alquiler = dies * ALQUILER_COMPTADOR_EUR_DIA
     base_imposable = terme_energia + terme_potencia + alquiler
@@ -168,6 +303,77 @@ def simular_factura_discriminacio(
     )
 
 
+@dataclass
+class DesglosHorari:
+    """Factura simulada amb una corba de consum, amb el detall per període 2.0TD."""
+    desglos: DesglosFactura
+    consum_periode: dict[str, float]  # kWh a punta / llano / valle
+    cost_periode: dict[str, float]  # € de terme d'energia per període
+    intervals: int
+
+    @property
+    def pct_periode(self) -> dict[str, float]:
+        """Fracció del consum a cada període."""
+        total = sum(self.consum_periode.values())
+        return {k: (v / total if total > 0 else 0.0) for k, v in self.consum_periode.items()}
+
+
+def simular_factura_horaria(
+    timestamps,
+    consum_kwh,
+    preus_kwh: Union[float, dict, np.ndarray],
+    potencia_kw: float,
+    dies: Optional[int] = None,
+) -> DesglosHorari:
+    """
+    Simula la factura a partir d'una corba de consum horària o quarthorària.
+
+    Cada interval es classifica en punta, llano o valle (2.0TD, amb caps de
+    setmana i festius nacionals) i el terme d'energia es calcula interval a
+    interval; la resta del desglossament és com a `simular_factura`.
+
+    Args:
+        timestamps: inici de cada interval en hora local (datetime64 o convertible)
+        consum_kwh: kWh de cada interval
+        preus_kwh: €/kWh de cada interval (array alineat, p. ex. PVPC horari),
+            preus per període ({1: ..., 2: ..., 3: ...} o {"punta": ..., ...})
+            o un preu únic
+        potencia_kw: Potència contractada en kW
+        dies: Dies facturats (per defecte, els dies naturals que cobreix la corba)
+    """
+    ts = np.asarray(timestamps, dtype="datetime64[m]")
+    consum = np.asarray(consum_kwh, dtype=np.float64)
+    if ts.shape != consum.shape:
+        raise ValueError("timestamps i consum_kwh han de tenir la mateixa longitud")
+    periodes = classify_periods(ts)
+
+    if isinstance(preus_kwh, dict):
+        per_periode = np.zeros(len(PERIOD_NAMES) + 1)
+        noms = {nom: p for p, nom in PERIOD_NAMES.items()}
+        for clau, preu in preus_kwh.items():
+            per_periode[noms.get(clau, clau)] = preu
+        preus = per_periode[periodes]
+    else:
+        preus = np.asarray(preus_kwh, dtype=np.float64)
+        if preus.ndim and preus.shape != consum.shape:
+            raise ValueError("preus_kwh ha d'estar alineat amb consum_kwh")
+
+    cost = consum * preus
+    consum_p = np.bincount(periodes, weights=consum, minlength=len(PERIOD_NAMES) + 1)
+    cost_p = np.bincount(periodes, weights=cost, minlength=len(PERIOD_NAMES) + 1)
+    if dies is None:
+        dies_corba = ts.astype("datetime64[D]")
+        dies = int((dies_corba.max() - dies_corba.min()).astype(np.int64)) + 1 if ts.size else 0
+
+    desglos = _desglos_des_de_energia(float(cost.sum()), float(consum.sum()), potencia_kw, dies)
+    return DesglosHorari(
+        desglos=desglos,
+        consum_periode={nom: float(consum_p[p]) for p, nom in PERIOD_NAMES.items()},
+        cost_periode={nom: float(cost_p[p]) for p, nom in PERIOD_NAMES.items()},
+        intervals=int(consum.size),
+    )
+
+
 def estimar_estalvi_canvi_tarifa(
     consum_anual_kwh: float,
     potencia_kw: float,
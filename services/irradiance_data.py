@@ -0,0 +1,36 @@
+"""
+Dades d'irradiació per Comunitat Autònoma (any meteorològic típic compacte).
+
+Per a cada comunitat, un punt representatiu (latitud, longitud) i la
+irradiació global horitzontal mitjana diària de cada mes (kWh/m²/dia).
+`services.solar_profile` en genera el perfil horari de 8760 hores.
+
+Fonts: PVGIS (JRC) i atles de radiació solar d'AEMET, valors arrodonits
+de la capital o de la ciutat principal.
+"""
+
+# (latitud, longitud, irradiació global horitzontal gen..des en kWh/m²/dia)
+IRRADIACIO_REGIO: dict[str, tuple[float, float, tuple[float, ...]]] = {
+    "Catalunya": (41.39, 2.17, (2.1, 2.9, 4.1, 5.2, 6.2, 6.8, 6.9, 5.9, 4.6, 3.3, 2.3, 1.8)),
+    "Madrid": (40.42, -3.70, (2.2, 3.2, 4.6, 5.7, 6.8, 7.7, 7.9, 6.9, 5.2, 3.5, 2.4, 1.9)),
+    "Andalusia": (37.39, -5.98, (2.7, 3.6, 5.0, 6.1, 7.2, 7.9, 8.0, 7.1, 5.6, 4.0, 2.9, 2.4)),
+    "Comunitat Valenciana": (39.47, -0.38, (2.6, 3.4, 4.6, 5.6, 6.5, 7.1, 7.2, 6.2, 4.9, 3.7, 2.7, 2.2)),
+    "País Basc": (43.26, -2.93, (1.5, 2.2, 3.3, 4.0, 5.0, 5.5, 5.6, 4.8, 3.9, 2.6, 1.6, 1.3)),
+    "Galícia": (42.88, -8.54, (1.6, 2.4, 3.6, 4.6, 5.5, 6.2, 6.4, 5.6, 4.4, 2.8, 1.8, 1.4)),
+    "Aragó": (41.65, -0.88, (2.0, 3.0, 4.4, 5.5, 6.5, 7.3, 7.5, 6.5, 5.0, 3.3, 2.2, 1.7)),
+    "Castella i Lleó": (41.65, -4.72, (1.9, 3.0, 4.4, 5.5, 6.4, 7.3, 7.7, 6.8, 5.1, 3.3, 2.1, 1.6)),
+    "Castella-La Manxa": (39.86, -4.02, (2.4, 3.3, 4.8, 5.8, 6.9, 7.7, 7.9, 7.0, 5.4, 3.7, 2.6, 2.1)),
+    "Murcia": (37.99, -1.13, (2.8, 3.6, 5.0, 6.0, 7.0, 7.6, 7.7, 6.8, 5.4, 4.0, 2.9, 2.5)),
+    "Extremadura": (38.88, -6.97, (2.3, 3.3, 4.7, 5.9, 7.0, 7.9, 8.1, 7.2, 5.6, 3.7, 2.6, 2.0)),
+    "Astúries": (43.36, -5.85, (1.6, 2.3, 3.3, 4.0, 4.8, 5.2, 5.3, 4.6, 3.8, 2.6, 1.7, 1.4)),
+    "Cantàbria": (43.46, -3.80, (1.5, 2.2, 3.3, 4.1, 5.0, 5.4, 5.5, 4.7, 3.9, 2.6, 1.6, 1.3)),
+    "Navarra": (42.81, -1.64, (1.7, 2.6, 3.9, 4.8, 5.8, 6.6, 6.9, 5.9, 4.6, 2.9, 1.9, 1.5)),
+    "La Rioja": (42.47, -2.45, (1.8, 2.8, 4.1, 5.1, 6.1, 6.9, 7.2, 6.2, 4.8, 3.1, 2.0, 1.6)),
+    "Balears": (39.57, 2.65, (2.5, 3.3, 4.5, 5.6, 6.6, 7.3, 7.4, 6.4, 5.0, 3.7, 2.7, 2.2)),
+    "Canàries": (28.12, -15.43, (3.7, 4.5, 5.5, 6.2, 6.8, 7.0, 7.2, 6.8, 5.9, 4.8, 3.9, 3.4)),
+}
+
+REGIO_PER_DEFECTE = "Catalunya"
+
+# Albedo del terra (reflexió difusa cap als panells)
+ALBEDO = 0.2
@@ -0,0 +1,193 @@
+"""
+Lectura de corbes de consum (CSV de la distribuïdora o genèric).
+
+Formats acceptats:
+- Distribuïdora / Datadis: `CUPS;Fecha;Hora;Consumo_kWh;...` amb la data en
+  dd/mm/aaaa i l'hora com a número 1-24 (hora que acaba: 1 = 00:00-01:00) o
+  com a HH:MM (també el final de l'interval: 01:00..24:00, o 00:15..24:00
+  en corbes quarthoràries). Els dies de canvi d'hora l'hora compta el temps
+  transcorregut: 1-23 al març i 1-25 a l'octubre. Decimals amb coma o punt;
+  separador `;` o `,`.
+- Genèric: una columna amb data i hora ISO (`2025-01-01T00:15`) i una de kWh.
+
+El resultat són arrays NumPy ordenats: inici de cada interval en hora local
+(datetime64[m]) i kWh.
+"""
+from __future__ import annotations
+
+import csv
+import io
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional, Union
+
+import numpy as np
+
+_DATE_COLUMNS = ("fecha", "data", "date", "dia")
+_HOUR_COLUMNS = ("hora", "hour")
+_DATETIME_COLUMNS = ("datetime", "fecha_hora", "data_hora", "timestamp", "instant")
+_KWH_COLUMNS = ("consumo_kwh", "consumo", "consum_kwh", "consum", "ae_kwh", "kwh", "energia_kwh")
+
+
+@dataclass
+class LoadCurve:
+    """Corba de consum: inici de cada interval (hora local) i kWh."""
+    timestamps: np.ndarray  # datetime64[m]
+    kwh: np.ndarray  # float64
+
+    def __len__(self) -> int:
+        return len(self.kwh)
+
+    @property
+    def interval_minutes(self) -> int:
+        """Durada de l'interval més habitual (60 o 15)."""
+        return _interval_minutes(self.timestamps.astype(np.int64))
+
+    @property
+    def total_kwh(self) -> float:
+        return float(self.kwh.sum())
+
+    @property
+    def peak_kw(self) -> float:
+        """Potència mitjana de l'interval més carregat (kW)."""
+        if not len(self.kwh):
+            return 0.0
+        return float(self.kwh.max()) * 60 / self.interval_minutes
+
+
+def _interval_minutes(minutes: np.ndarray) -> int:
+    """Pas més habitual (minuts) entre instants ordenats; 60 si no n'hi ha."""
+    if len(minutes) < 2:
+        return 60
+    steps = np.diff(minutes)
+    values, counts = np.unique(steps[steps > 0], return_counts=True)
+    return int(values[np.argmax(counts)]) if len(values) else 60
+
+
+def _number(text: str) -> float:
+    text = text.strip()
+    if "," in text:
+        text = text.replace(".", "").replace(",", ".")
+    return float(text)
+
+
+def _find(header: list[str], names: tuple[str, ...]) -> Optional[int]:
+    for name in names:
+        if name in header:
+            return header.index(name)
+    return None
+
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+@lru_cache(maxsize=1024)
+def _day_minute(text: str) -> int:
+    """Minuts des de l'epoch de les 00:00 del dia (cada data es repeteix 24 o 96 cops)."""
+    text = text.strip()
+    for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%Y/%m/%d", "%d-%m-%Y"):
+        try:
+            return int((datetime.strptime(text, fmt) - _EPOCH).total_seconds() // 60)
+        except ValueError:
+            pass
+    raise ValueError(f"data no reconeguda: {text!r}")
+
+
+@lru_cache(maxsize=1024)
+def _dst_change(day_minute: int) -> int:
+    """+1 el dia que s'avança l'hora (últim diumenge de març), -1 el que es retarda (octubre), 0 la resta."""
+    day = _EPOCH + timedelta(minutes=day_minute)
+    if day.month not in (3, 10) or day.weekday() != 6 or (day + timedelta(days=7)).month == day.month:
+        return 0
+    return 1 if day.month == 3 else -1
+
+
+def _row_minute(
+    row: list[str], i_dt: Optional[int], i_date: Optional[int], i_hour: Optional[int]
+) -> tuple[int, bool]:
+    """
+    Minuts des de l'epoch (hora local) de la fila, i si marquen el final de
+    l'interval (hora HH:MM, de durada encara desconeguda) en lloc de l'inici.
+    """
+    if i_dt is not None:
+        moment = datetime.fromisoformat(row[i_dt].strip().replace(" ", "T")).replace(tzinfo=None)
+        return int((moment - _EPOCH).total_seconds() // 60), False
+    day = _day_minute(row[i_date])
+    hour = row[i_hour].strip()
+    clock = ":" in hour
+    if clock:
+        hh, mm = hour.split(":")[:2]
+        elapsed = int(hh) * 60 + int(mm)
+    else:
+        elapsed = int(hour) * 60  # hora que acaba: 1 = 00:00-01:00
+    # Temps transcorregut -> hora de rellotge els dies de canvi d'hora
+    change = _dst_change(day)
+    if change > 0 and elapsed > 120:
+        elapsed += 60  # de les 2:00 es passa a les 3:00
+    elif change < 0 and elapsed > 180:
+        elapsed -= 60  # les 2:00-3:00 es repeteixen
+    if clock:
+        return day + elapsed, True
+    return day + elapsed - 60, False
+
+
+def read_load_curve(data: Union[bytes, str]) -> LoadCurve:
+    """
+    Llegeix una corba de consum CSV. Llança ValueError si no es reconeix el
+    format o no hi ha cap fila vàlida.
+    """
+    if isinstance(data, bytes):
+        data = data.decode("utf-8-sig", errors="replace")
+    sample = data[:2048]
+    delimiter = ";" if sample.count(";") >= sample.count(",") else ","
+    reader = csv.reader(io.StringIO(data), delimiter=delimiter)
+    header = [h.strip().lower() for h in next(reader, [])]
+
+    i_kwh = _find(header, _KWH_COLUMNS)
+    i_dt = _find(header, _DATETIME_COLUMNS)
+    i_date = _find(header, _DATE_COLUMNS)
+    i_hour = _find(header, _HOUR_COLUMNS)
+    if i_kwh is None or (i_dt is None and (i_date is None or i_hour is None)):
+        raise ValueError("capçalera no reconeguda: cal una columna de kWh i data/hora")
+    needed = max(i for i in (i_kwh, i_dt, i_date, i_hour) if i is not None)
+
+    minutes: list[int] = []
+    kwh: list[float] = []
+    interval_end = False  # si cal restar la durada de l'interval
+    for row in reader:
+        if len(row) <= needed:
+            continue
+        try:
+            minute, interval_end = _row_minute(row, i_dt, i_date, i_hour)
+            value = _number(row[i_kwh])
+        except ValueError:
+            continue  # files de total, buides o mal formades
+        minutes.append(minute)
+        kwh.append(value)
+
+    if not kwh:
+        raise ValueError("cap fila vàlida a la corba de consum")
+    ts = np.array(minutes, dtype=np.int64)
+    values = np.array(kwh, dtype=np.float64)
+    if interval_end:
+        # Columna d'hora: de final a inici de l'interval
+        ts -= _interval_minutes(np.sort(ts))
+    order = np.argsort(ts, kind="stable")
+    return LoadCurve(ts[order].astype("datetime64[m]"), values[order])
+
+
+def align_prices(timestamps, price_timestamps, price_values) -> np.ndarray:
+    """
+    Preu vigent a l'inici de cada interval de consum: per a cada instant, el
+    valor del darrer instant de preu anterior o igual (p. ex. preus horaris
+    sobre una corba quarthorària). NaN si no hi ha cap preu anterior.
+    """
+    ts = np.asarray(timestamps, dtype="datetime64[m]").astype(np.int64)
+    pts = np.asarray(price_timestamps, dtype="datetime64[m]").astype(np.int64)
+    pvals = np.asarray(price_values, dtype=np.float64)
+    idx = np.searchsorted(pts, ts, side="right") - 1
+    out = np.full(ts.shape, np.nan)
+    valid = idx >= 0
+    out[valid] = pvals[idx[valid]]
+    return out
@@ -0,0 +1,218 @@
+"""
+Servei OCR compartit per tot el procés (EasyOCR).
+
+Crear un `easyocr.Reader` torna a carregar els pesos dels models de detecció
+i reconeixement (uns segons i centenars de MB). Aquí es manté un pool de
+lectors inicialitzats de manera mandrosa i segura entre fils, de manera que
+cada factura només paga el temps d'inferència.
+
+Configuració per variables d'entorn:
+- ELRATA_OCR_POOL_SIZE: nombre màxim de lectors (per defecte 1)
+- ELRATA_OCR_LANGS: idiomes separats per comes (per defecte "es,ca")
+- ELRATA_OCR_GPU: "1" per fer servir GPU si n'hi ha
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional
+
+DEFAULT_LANGS = ("es", "ca")
+DEFAULT_POOL_SIZE = 1
+
+
+def _env_pool_size() -> int:
+    try:
+        return max(1, int(os.environ.get("ELRATA_OCR_POOL_SIZE", DEFAULT_POOL_SIZE)))
+    except ValueError:
+        return DEFAULT_POOL_SIZE
+
+
+def _env_langs() -> tuple[str, ...]:
+    raw = os.environ.get("ELRATA_OCR_LANGS")
+    if not raw:
+        return DEFAULT_LANGS
+    return tuple(l.strip() for l in raw.split(",") if l.strip()) or DEFAULT_LANGS
+
+
+@dataclass
+class OcrMetrics:
+    """Mètriques acumulades de latència del pool OCR."""
+    calls: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+    last_seconds: float = 0.0
+    wait_seconds: float = 0.0  # temps esperant un lector lliure
+    readers_created: int = 0
+    init_seconds: float = 0.0  # temps total carregant models
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record_call(self, seconds: float, waited: float) -> None:
+        with self._lock:
+            self.calls += 1
+            self.total_seconds += seconds
+            self.last_seconds = seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            self.wait_seconds += waited
+
+    def record_init(self, seconds: float) -> None:
+        with self._lock:
+            self.readers_created += 1
+            self.init_seconds += seconds
+
+    @property
+    def mean_seconds(self) -> float:
+        return self.total_seconds / self.calls if self.calls else 0.0
+
+    def snapshot(self) -> dict[str, float]:
+        """Còpia de les mètriques en un dict (per mostrar o registrar)."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "mean_seconds": self.mean_seconds,
+                "max_seconds": self.max_seconds,
+                "last_seconds": self.last_seconds,
+                "wait_seconds": self.wait_seconds,
+                "readers_created": self.readers_created,
+                "init_seconds": self.init_seconds,
+            }
+
+
+class ReaderPool:
+    """
+    Pool de lectors EasyOCR.
+
+    Els lectors es creen sota demanda fins a `size`; si tots estan ocupats,
+    la crida espera que se n'alliberi un. Un mateix lector mai s'usa des de
+    dos fils alhora.
+    """
+
+    def __init__(
+        self,
+        size: Optional[int] = None,
+        langs: Optional[tuple[str, ...]] = None,
+        gpu: Optional[bool] = None,
+    ):
+        self.size = size if size is not None else _env_pool_size()
+        self.langs = tuple(langs) if langs else _env_langs()
+        self.gpu = gpu if gpu is not None else os.environ.get("ELRATA_OCR_GPU") == "1"
+        self.metrics = OcrMetrics()
+        self._idle: "queue.LifoQueue[Any]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _create_reader(self) -> Any:
+        import easyocr
+
+        t0 = time.perf_counter()
+        reader = easyocr.Reader(list(self.langs), gpu=self.gpu, verbose=False)
+        self.metrics.record_init(time.perf_counter() - t0)
+        return reader
+
+    def _take(self, timeout: Optional[float]) -> Any:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._create_reader()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return self._idle.get(timeout=timeout)
+
+    @contextmanager
+    def reader(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        """Presta un lector en exclusiva durant el bloc `with`."""
+        reader = self._take(timeout)
+        try:
+            yield reader
+        finally:
+            self._idle.put(reader)
+
+    def readtext(self, image: Any, **kwargs: Any) -> list:
+        """Executa `readtext` amb un lector del pool i registra la latència."""
+        t_wait = time.perf_counter()
+        with self.reader() as reader:
+            t0 = time.perf_counter()
+            try:
+                return reader.readtext(image, **kwargs)
+            finally:
+                self.metrics.record_call(time.perf_counter() - t0, t0 - t_wait)
+
+    def warm_up(self, n: Optional[int] = None) -> int:
+        """
+        Precarrega fins a `n` lectors (per defecte tot el pool).
+        Retorna el nombre de lectors disponibles.
+        """
+        target = self.size if n is None else min(n, self.size)
+        while True:
+            with self._lock:
+                if self._created >= target:
+                    return self._created
+                self._created += 1
+            try:
+                self._idle.put(self._create_reader())
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+    @property
+    def created(self) -> int:
+        return self._created
+
+
+_POOL: Optional[ReaderPool] = None
+_POOL_LOCK = threading.Lock()
+_WARMUP_STARTED = False
+
+
+def get_reader_pool() -> ReaderPool:
+    """Retorna el pool compartit del procés (es crea el primer cop)."""
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                _POOL = ReaderPool()
+    return _POOL
+
+
+def warm_up_in_background() -> None:
+    """
+    Carrega els models OCR en un fil de fons, només un cop per procés.
+    Pensat per cridar-se en arrencar el servidor (Inici.py).
+    """
+    global _WARMUP_STARTED
+    with _POOL_LOCK:
+        if _WARMUP_STARTED:
+            return
+        _WARMUP_STARTED = True
+
+    def _run() -> None:
+        try:
+            get_reader_pool().warm_up()
+        except Exception:
+            pass  # Sense easyocr o sense models: es reintentarà a la primera factura
+
+    threading.Thread(target=_run, name="ocr-warmup", daemon=True).start()
+
+
+def readtext(image: Any, **kwargs: Any) -> list:
+    """Drecera: `readtext` amb el pool compartit."""
+    return get_reader_pool().readtext(image, **kwargs)
+
+
+def ocr_metrics() -> dict[str, float]:
+    """Mètriques de latència del pool compartit."""
+    return get_reader_pool().metrics.snapshot()
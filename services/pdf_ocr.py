@@ -0,0 +1,490 @@
+"""
+Pipeline d'OCR per pàgines de factures en PDF.
+
+La rasterització (PyMuPDF) i el reconeixement (EasyOCR) es fan en paral·lel:
+un fil renderitza les pàgines mentre els treballadors del pool OCR en
+reconeixen el text. El text de cada pàgina es retorna tan bon punt està
+llest, sense esperar la resta del document.
+
+La majoria de factures d'Endesa, Iberdrola o Naturgy es generen digitalment
+i ja porten capa de text: per a aquestes pàgines es llegeix el text
+directament amb PyMuPDF (mil·lisegons) i només es rasteritza i es passa per
+EasyOCR les pàgines escanejades o sense text aprofitable.
+
+Per a les pàgines que van a OCR, primer es fa una passada a baixa resolució
+(ANALYSIS_DPI) per trobar on hi ha text: les pàgines en blanc es descarten,
+les de lletra petita i densa (condicions generals, avís legal...) passen al
+final de la cua, i només les regions amb tinta es tornen a renderitzar a la
+resolució d'OCR. Amb l'aturada anticipada del parser, sovint les pàgines
+legals ni s'arriben a reconèixer.
+
+La memòria està acotada: mai hi ha més d'una petita finestra de pàgines
+renderitzades alhora, els píxels de totes les sessions del procés comparteixen
+un pressupost màxim (ELRATA_OCR_MAX_MB; si una pàgina sola no hi cap, es
+renderitza a menys resolució), els buffers d'imatge es reutilitzen entre
+pàgines i només es processen les primeres ELRATA_PDF_MAX_PAGES pàgines.
+
+PyMuPDF no és segur entre fils, per això tot l'accés al document es fa des
+d'un únic fil de rasterització.
+"""
+from __future__ import annotations
+
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterator, Optional
+
+DEFAULT_DPI = 150
+MIN_DPI = 72  # mínim al qual es rebaixa una pàgina que no cap al pressupost
+# Mínim de paraules amb lletres o xifres perquè la capa de text es consideri útil
+MIN_TEXT_LAYER_WORDS = 10
+
+SOURCE_TEXT = "text"  # capa de text nativa del PDF
+SOURCE_OCR = "ocr"  # rasterització + EasyOCR
+SOURCE_BLANK = "blank"  # pàgina sense tinta, no es reconeix
+
+# Anàlisi de maquetació a baixa resolució (1 px = 1 punt PDF a 72 dpi)
+ANALYSIS_DPI = 72
+INK_THRESHOLD = 160  # gris < llindar = tinta
+BLANK_MAX_INK_RATIO = 0.0001  # sota aquesta fracció de tinta, pàgina en blanc
+REGION_MERGE_GAP_PT = 14  # files separades per menys d'això formen un bloc
+REGION_PAD_PT = 4
+MIN_REGION_AREA_PT = 60  # taques més petites es consideren soroll
+MIN_REGION_INK_PX = 25  # i blocs amb tan poca tinta, pols de l'escàner
+FULL_PAGE_COVERAGE = 0.7  # si les regions cobreixen més, es renderitza la pàgina sencera
+# Pàgina "densa" (text legal): moltes línies de lletra petita
+DENSE_MIN_LINES = 50
+DENSE_MAX_LINE_HEIGHT_PT = 8
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+# Límits de memòria (compartits per totes les sessions del procés)
+MAX_PAGES = _env_int("ELRATA_PDF_MAX_PAGES", 40)
+RENDER_BUDGET_MB = _env_int("ELRATA_OCR_MAX_MB", 256)
+
+
+@dataclass
+class PageText:
+    """Text reconegut d'una pàgina del PDF."""
+    index: int  # 0-based
+    text: str
+    source: str = SOURCE_OCR  # SOURCE_TEXT, SOURCE_OCR o SOURCE_BLANK
+    seconds: float = 0.0  # temps d'extracció o reconeixement
+
+
+class PageStream:
+    """
+    Iterador de `PageText` que recorda quin camí ha fet cada pàgina.
+
+    `sources` és {índex de pàgina: SOURCE_*} per a les pàgines
+    ja lliurades; `close()` cancel·la les pàgines pendents. Fins a la
+    primera pàgina el document obert és del `PageStream` (després el tanca
+    el fil de renderització), i `close()` el tanca si no s'ha arribat a
+    iterar.
+    """
+
+    def __init__(self, pages: Iterator[PageText], n_pages: int, truncated: bool = False, doc=None):
+        self._pages = pages
+        self._doc = doc
+        self.n_pages = n_pages  # pàgines a processar
+        self.truncated = truncated  # el document en tenia més que el límit
+        self.sources: dict[int, str] = {}
+
+    def __iter__(self) -> "PageStream":
+        return self
+
+    def __next__(self) -> PageText:
+        self._doc = None  # a partir d'ara el tanca el generador
+        page = next(self._pages)
+        self.sources[page.index] = page.source
+        return page
+
+    def close(self) -> None:
+        self._pages.close()
+        if self._doc is not None:
+            self._doc.close()
+            self._doc = None
+
+    def __del__(self) -> None:
+        self.close()
+
+    def count(self, source: str) -> int:
+        """Nombre de pàgines lliurades per un camí (SOURCE_*)."""
+        return sum(1 for s in self.sources.values() if s == source)
+
+
+class MemoryBudget:
+    """
+    Pressupost de bytes compartit entre fils.
+
+    `acquire` espera fins que hi ha lloc; una petició més gran que tot el
+    pressupost s'accepta quan no hi ha res més en ús, per no bloquejar-se mai.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, n: int, stop: Optional[threading.Event] = None) -> bool:
+        with self._cond:
+            while self.used > 0 and self.used + n > self.capacity:
+                if stop is not None and stop.is_set():
+                    return False
+                self._cond.wait(timeout=0.1)
+            self.used += n
+            return True
+
+    def release(self, n: int) -> None:
+        with self._cond:
+            self.used -= n
+            self._cond.notify_all()
+
+
+class _BufferPool:
+    """Buffers d'imatge reutilitzables: evita reservar memòria nova per pàgina."""
+
+    def __init__(self, max_free: int = 4):
+        self._free: list = []
+        self._max_free = max_free
+        self._lock = threading.Lock()
+
+    def take(self, shape: tuple[int, ...]):
+        import numpy as np
+
+        n = math.prod(shape)
+        with self._lock:
+            # El buffer lliure més petit on hi càpiga
+            fitting = [b for b in self._free if b.size >= n]
+            if fitting:
+                buf = min(fitting, key=lambda b: b.size)
+                self._free.remove(buf)
+                return buf[:n].reshape(shape)
+        return np.empty(shape, dtype=np.uint8)
+
+    def give(self, arr) -> None:
+        buf = arr.base if arr.base is not None else arr
+        with self._lock:
+            if len(self._free) < self._max_free:
+                self._free.append(buf.reshape(-1))
+
+
+_RENDER_BUDGET = MemoryBudget(RENDER_BUDGET_MB * 1024 * 1024)
+_BUFFERS = _BufferPool()
+
+
+def _pixmap_to_array(pix):
+    """Copia els píxels a un buffer del pool (l'únic còpia; el pixmap s'allibera)."""
+    import numpy as np
+
+    src = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)
+    img = _BUFFERS.take((pix.height, pix.width, pix.n))
+    img.reshape(pix.height, -1)[:] = src[:, : pix.width * pix.n]
+    return img
+
+
+def _ocr_images(pool, index: int, images: list) -> PageText:
+    """Reconeix les regions d'una pàgina (de dalt a baix) i n'uneix el text."""
+    t0 = time.perf_counter()
+    text = ""
+    try:
+        for img in images:
+            results = pool.readtext(img)
+            text += "".join(line + "\n" for (_bbox, line, _prob) in results)
+    finally:
+        release_images(images)
+    return PageText(index=index, text=text, source=SOURCE_OCR, seconds=time.perf_counter() - t0)
+
+
+@dataclass
+class PageLayout:
+    """Resultat de l'anàlisi a baixa resolució d'una pàgina."""
+    blank: bool = False
+    dense: bool = False  # moltes línies de lletra petita (text legal)
+    # Regions amb text, en punts PDF (x0, y0, x1, y1); buit = pàgina sencera
+    regions: list[tuple[float, float, float, float]] = field(default_factory=list)
+
+
+def _runs(mask) -> list[tuple[int, int]]:
+    """Trams consecutius [inici, fi) on `mask` és cert."""
+    import numpy as np
+
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    return list(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+def analyse_page(page, dpi: int = ANALYSIS_DPI) -> PageLayout:
+    """
+    Renderitza la pàgina a baixa resolució i en detecta les regions de text.
+
+    Les files amb tinta properes s'agrupen en blocs horitzontals; cada bloc
+    es retalla a l'amplada on hi ha tinta.
+    """
+    import numpy as np
+
+    pix = page.get_pixmap(dpi=dpi, alpha=False, colorspace="gray")
+    gray = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+    ink = gray < INK_THRESHOLD
+    h, w = ink.shape
+    if h == 0 or w == 0 or ink.mean() < BLANK_MAX_INK_RATIO:
+        return PageLayout(blank=True)
+
+    scale = 72.0 / dpi  # píxels -> punts
+    lines = _runs(ink.any(axis=1))
+    line_heights = [(b - a) * scale for a, b in lines]
+    dense = (
+        len(lines) >= DENSE_MIN_LINES
+        and float(np.median(line_heights)) <= DENSE_MAX_LINE_HEIGHT_PT
+    )
+
+    # Agrupem línies en blocs
+    gap = REGION_MERGE_GAP_PT / scale
+    blocks: list[list[int]] = []
+    for a, b in lines:
+        if blocks and a - blocks[-1][1] <= gap:
+            blocks[-1][1] = b
+        else:
+            blocks.append([a, b])
+
+    pad = REGION_PAD_PT / scale
+    regions = []
+    area = 0.0
+    for a, b in blocks:
+        band = ink[a:b]
+        if band.sum() < MIN_REGION_INK_PX:
+            continue
+        cols = np.flatnonzero(band.any(axis=0))
+        x0, x1 = cols[0], cols[-1] + 1
+        if (x1 - x0) * (b - a) * scale * scale < MIN_REGION_AREA_PT:
+            continue
+        x0, y0 = max(0, x0 - pad), max(0, a - pad)
+        x1, y1 = min(w, x1 + pad), min(h, b + pad)
+        area += (x1 - x0) * (y1 - y0)
+        regions.append((float(x0 * scale), float(y0 * scale), float(x1 * scale), float(y1 * scale)))
+
+    if not regions:
+        return PageLayout(blank=True)
+    if area >= FULL_PAGE_COVERAGE * w * h:
+        regions = []
+    return PageLayout(dense=dense, regions=regions)
+
+
+def _clips(page, layout: Optional[PageLayout]) -> list:
+    import fitz
+
+    if layout is None or not layout.regions:
+        return [page.rect]
+    origin = page.rect.tl  # les coordenades de l'anàlisi són relatives a la pàgina
+    return [
+        fitz.Rect(x0, y0, x1, y1) + (origin.x, origin.y, origin.x, origin.y)
+        for x0, y0, x1, y1 in layout.regions
+    ]
+
+
+def estimate_render_bytes(page, dpi: int, layout: Optional[PageLayout] = None) -> int:
+    """Bytes RGB que ocuparan les imatges de `render_for_ocr` a `dpi`."""
+    zoom = dpi / 72.0
+    return sum(
+        math.ceil(r.width * zoom) * math.ceil(r.height * zoom) * 3
+        for r in _clips(page, layout)
+    )
+
+
+def fit_dpi(page, dpi: int, max_bytes: int, layout: Optional[PageLayout] = None) -> int:
+    """Rebaixa la resolució (fins a MIN_DPI) perquè la pàgina càpiga a `max_bytes`."""
+    est = estimate_render_bytes(page, dpi, layout)
+    if est <= max_bytes:
+        return dpi
+    return max(MIN_DPI, int(dpi * math.sqrt(max_bytes / est)))
+
+
+def render_for_ocr(page, dpi: int, layout: Optional[PageLayout] = None) -> list:
+    """
+    Imatges a reconèixer: la pàgina sencera o només les regions amb text.
+    Els buffers són del pool; retorneu-los amb `release_images`.
+    """
+    images = []
+    for clip in _clips(page, layout):
+        pix = page.get_pixmap(dpi=dpi, alpha=False, clip=clip)
+        images.append(_pixmap_to_array(pix))
+        del pix  # alliberem el pixmap de MuPDF abans de renderitzar el següent
+    return images
+
+
+def release_images(images: list) -> None:
+    for img in images:
+        _BUFFERS.give(img)
+
+
+def extract_text_layer(page, min_words: int = MIN_TEXT_LAYER_WORDS) -> Optional[str]:
+    """
+    Llegeix la capa de text nativa d'una pàgina de PyMuPDF.
+
+    Retorna el text (una línia per línia del PDF, com l'OCR) o None si la
+    pàgina no en té prou per ser aprofitable (p. ex. una factura escanejada).
+    """
+    words = page.get_text("words")
+    useful = sum(1 for w in words if any(c.isalnum() for c in w[4]))
+    if useful < min_words:
+        return None
+    text = page.get_text("text", sort=True)
+    return "".join(line.strip() + "\n" for line in text.splitlines() if line.strip())
+
+
+def iter_page_texts(
+    pdf_bytes: bytes,
+    dpi: int = DEFAULT_DPI,
+    max_workers: Optional[int] = None,
+    pool=None,
+    text_layer: bool = True,
+    adaptive: bool = True,
+    max_pages: Optional[int] = None,
+    window: Optional[int] = None,
+    memory_budget: Optional[MemoryBudget] = None,
+) -> PageStream:
+    """
+    Genera el text de cada pàgina a mesura que està llest.
+
+    Amb `text_layer`, primer s'intenta la capa de text del PDF i només es fa
+    OCR de les pàgines sense text útil; `PageText.source` indica el camí.
+    Amb `adaptive`, les pàgines a reconèixer s'analitzen abans a baixa
+    resolució (vegeu `analyse_page`) i només se'n renderitzen les regions
+    amb text a `dpi`.
+
+    Memòria: com a molt `window` pàgines renderitzades en vol (per defecte
+    2 per treballador) i totes dins de `memory_budget` (per defecte el
+    pressupost compartit del procés). Només es processen les primeres
+    `max_pages` pàgines (per defecte MAX_PAGES); `PageStream.truncated`
+    indica si n'hi havia més. `pdf_bytes` pot ser un `memoryview` (p. ex.
+    `uploaded_file.getbuffer()`) per no copiar el PDF.
+    L'ordre és el d'acabament, no el de pàgina (mireu `PageText.index`).
+    Si el consumidor tanca el generador abans d'hora (p. ex. perquè ja té
+    totes les dades de la factura), les pàgines pendents es cancel·len.
+    """
+    import fitz
+
+    if pool is None:
+        from services.ocr import get_reader_pool
+        pool = get_reader_pool()
+    workers = max_workers or max(1, pool.size)
+
+    # Obrim el PDF aquí (i no dins del generador) perquè un fitxer invàlid
+    # falli de seguida, a la crida
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    try:
+        max_pages = max_pages or MAX_PAGES
+        n_pages = min(len(doc), max_pages)
+        budget = memory_budget or _RENDER_BUDGET
+        pages = _iter_pages(
+            doc, n_pages, dpi, workers, pool, text_layer, adaptive, window or workers * 2, budget,
+        )
+        return PageStream(pages, n_pages, truncated=len(doc) > max_pages, doc=doc)
+    except BaseException:
+        doc.close()
+        raise
+
+
+def _iter_pages(
+    doc,
+    n_pages: int,
+    dpi: int,
+    workers: int,
+    pool,
+    text_layer: bool,
+    adaptive: bool,
+    window: int,
+    budget: MemoryBudget,
+) -> Iterator[PageText]:
+    done: "queue.Queue[Future]" = queue.Queue()
+    stop = threading.Event()
+    # Limitem les pàgines renderitzades en vol perquè no s'acumulin imatges
+    in_flight = threading.BoundedSemaphore(window)
+    render_error: list[BaseException] = []
+
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-ocr")
+
+    def _emit(page_text: PageText) -> None:
+        fut: Future = Future()
+        fut.set_result(page_text)
+        done.put(fut)
+
+    def _submit_ocr(page, i: int, layout: Optional[PageLayout]) -> bool:
+        while not in_flight.acquire(timeout=0.1):
+            if stop.is_set():
+                return False
+        page_dpi = fit_dpi(page, dpi, budget.capacity, layout)
+        n_bytes = estimate_render_bytes(page, page_dpi, layout)
+        if stop.is_set() or not budget.acquire(n_bytes, stop):
+            in_flight.release()
+            return False
+        try:
+            images = render_for_ocr(page, page_dpi, layout)
+            fut = executor.submit(_ocr_images, pool, i, images)
+        except BaseException:
+            budget.release(n_bytes)
+            in_flight.release()
+            raise
+
+        def _on_done(f: Future) -> None:
+            budget.release(n_bytes)
+            in_flight.release()
+            done.put(f)
+
+        fut.add_done_callback(_on_done)
+        return True
+
+    def _render_all() -> None:
+        try:
+            deferred: list[tuple[int, PageLayout]] = []
+            for i in range(n_pages):
+                if stop.is_set():
+                    return
+                page = doc.load_page(i)
+                t0 = time.perf_counter()
+                if text_layer:
+                    text = extract_text_layer(page)
+                    if text is not None:
+                        _emit(PageText(i, text, SOURCE_TEXT, time.perf_counter() - t0))
+                        continue
+                layout = analyse_page(page) if adaptive else None
+                if layout is not None and layout.blank:
+                    _emit(PageText(i, "", SOURCE_BLANK, time.perf_counter() - t0))
+                    continue
+                # La primera pàgina (resum de la factura) mai es posposa
+                if layout is not None and layout.dense and i > 0:
+                    deferred.append((i, layout))
+                    continue
+                if not _submit_ocr(page, i, layout):
+                    return
+            for i, layout in deferred:
+                if not _submit_ocr(doc.load_page(i), i, layout):
+                    return
+        except BaseException as e:  # l'error es propaga al consumidor
+            render_error.append(e)
+            done.put(None)  # type: ignore[arg-type]
+        finally:
+            doc.close()
+
+    renderer = threading.Thread(target=_render_all, name="pdf-render", daemon=True)
+    renderer.start()
+
+    try:
+        for _ in range(n_pages):
+            fut = done.get()
+            if fut is None:
+                raise render_error[0]
+            yield fut.result()
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
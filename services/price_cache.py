@@ -0,0 +1,278 @@
+"""
+Memòria cau de preus en dos nivells, compartida entre processos.
+
+1. Memòria del procés (LRU): resposta immediata dins d'un mateix worker.
+2. Disc (SQLite al directori de memòria cau): compartit per tots els workers
+   de Streamlit del node i persistent entre reinicis.
+
+Semàntica stale-while-revalidate: una entrada més antiga que `ttl_s` però
+dins de `stale_ttl_s` es retorna igualment i es refresca en segon pla.
+Només un procés alhora refresca cada clau (lloguer a la taula `leases`), i
+dins del procés els fils que la demanen alhora comparteixen una sola càrrega
+(`SingleFlight`), de manera que N workers i sessions no criden l'API N
+vegades. Sense cap entrada, s'espera com a molt `cold_wait_s` la primera
+càrrega; si no arriba, es retorna None (i el cridador fa servir el seu valor
+per defecte) mentre la càrrega acaba en segon pla.
+"""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Iterator, Optional
+
+from services.cache_dir import get_cache_dir
+from services.singleflight import SingleFlight
+
+_DB_NAME = "prices.sqlite3"
+DEFAULT_LEASE_S = 30.0
+
+
+@dataclass
+class CacheEntry:
+    """Valor en memòria cau i moment (epoch) en què es va obtenir."""
+    value: Any
+    fetched_at: float
+
+    def age(self, now: Optional[float] = None) -> float:
+        return (now if now is not None else time.time()) - self.fetched_at
+
+
+class TieredCache:
+    """Memòria cau LRU en memòria + SQLite, amb stale-while-revalidate."""
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl_s: float,
+        stale_ttl_s: float,
+        max_items: int = 128,
+        path: Optional[Path] = None,
+        cold_wait_s: float = 2.0,
+    ):
+        self.namespace = namespace
+        self.ttl_s = ttl_s
+        self.stale_ttl_s = stale_ttl_s
+        self.max_items = max_items
+        self.cold_wait_s = cold_wait_s
+        self._mem: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._mem_lock = threading.Lock()
+        self._owner = f"{os.getpid()}"
+        self._local_leases: set[str] = set()  # si el disc no és utilitzable
+        self._flights = SingleFlight()
+        try:
+            self.path: Optional[Path] = Path(path) if path else get_cache_dir() / _DB_NAME
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS entries ("
+                    " key TEXT PRIMARY KEY, value TEXT NOT NULL, fetched_at REAL NOT NULL)"
+                )
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS leases ("
+                    " key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)"
+                )
+        except (OSError, sqlite3.Error):
+            self.path = None  # només memòria
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    # --- Nivell 1: memòria ---
+
+    def _mem_get(self, key: str) -> Optional[CacheEntry]:
+        with self._mem_lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                self._mem.move_to_end(key)
+            return entry
+
+    def _mem_put(self, key: str, entry: CacheEntry) -> None:
+        with self._mem_lock:
+            self._mem[key] = entry
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_items:
+                self._mem.popitem(last=False)
+
+    # --- Nivell 2: disc ---
+
+    def _disk_get(self, key: str) -> Optional[CacheEntry]:
+        if self.path is None:
+            return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT value, fetched_at FROM entries WHERE key = ?", (self._key(key),)
+                ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        return CacheEntry(json.loads(row[0]), row[1])
+
+    def _disk_put(self, key: str, entry: CacheEntry) -> None:
+        if self.path is None:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?)",
+                    (self._key(key), json.dumps(entry.value), entry.fetched_at),
+                )
+        except sqlite3.Error:
+            pass
+
+    # --- API ---
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Entrada més recent disponible (memòria o disc), fresca o no.
+        Si la de memòria ja no és fresca, es mira si un altre worker n'ha
+        desat una de més nova al disc.
+        """
+        entry = self._mem_get(key)
+        if entry is not None and entry.age() < self.ttl_s:
+            return entry
+        disk = self._disk_get(key)
+        if disk is not None and (entry is None or disk.fetched_at > entry.fetched_at):
+            self._mem_put(key, disk)
+            return disk
+        return entry
+
+    def set(self, key: str, value: Any, fetched_at: Optional[float] = None) -> CacheEntry:
+        entry = CacheEntry(value, fetched_at if fetched_at is not None else time.time())
+        self._mem_put(key, entry)
+        self._disk_put(key, entry)
+        return entry
+
+    def try_lease(self, key: str, seconds: float = DEFAULT_LEASE_S) -> bool:
+        """Intenta ser l'únic procés que refresca `key` durant `seconds`."""
+        now = time.time()
+        if self.path is None:
+            with self._mem_lock:
+                if key in self._local_leases:
+                    return False
+                self._local_leases.add(key)
+                return True
+        try:
+            with self._connect() as conn:
+                cur = conn.execute(
+                    "INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET"
+                    " owner = excluded.owner, expires = excluded.expires"
+                    " WHERE leases.expires < ? OR leases.owner = excluded.owner",
+                    (self._key(key), self._owner, now + seconds, now),
+                )
+                return cur.rowcount > 0
+        except sqlite3.Error:
+            return True  # sense coordinació possible, millor refrescar que no fer-ho
+
+    def release_lease(self, key: str) -> None:
+        if self.path is None:
+            with self._mem_lock:
+                self._local_leases.discard(key)
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "DELETE FROM leases WHERE key = ? AND owner = ?", (self._key(key), self._owner)
+                )
+        except sqlite3.Error:
+            pass
+
+    def refresh(self, key: str, loader: Callable[[], Any]) -> Optional[CacheEntry]:
+        """
+        Crida `loader` (si aconsegueix el lloguer) i desa el resultat.
+        Les crides concurrents del procés per la mateixa clau esperen la
+        mateixa càrrega. Retorna la nova entrada, o None si no s'ha refrescat.
+        """
+        entry, _ = self._refresh_shared(key, loader)
+        return entry
+
+    def _refresh_shared(
+        self, key: str, loader: Callable[[], Any]
+    ) -> tuple[Optional[CacheEntry], bool]:
+        return self._flights.do(key, lambda: self._refresh_once(key, loader))
+
+    def _refresh_once(
+        self, key: str, loader: Callable[[], Any]
+    ) -> tuple[Optional[CacheEntry], bool]:
+        """(entrada nova o None, si teníem el lloguer i per tant s'ha intentat)."""
+        if not self.try_lease(key):
+            return None, False
+        try:
+            value = loader()
+        except Exception:
+            value = None
+        finally:
+            self.release_lease(key)
+        if value is None:
+            return None, True
+        return self.set(key, value), True
+
+    def refresh_in_background(
+        self, key: str, loader: Callable[[], Any]
+    ) -> Optional[threading.Thread]:
+        """Refresca en un fil; None si ja hi ha una càrrega en curs per `key`."""
+        if self._flights.in_flight(key):
+            return None
+        t = threading.Thread(
+            target=self.refresh, args=(key, loader), name=f"cache-refresh-{key}", daemon=True,
+        )
+        t.start()
+        return t
+
+    def get_or_load(self, key: str, loader: Callable[[], Any]) -> Optional[Any]:
+        """
+        Valor per a `key` amb stale-while-revalidate.
+
+        - Fresc: es retorna directament.
+        - Caducat però dins de `stale_ttl_s`: es retorna i es refresca en segon pla.
+        - Absent o massa vell: s'espera com a molt `cold_wait_s` a la càrrega;
+          si no acaba a temps, None.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            age = entry.age()
+            if age < self.ttl_s:
+                return entry.value
+            if age < self.stale_ttl_s:
+                self.refresh_in_background(key, loader)
+                return entry.value
+
+        # Arrencada en fred: tots els fils s'enganxen a la mateixa càrrega
+        deadline = time.monotonic() + self.cold_wait_s
+        outcome: dict[str, tuple[Optional[CacheEntry], bool]] = {}
+        t = threading.Thread(
+            target=lambda: outcome.update(result=self._refresh_shared(key, loader)), daemon=True
+        )
+        t.start()
+        t.join(self.cold_wait_s)
+        if "result" in outcome:
+            entry, attempted = outcome["result"]
+            if entry is not None:
+                return entry.value
+            if attempted:
+                return None  # la càrrega ha fallat: no hi ha res a esperar
+        # Si un altre worker té el lloguer, esperem que desi el resultat al disc
+        while True:
+            fresh = self.get(key)
+            if fresh is not None and fresh.age() < self.stale_ttl_s:
+                return fresh.value
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(0.05)
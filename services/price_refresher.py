@@ -0,0 +1,270 @@
+"""
+Refrescador de preus PVPC en segon pla.
+
+Un fil (o un procés a part: `python -m services.price_refresher`) manté la
+memòria cau de preus sempre fresca, de manera que les pàgines només fan
+consultes i cap usuari no espera l'API:
+
+- refresca la instantània de `services.pvpc` abans que caduqui;
+- baixa la sèrie del dia (a resolució nativa, quarthorària des d'octubre
+  2025) i, un cop REE publica el dia següent (~20:15), també la de demà;
+- precalcula per zona la mitjana diària, la mitjana de cada període 2.0TD
+  (punta, llano, valle) i els perfils horari i quarthorari (`DayProfile`);
+- desa la sèrie baixada a `services.price_store`.
+
+Amb diversos workers, el lloguer de `TieredCache` fa que només un procés
+consulti l'API per cada clau.
+
+Configuració: ELRATA_PRICE_REFRESH_MIN (per defecte 30),
+ELRATA_PRICE_REFRESHER=0 per no arrencar-lo des de l'app.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime, timedelta, timezone, tzinfo
+from typing import Optional
+
+from services.price_cache import TieredCache
+from services.tariff_periods import PERIOD_LLANO, PERIOD_NAMES, PERIOD_PUNTA, PERIOD_VALLE, period_for
+
+DEFAULT_REFRESH_MIN = 30
+RETRY_S = 10 * 60
+PUBLICATION_HOUR = 20  # REE publica els preus de demà cap a les 20:15
+PUBLICATION_MINUTE = 30
+
+# Un dia publicat no canvia, però es revisa cada 6 h per si hi ha correccions
+_PROFILES = TieredCache("pvpc_profile", ttl_s=6 * 3600, stale_ttl_s=3 * 24 * 3600)
+
+
+def _madrid_tz() -> tzinfo:
+    try:
+        from zoneinfo import ZoneInfo
+
+        return ZoneInfo("Europe/Madrid")
+    except Exception:
+        return timezone(timedelta(hours=1))
+
+
+_MADRID = _madrid_tz()
+
+
+def _refresh_interval_s() -> float:
+    try:
+        return float(os.environ.get("ELRATA_PRICE_REFRESH_MIN", DEFAULT_REFRESH_MIN)) * 60
+    except ValueError:
+        return DEFAULT_REFRESH_MIN * 60
+
+
+@dataclass
+class DayProfile:
+    """Preus d'un dia per a una zona, en €/kWh (terme d'energia publicat)."""
+    day: str  # ISO
+    geo_id: int
+    average: float
+    periods: dict[str, float] = field(default_factory=dict)  # "punta"/"llano"/"valle"
+    hourly: list[Optional[float]] = field(default_factory=list)  # 24 valors (hora peninsular)
+    quarter_hourly: list[Optional[float]] = field(default_factory=list)  # 96, si n'hi ha
+
+    def period_factors(self) -> Optional[dict[int, float]]:
+        """
+        Preu de cada període relatiu a la mitjana del dia, o None si el dia
+        no té els tres períodes (cap de setmana o festiu: tot és valle).
+        """
+        if self.average <= 0 or len(self.periods) < 3:
+            return None
+        return {p: self.periods[name] / self.average for p, name in PERIOD_NAMES.items()}
+
+
+def _parse_moment(ts: str) -> Optional[datetime]:
+    """Instant ESIOS en hora peninsular (sense zona), o None si no es pot llegir."""
+    try:
+        moment = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(_MADRID).replace(tzinfo=None)
+    return moment
+
+
+def _mean(values: list[float]) -> Optional[float]:
+    return round(sum(values) / len(values), 5) if values else None
+
+
+def build_day_profile(day: date, geo_id: int, points: list[tuple[str, float]]) -> Optional[DayProfile]:
+    """Perfil d'un dia a partir de la sèrie (instant ISO, €/kWh) d'una zona."""
+    from services.pvpc import GEO_CANARIAS
+
+    canarias = geo_id == GEO_CANARIAS
+    hours: list[list[float]] = [[] for _ in range(24)]
+    quarters: list[list[float]] = [[] for _ in range(96)]
+    by_period: dict[int, list[float]] = {PERIOD_PUNTA: [], PERIOD_LLANO: [], PERIOD_VALLE: []}
+    all_values: list[float] = []
+    sub_hourly = False
+    for ts, value in points:
+        moment = _parse_moment(ts)
+        if moment is None or moment.date() != day:
+            continue
+        sub_hourly = sub_hourly or moment.minute != 0
+        hours[moment.hour].append(value)
+        quarters[moment.hour * 4 + moment.minute // 15].append(value)
+        by_period[period_for(moment, canarias=canarias)].append(value)
+        all_values.append(value)
+    if not all_values:
+        return None
+    return DayProfile(
+        day=day.isoformat(),
+        geo_id=geo_id,
+        average=_mean(all_values),
+        periods={PERIOD_NAMES[p]: _mean(v) for p, v in by_period.items() if v},
+        hourly=[_mean(v) for v in hours],
+        quarter_hourly=[_mean(v) for v in quarters] if sub_hourly else [],
+    )
+
+
+def _load_day_profiles(day: date) -> Optional[dict[str, dict]]:
+    """Consulta l'API una vegada per al dia i en calcula el perfil de cada zona."""
+    from services.pvpc import _fetch_esios, index_values
+
+    start = datetime(day.year, day.month, day.day)
+    values = _fetch_esios(start, start + timedelta(hours=23, minutes=59))
+    if not values:
+        return None
+    try:
+        # La sèrie completa queda al magatzem local per als simuladors
+        from services.price_store import get_price_store
+
+        get_price_store().append_esios_values(1001, values)
+    except (ImportError, OSError):
+        pass
+    snapshot = index_values(values)
+    profiles = {}
+    for geo_id, points in snapshot.series.items():
+        profile = build_day_profile(day, geo_id, points)
+        if profile is not None:
+            profiles[str(geo_id)] = asdict(profile)
+    return profiles or None
+
+
+def _profile_key(day: date) -> str:
+    return f"day:{day.isoformat()}"
+
+
+def get_day_profile(region: str, day: Optional[date] = None) -> Optional[DayProfile]:
+    """
+    Perfil precalculat per a la comunitat i el dia (per defecte avui).
+    Només consulta la memòria cau: None si encara no s'ha calculat.
+    """
+    from services.pvpc import GEO_PENINSULA, REGION_TO_GEO
+
+    day = day or datetime.now(_MADRID).date()
+    entry = _PROFILES.get(_profile_key(day))
+    if entry is None:
+        return None
+    data = entry.value.get(str(REGION_TO_GEO.get(region, GEO_PENINSULA)))
+    return DayProfile(**data) if data else None
+
+
+def get_period_factors(region: str, day: Optional[date] = None) -> Optional[dict[int, float]]:
+    """Factors punta/llano/valle respecte de la mitjana, del perfil del dia."""
+    profile = get_day_profile(region, day)
+    return profile.period_factors() if profile else None
+
+
+class PriceRefresher:
+    """Bucle que manté fresques la instantània i els perfils diaris."""
+
+    def __init__(self, interval_s: Optional[float] = None):
+        self.interval_s = interval_s if interval_s is not None else _refresh_interval_s()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _days_due(self, now: datetime) -> list[date]:
+        days = [now.date()]
+        if (now.hour, now.minute) >= (PUBLICATION_HOUR, PUBLICATION_MINUTE):
+            days.append(now.date() + timedelta(days=1))
+        return days
+
+    def run_once(self, now: Optional[datetime] = None) -> float:
+        """Fa una passada i retorna els segons fins a la següent."""
+        from services.pvpc import refresh_snapshot, snapshot_age
+
+        now = now or datetime.now(_MADRID).replace(tzinfo=None)
+        missing = False
+
+        # Es refresca abans que caduqui perquè les pàgines sempre la trobin fresca
+        age = snapshot_age()
+        if age is None or age >= self.interval_s:
+            missing = not refresh_snapshot() and age is None
+
+        for day in self._days_due(now):
+            key = _profile_key(day)
+            entry = _PROFILES.get(key)
+            if entry is not None and entry.age() < _PROFILES.ttl_s:
+                continue
+            if _PROFILES.refresh(key, lambda d=day: _load_day_profiles(d)) is None:
+                missing = True
+
+        wait = RETRY_S if missing else self.interval_s
+        publication = now.replace(hour=PUBLICATION_HOUR, minute=PUBLICATION_MINUTE, second=0, microsecond=0)
+        if now < publication:
+            wait = min(wait, (publication - now).total_seconds() + 1)
+        return wait
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                wait = self.run_once()
+            except Exception:
+                wait = RETRY_S
+            self._stop.wait(wait)
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="price-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+_REFRESHER: Optional[PriceRefresher] = None
+_REFRESHER_LOCK = threading.Lock()
+
+
+def start_price_refresher() -> Optional[PriceRefresher]:
+    """Arrenca el refrescador (un cop per procés), tret que ELRATA_PRICE_REFRESHER=0."""
+    global _REFRESHER
+    if os.environ.get("ELRATA_PRICE_REFRESHER", "1") == "0":
+        return None
+    with _REFRESHER_LOCK:
+        if _REFRESHER is None:
+            _REFRESHER = PriceRefresher()
+            _REFRESHER.start()
+    return _REFRESHER
+
+
+def main() -> None:
+    """Executa el refrescador en primer pla (procés independent de l'app)."""
+    refresher = PriceRefresher()
+    try:
+        while True:
+            try:
+                wait = refresher.run_once()
+            except Exception as e:
+                print(f"Error refrescant preus: {e}")
+                wait = RETRY_S
+            print(f"{datetime.now():%Y-%m-%d %H:%M:%S} següent passada en {wait / 60:.0f} min")
+            time.sleep(wait)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
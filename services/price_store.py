@@ -0,0 +1,384 @@
+"""
+Magatzem local de sèries temporals de preus (PVPC i altres indicadors ESIOS).
+
+Format columnar i només d'afegir: per a cada (indicador, geo_id, mes UTC)
+hi ha dos fitxers binaris, `AAAA-MM.ts` (int64, segons epoch UTC, ordenats)
+i `AAAA-MM.val` (float64, valor tal com el publica ESIOS). Les lectures fan
+servir `numpy.memmap`, de manera que una consulta per rang només llegeix del
+disc el tros que necessita (cerca binària sobre els instants).
+
+Afegir dades posteriors a l'última és un simple append. Si arriben dades
+desordenades o repetides, la partició es fusiona i es reescriu de manera
+atòmica (conserva el valor més nou de cada instant). Les escriptures es
+fan amb un bloqueig de fitxer (`.lock` a l'arrel) perquè diversos processos
+(Streamlit, el refrescador, `pvpc_backfill`) poden escriure alhora. Les
+lectures prenen el mateix bloqueig compartit: la reescriptura substitueix
+`.ts` i `.val` un darrere l'altre, i sense bloqueig es podrien llegir
+instants nous amb valors antics.
+
+Els agregats horaris, diaris i mensuals es calculen en hora local (Península
+o Canàries segons la zona), amb els canvis d'hora d'Europa.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+import numpy as np
+
+from services.cache_dir import get_cache_dir
+
+TS_DTYPE = np.dtype("<i8")
+VAL_DTYPE = np.dtype("<f8")
+GEO_CANARIAS = 8742  # hora local UTC+0 (UTC+1 a l'estiu); la resta UTC+1 / UTC+2
+
+FREQUENCIES = {"hour": "datetime64[h]", "day": "datetime64[D]", "month": "datetime64[M]"}
+AGGREGATIONS = ("mean", "sum", "min", "max", "count")
+
+TimeLike = Union[datetime, np.datetime64, int, str]
+
+
+@dataclass
+class PriceSeries:
+    """Sèrie d'un indicador i zona: instants UTC (datetime64[s]) i valors."""
+    timestamps: np.ndarray
+    values: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @property
+    def epoch(self) -> np.ndarray:
+        return self.timestamps.astype(TS_DTYPE)
+
+
+def to_epoch(moment: TimeLike) -> int:
+    """Segons epoch UTC. Un datetime sense zona es considera UTC."""
+    if isinstance(moment, (int, np.integer)):
+        return int(moment)
+    if isinstance(moment, datetime):
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return int(moment.timestamp())
+    return int(np.datetime64(moment, "s").astype(TS_DTYPE))
+
+
+def _epoch_array(timestamps: Iterable) -> np.ndarray:
+    arr = np.asarray(timestamps)
+    if np.issubdtype(arr.dtype, np.datetime64):
+        return arr.astype("datetime64[s]").astype(TS_DTYPE)
+    if arr.dtype == object:
+        return np.fromiter((to_epoch(t) for t in arr), dtype=TS_DTYPE, count=len(arr))
+    return arr.astype(TS_DTYPE)
+
+
+def _last_sunday_epoch(year: int, month: int) -> int:
+    """Instant (01:00 UTC) de l'últim diumenge del mes: canvi d'hora a Europa."""
+    last = np.datetime64(f"{year}-{month:02d}", "M") + 1
+    day = last.astype("datetime64[D]") - 1
+    # 1970-01-01 era dijous: (dies + 3) % 7 == 6 és diumenge
+    day -= (day.astype(np.int64) + 3 - 6) % 7
+    return int(day.astype("datetime64[s]").astype(TS_DTYPE)) + 3600
+
+
+def utc_offsets(epoch: np.ndarray, geo_id: Optional[int] = None) -> np.ndarray:
+    """Desplaçament (s) de l'hora local respecte d'UTC per a cada instant."""
+    base = 0 if geo_id == GEO_CANARIAS else 3600
+    offsets = np.full(epoch.shape, base, dtype=TS_DTYPE)
+    if epoch.size == 0:
+        return offsets
+    years = epoch.astype("datetime64[s]").astype("datetime64[Y]").astype(np.int64) + 1970
+    for year in np.unique(years):
+        start = _last_sunday_epoch(int(year), 3)
+        end = _last_sunday_epoch(int(year), 10)
+        offsets[(epoch >= start) & (epoch < end)] += 3600
+    return offsets
+
+
+def _dedupe_keep_last(ts: np.ndarray, vals: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Amb `ts` ordenat de manera estable, conserva l'últim valor de cada instant."""
+    if len(ts) < 2:
+        return ts, vals
+    keep = np.empty(len(ts), dtype=bool)
+    keep[:-1] = ts[1:] != ts[:-1]
+    keep[-1] = True
+    if keep.all():
+        return ts, vals
+    return ts[keep], vals[keep]
+
+
+@contextmanager
+def _file_lock(path: Path, shared: bool = False) -> Iterator[None]:
+    """
+    Bloqueig entre processos sobre `path` (flock; msvcrt a Windows, on
+    sempre és exclusiu). `shared` per a lectors: no s'excloen entre ells.
+    """
+    with open(path, "a+b") as f:
+        try:
+            import fcntl
+        except ImportError:
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            return
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class PriceStore:
+    """Sèries per (indicador, geo_id) en particions mensuals columnars."""
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = Path(root) if root else get_cache_dir() / "series"
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()  # entre fils del procés
+        self._lock_path = self.root / ".lock"  # entre processos
+
+    # --- Particions ---
+
+    def _partition_dir(self, indicator: int, geo_id: int) -> Path:
+        return self.root / str(indicator) / str(geo_id)
+
+    def _paths(self, indicator: int, geo_id: int, month: str) -> tuple[Path, Path]:
+        base = self._partition_dir(indicator, geo_id) / month
+        return base.with_suffix(".ts"), base.with_suffix(".val")
+
+    def partitions(self, indicator: int, geo_id: int) -> list[str]:
+        """Mesos (AAAA-MM) amb dades, ordenats."""
+        folder = self._partition_dir(indicator, geo_id)
+        if not folder.is_dir():
+            return []
+        return sorted(p.stem for p in folder.glob("*.ts"))
+
+    def geo_ids(self, indicator: int) -> list[int]:
+        folder = self.root / str(indicator)
+        if not folder.is_dir():
+            return []
+        return sorted(int(p.name) for p in folder.iterdir() if p.is_dir() and p.name.isdigit())
+
+    @staticmethod
+    def _rows(ts_path: Path, val_path: Path) -> int:
+        # Si una escriptura es va interrompre entre els dos fitxers, val la més curta
+        try:
+            return min(ts_path.stat().st_size // TS_DTYPE.itemsize, val_path.stat().st_size // VAL_DTYPE.itemsize)
+        except FileNotFoundError:
+            return 0
+
+    def _map(self, indicator: int, geo_id: int, month: str) -> tuple[np.ndarray, np.ndarray]:
+        ts_path, val_path = self._paths(indicator, geo_id, month)
+        n = self._rows(ts_path, val_path)
+        if n == 0:
+            return np.empty(0, TS_DTYPE), np.empty(0, VAL_DTYPE)
+        ts = np.memmap(ts_path, dtype=TS_DTYPE, mode="r", shape=(n,))
+        vals = np.memmap(val_path, dtype=VAL_DTYPE, mode="r", shape=(n,))
+        return ts, vals
+
+    def _load(self, ts_path: Path, val_path: Path) -> tuple[np.ndarray, np.ndarray]:
+        n = self._rows(ts_path, val_path)
+        if n == 0:
+            return np.empty(0, TS_DTYPE), np.empty(0, VAL_DTYPE)
+        return (
+            np.fromfile(ts_path, dtype=TS_DTYPE, count=n),
+            np.fromfile(val_path, dtype=VAL_DTYPE, count=n),
+        )
+
+    # --- Escriptura ---
+
+    def append(self, indicator: int, geo_id: int, timestamps: Iterable, values: Iterable) -> int:
+        """
+        Afegeix punts a la sèrie. `timestamps` en segons epoch UTC, datetime64
+        o datetime. Retorna el nombre de punts nous o modificats.
+        """
+        ts = _epoch_array(timestamps)
+        vals = np.asarray(values, dtype=VAL_DTYPE)
+        if len(ts) != len(vals):
+            raise ValueError("timestamps i values han de tenir la mateixa longitud")
+        if len(ts) == 0:
+            return 0
+        order = np.argsort(ts, kind="stable")
+        ts, vals = _dedupe_keep_last(ts[order], vals[order])
+        months = ts.astype("datetime64[s]").astype("datetime64[M]")
+        bounds = np.flatnonzero(months[1:] != months[:-1]) + 1
+        written = 0
+        # Dins del bloqueig es torna a llegir cada partició: un altre procés
+        # pot haver-hi escrit des de l'última vegada
+        with self._lock, _file_lock(self._lock_path):
+            for lo, hi in zip(np.r_[0, bounds], np.r_[bounds, len(ts)]):
+                month = str(months[lo])
+                written += self._append_partition(indicator, geo_id, month, ts[lo:hi], vals[lo:hi])
+        return written
+
+    def _append_partition(
+        self, indicator: int, geo_id: int, month: str, ts: np.ndarray, vals: np.ndarray
+    ) -> int:
+        ts_path, val_path = self._paths(indicator, geo_id, month)
+        ts_path.parent.mkdir(parents=True, exist_ok=True)
+        old_ts, old_vals = self._load(ts_path, val_path)
+        n_old = len(old_ts)
+
+        if n_old == 0 or ts[0] > old_ts[-1]:
+            # Cas habitual: dades posteriors a les guardades
+            if n_old and (ts_path.stat().st_size != n_old * TS_DTYPE.itemsize
+                          or val_path.stat().st_size != n_old * VAL_DTYPE.itemsize):
+                self._rewrite(ts_path, val_path, old_ts, old_vals)  # repara una escriptura a mitges
+            with open(ts_path, "ab") as f:
+                f.write(ts.tobytes())
+            with open(val_path, "ab") as f:
+                f.write(vals.tobytes())
+            return len(ts)
+
+        # Desordenades o repetides: fusió (el valor nou guanya) i reescriptura
+        merged_ts = np.concatenate([old_ts, ts])
+        merged_vals = np.concatenate([old_vals, vals])
+        order = np.argsort(merged_ts, kind="stable")
+        merged_ts, merged_vals = _dedupe_keep_last(merged_ts[order], merged_vals[order])
+        if len(merged_ts) == n_old and np.array_equal(merged_vals, old_vals, equal_nan=True):
+            return 0  # res de nou
+        changed = len(merged_ts) - n_old
+        if changed == 0:
+            changed = int(np.count_nonzero(merged_vals != old_vals))
+        self._rewrite(ts_path, val_path, merged_ts, merged_vals)
+        return changed
+
+    @staticmethod
+    def _rewrite(ts_path: Path, val_path: Path, ts: np.ndarray, vals: np.ndarray) -> None:
+        for path, arr in ((ts_path, ts), (val_path, vals)):
+            tmp = path.with_suffix(path.suffix + ".tmp")
+            with open(tmp, "wb") as f:
+                f.write(np.ascontiguousarray(arr).tobytes())
+            os.replace(tmp, path)
+
+    def append_esios_values(self, indicator: int, values: list[dict]) -> int:
+        """Desa la llista `values` d'una resposta ESIOS, agrupada per geo_id."""
+        by_geo: dict[int, tuple[list[int], list[float]]] = {}
+        for v in values:
+            geo_id, val = v.get("geo_id"), v.get("value")
+            ts = v.get("datetime_utc") or v.get("datetime")
+            if geo_id is None or val is None or not ts:
+                continue
+            try:
+                moment = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+            except ValueError:
+                continue
+            points = by_geo.setdefault(int(geo_id), ([], []))
+            points[0].append(to_epoch(moment))
+            points[1].append(float(val))
+        return sum(self.append(indicator, geo, ts, vals) for geo, (ts, vals) in by_geo.items())
+
+    # --- Lectura ---
+
+    def _months_between(self, indicator: int, geo_id: int, start: int, end: int) -> Iterator[str]:
+        first = str(np.datetime64(start, "s").astype("datetime64[M]"))
+        last = str(np.datetime64(end - 1, "s").astype("datetime64[M]"))
+        for month in self.partitions(indicator, geo_id):
+            if first <= month <= last:
+                yield month
+
+    def query(
+        self,
+        indicator: int,
+        geo_id: int,
+        start: Optional[TimeLike] = None,
+        end: Optional[TimeLike] = None,
+    ) -> PriceSeries:
+        """Punts amb `start <= instant < end` (sense límits: tota la sèrie)."""
+        lo = to_epoch(start) if start is not None else np.iinfo(TS_DTYPE).min // 2
+        hi = to_epoch(end) if end is not None else np.iinfo(TS_DTYPE).max // 2
+        ts_parts, val_parts = [], []
+        with _file_lock(self._lock_path, shared=True):
+            if start is None or end is None:
+                months = self.partitions(indicator, geo_id)
+            else:
+                months = list(self._months_between(indicator, geo_id, lo, hi))
+            for month in months:
+                ts, vals = self._map(indicator, geo_id, month)
+                i, j = np.searchsorted(ts, [lo, hi], side="left")
+                if j > i:
+                    ts_parts.append(np.array(ts[i:j]))
+                    val_parts.append(np.array(vals[i:j]))
+        if not ts_parts:
+            return PriceSeries(np.empty(0, "datetime64[s]"), np.empty(0, VAL_DTYPE))
+        return PriceSeries(
+            np.concatenate(ts_parts).astype("datetime64[s]"), np.concatenate(val_parts)
+        )
+
+    def last_timestamp(self, indicator: int, geo_id: int) -> Optional[np.datetime64]:
+        """Últim instant guardat, o None si la sèrie és buida."""
+        with _file_lock(self._lock_path, shared=True):
+            for month in reversed(self.partitions(indicator, geo_id)):
+                ts, _ = self._map(indicator, geo_id, month)
+                if len(ts):
+                    return np.datetime64(int(ts[-1]), "s")
+        return None
+
+    def resample(
+        self,
+        indicator: int,
+        geo_id: int,
+        freq: str,
+        start: Optional[TimeLike] = None,
+        end: Optional[TimeLike] = None,
+        how: str = "mean",
+    ) -> PriceSeries:
+        """
+        Agrega la sèrie a `freq` ("hour", "day" o "month") en hora local de la
+        zona; `start` i `end` són instants UTC. Les etiquetes són l'inici de
+        cada període en hora local (l'hora repetida del canvi d'octubre queda
+        en una sola etiqueta).
+        """
+        series = self.query(indicator, geo_id, start, end)
+        return resample_series(series, freq, how=how, geo_id=geo_id)
+
+
+def resample_series(
+    series: PriceSeries, freq: str, how: str = "mean", geo_id: Optional[int] = None
+) -> PriceSeries:
+    """Agrega una sèrie a hora, dia o mes local (vegeu `PriceStore.resample`)."""
+    if freq not in FREQUENCIES:
+        raise ValueError(f"freq ha de ser una de {sorted(FREQUENCIES)}")
+    if how not in AGGREGATIONS:
+        raise ValueError(f"how ha de ser una de {AGGREGATIONS}")
+    if len(series) == 0:
+        return PriceSeries(np.empty(0, FREQUENCIES[freq]), np.empty(0, VAL_DTYPE))
+    epoch = series.epoch
+    local = (epoch + utc_offsets(epoch, geo_id)).astype("datetime64[s]")
+    labels, inverse = np.unique(local.astype(FREQUENCIES[freq]), return_inverse=True)
+    vals = series.values
+    if how in ("mean", "sum", "count"):
+        counts = np.bincount(inverse, minlength=len(labels))
+        if how == "count":
+            return PriceSeries(labels, counts.astype(VAL_DTYPE))
+        sums = np.bincount(inverse, weights=vals, minlength=len(labels))
+        return PriceSeries(labels, sums / counts if how == "mean" else sums)
+    order = np.argsort(inverse, kind="stable")
+    starts = np.flatnonzero(np.r_[True, np.diff(inverse[order]) != 0])
+    reducer = np.minimum if how == "min" else np.maximum
+    return PriceSeries(labels, reducer.reduceat(vals[order], starts))
+
+
+_STORE: Optional[PriceStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_price_store() -> PriceStore:
+    """Magatzem compartit del procés, al directori de memòria cau."""
+    global _STORE
+    if _STORE is None:
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = PriceStore()
+    return _STORE
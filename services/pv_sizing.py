@@ -0,0 +1,133 @@
+"""
+Dimensionat de la instal·lació fotovoltaica: escombrat de totes les mides
+instal·lables i corba de retorn.
+
+Per a cada mida (de 1 kWp al màxim de la teulada, a passos de `PAS_KWP`)
+es calcula d'una vegada, amb una matriu (mides × 8760 hores):
+- producció, autoconsum i excedent hora a hora (`services.self_consumption`);
+- estalvi del primer any (energia que no es compra + excedent compensat,
+  amb el límit mensual de la compensació simplificada: l'excedent d'un mes
+  no pot valer més que l'energia comprada aquell mes);
+- fluxos de caixa de la vida útil amb degradació dels panells i pujada del
+  preu de l'electricitat;
+- retorn simple, VAN i TIR (`services.investment`).
+
+La producció és proporcional als kWp, de manera que una instal·lació
+degradada un x% produeix com una de nova amb un x% menys de potència:
+l'estalvi de cada any s'interpola sobre la corba estalvi-potència.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from services.investment import anys_retorn, tir, van
+from services.self_consumption import simular_autoconsum, totals_mensuals
+
+M2_PER_KWP = 5.0  # superfície de teulada per kWp
+COST_KWP = 1200.0  # € per kWp instal·lat
+PAS_KWP = 0.5
+POTENCIA_MINIMA_KWP = 1.0
+VIDA_ANYS = 25
+DEGRADACIO_PANELLS = 0.005  # pèrdua de producció per any
+PUJADA_PREU = 0.02  # pujada anual del preu de l'electricitat
+TAXA_DESCOMPTE = 0.04
+
+
+@dataclass
+class CorbaDimensionat:
+    """Resultats de cada mida de l'escombrat (arrays (K,); `fluxos` (K, anys))."""
+    kwp: np.ndarray
+    produccio_kwh: np.ndarray
+    autoconsum_kwh: np.ndarray
+    excedent_kwh: np.ndarray
+    pct_autoconsum: np.ndarray
+    estalvi_any1: np.ndarray  # €
+    cost: np.ndarray  # €
+    fluxos: np.ndarray  # estalvi de cada any de la vida útil (€)
+    retorn_anys: np.ndarray
+    van: np.ndarray
+    tir: np.ndarray
+
+    @property
+    def millor(self) -> int:
+        """Índex de la mida amb el VAN més alt (la més petita si n'hi ha d'iguals)."""
+        return int(np.argmax(self.van))
+
+    def estalvi_acumulat(self, i: int) -> np.ndarray:
+        """Estalvi acumulat al final de cada any per a la mida `i`."""
+        return np.cumsum(self.fluxos[i])
+
+
+def mides_instalables(
+    superficie_m2: float,
+    pas: float = PAS_KWP,
+    minim: float = POTENCIA_MINIMA_KWP,
+) -> np.ndarray:
+    """Potències (kWp) de `minim` fins al màxim que cap a la teulada."""
+    maxim = superficie_m2 / M2_PER_KWP
+    mides = np.arange(minim, maxim + 1e-9, pas)
+    if mides.size == 0 and maxim > 0:
+        mides = np.array([maxim])
+    return mides
+
+
+def dimensionar_fv(
+    consum_kwh,
+    produccio_per_kwp,
+    mides_kwp,
+    preu_kwh: float,
+    preu_excedent: float,
+    cost_kwp: float = COST_KWP,
+    vida_anys: int = VIDA_ANYS,
+    degradacio: float = DEGRADACIO_PANELLS,
+    pujada_preu: float = PUJADA_PREU,
+    taxa_descompte: float = TAXA_DESCOMPTE,
+    compensacio_limitada: bool = True,
+) -> CorbaDimensionat:
+    """
+    Avalua totes les mides alhora.
+
+    Args:
+        consum_kwh: Consum horari de l'any (T,)
+        produccio_per_kwp: Producció horària d'1 kWp, alineada amb el consum (T,)
+        mides_kwp: Potències a avaluar (K,), p. ex. `mides_instalables(m2)`
+        preu_kwh: Preu de l'electricitat comprada €/kWh
+        preu_excedent: Compensació de l'excedent €/kWh
+        cost_kwp: Cost d'instal·lació per kWp
+        vida_anys: Anys de la vida útil
+        degradacio: Pèrdua anual de producció dels panells
+        pujada_preu: Pujada anual dels preus (compra i compensació)
+        taxa_descompte: Taxa per al VAN
+        compensacio_limitada: Limita la compensació mensual al cost de l'energia comprada
+    """
+    mides = np.asarray(mides_kwp, dtype=np.float64)
+    graella = np.concatenate([[0.0], mides])
+    perfil = np.asarray(produccio_per_kwp, dtype=np.float64)
+    flux = simular_autoconsum(consum_kwh, graella[:, None] * perfil)
+    mensual = totals_mensuals(flux)
+    compensacio = mensual["excedent"] * preu_excedent
+    if compensacio_limitada:
+        compensacio = np.minimum(compensacio, mensual["importacio"] * preu_kwh)
+    estalvi = flux.autoconsum_kwh * preu_kwh + compensacio.sum(axis=-1)
+
+    anys = np.arange(vida_anys)
+    efectiva = mides[:, None] * (1 - degradacio) ** anys  # kWp equivalents de cada any
+    ordre = np.argsort(graella, kind="stable")
+    fluxos = np.interp(efectiva, graella[ordre], estalvi[ordre]) * (1 + pujada_preu) ** anys
+    cost = mides * cost_kwp
+
+    return CorbaDimensionat(
+        kwp=mides,
+        produccio_kwh=flux.produccio.sum(axis=-1)[1:],
+        autoconsum_kwh=flux.autoconsum_kwh[1:],
+        excedent_kwh=flux.excedent_kwh[1:],
+        pct_autoconsum=flux.pct_autoconsum[1:],
+        estalvi_any1=estalvi[1:],
+        cost=cost,
+        fluxos=fluxos,
+        retorn_anys=anys_retorn(fluxos, cost),
+        van=van(fluxos, cost, taxa_descompte),
+        tir=tir(fluxos, cost),
+    )
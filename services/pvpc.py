@@ -5,17 +5,42 @@ l'API PVPC retorna valors horaris que fem servir com a referència.
 Font: https://api.esios.ree.es - Indicador 1001 (PVPC 2.0TD).
 
 Per preus en temps real: sol·licita token a consultasios@ree.es
-i defineix la variable d'entorn ESIOS_API_KEY.
+i defineix la variable d'entorn ESIOS_API_KEY. Les consultes passen per
+`services.esios_client` (connexions reutilitzades, reintents i interruptor
+de circuit: amb l'API caiguda es torna el preu de referència a l'instant).
+
+La resposta de l'indicador 1001 porta els valors de totes les zones: es
+demana una sola vegada per finestra de temps i s'indexa per geo_id i instant
+en una sola passada (`PriceSnapshot`); totes les comunitats es responen
+d'aquest índex.
+
+La instantània es guarda a `services.price_cache.TieredCache` (memòria + disc
+compartit entre workers): una arrencada en fred no bloqueja la pàgina més
+d'uns segons i un preu caducat es retorna mentre es refresca en segon pla.
 """
 from __future__ import annotations
 
-import os
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Any, Optional
 
-# Cache senzill: (region, price, updated_str) per evitar crides excessives
-_CACHE: dict[str, tuple[float, str, datetime]] = {}
+from services.esios_client import EsiosError, get_esios_client
+from services.price_cache import TieredCache
+from services.singleflight import SingleFlight
+
+# Instantània fresca durant 60 min; fins a 24 h es serveix caducat mentre es refresca
 _CACHE_TTL_MINUTES = 60
+_CACHE_STALE_HOURS = 24
+_CACHE = TieredCache(
+    "pvpc",
+    ttl_s=_CACHE_TTL_MINUTES * 60,
+    stale_ttl_s=_CACHE_STALE_HOURS * 3600,
+)
+
+_SNAPSHOT_KEY = "snapshot:1001"
+
+# Peticions idèntiques simultànies a l'API comparteixen una sola crida
+_FETCHES = SingleFlight()
 
 # Geo IDs ESIOS: Península, Canàries, Balears, Ceuta, Melilla
 GEO_PENINSULA = 8741
@@ -50,66 +75,144 @@ FALLBACK_PRICE_CANARIAS = 0.18
 FALLBACK_PRICE_BALEARS = 0.24
 
 
-def _fetch_esios(start: datetime, end: datetime, geo_id: int) -> Optional[list[dict]]:
-    """Consulta l'API ESIOS per l'indicador 1001 (PVPC) en el rang de dates."""
+def _fetch_esios(start: datetime, end: datetime) -> Optional[list[dict]]:
+    """
+    Consulta l'API ESIOS per l'indicador 1001 (PVPC) en el rang de dates.
+    La resposta inclou els valors de totes les zones (`geo_id`). None si
+    l'API no respon o l'interruptor de circuit és obert.
+    """
     try:
-        import urllib.request
-        import json
-
-        start_str = start.strftime("%Y-%m-%dT%H:%M")
-        end_str = end.strftime("%Y-%m-%dT%H:%M")
-        url = (
-            "https://api.esios.ree.es/indicators/1001"
-            f"?start_date={start_str}&end_date={end_str}"
-        )
-        req = urllib.request.Request(
-            url,
-            headers={
-                "Accept": "application/json; application/vnd.esios-api-v1+json",
-            },
-        )
-        token = os.environ.get("ESIOS_API_KEY") or os.environ.get("ESIOS_TOKEN")
-        if token:
-            req.add_header("x-api-key", token)
-
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read().decode())
-    except Exception:
+        return get_esios_client().get_indicator(1001, start, end)
+    except EsiosError:
         return None
 
-    indicator = data.get("indicator") or data
-    values = indicator.get("values")
-    if not values or not isinstance(values, list):
-        return None
-    return values
+
+def _average_eur_per_kwh(prices: list[float]) -> float:
+    """
+    Preu mitjà €/kWh d'una sèrie. Els valors PVPC són del terme d'energia;
+    per comparar amb factura residencial s'aplica un factor si el resultat és
+    massa baix (impostos i conceptes afegits).
+    """
+    if not prices:
+        return 0.0
+    avg = sum(prices) / len(prices)
+    # PVPC publicat sol ser terme energia; factura final sol portar ~2x (impostos, etc.)
+    if avg < 0.12:
+        avg = avg * 2.2
+    return round(avg, 4)
 
 
-def _values_to_eur_per_kwh(values: list[dict], geo_id: int) -> tuple[float, int]:
+@dataclass
+class PriceSnapshot:
+    """
+    Valors d'una consulta a l'indicador 1001 indexats per zona.
+    `series[geo_id]` és la llista ordenada de (instant ISO, €/kWh).
     """
-    Converteix valors ESIOS (€/MWh) a €/kWh i retorna preu mitjà i nombre d'interval·les.
-    Els valors PVPC són del terme d'energia; per comparar amb factura residencial
-    s'aplica un factor si el resultat és massa baix (impostos i conceptes afegits).
+    updated: str
+    series: dict[int, list[tuple[str, float]]] = field(default_factory=dict)
+    _averages: dict[int, float] = field(default_factory=dict, repr=False, compare=False)
+
+    def price(self, geo_id: int) -> Optional[float]:
+        """Preu mitjà €/kWh de la zona, o None si no hi ha valors."""
+        if geo_id not in self._averages:
+            values = self.series.get(geo_id)
+            self._averages[geo_id] = _average_eur_per_kwh([v for _, v in values]) if values else 0.0
+        avg = self._averages[geo_id]
+        return avg if avg > 0 else None
+
+    def to_json(self) -> dict[str, Any]:
+        return {
+            "updated": self.updated,
+            "series": {str(geo): [list(p) for p in points] for geo, points in self.series.items()},
+        }
+
+    @classmethod
+    def from_json(cls, data: dict[str, Any]) -> "PriceSnapshot":
+        series = {
+            int(geo): [(ts, float(v)) for ts, v in points]
+            for geo, points in data.get("series", {}).items()
+        }
+        return cls(updated=data.get("updated", ""), series=series)
+
+
+def index_values(values: list[dict], updated: str = "") -> PriceSnapshot:
     """
-    total = 0.0
-    count = 0
+    Indexa en una sola passada els valors ESIOS (€/MWh) per geo_id i instant,
+    convertits a €/kWh. Un instant repetit dins d'una zona conserva l'últim valor.
+    """
+    by_geo: dict[int, dict[str, float]] = {}
     for v in values:
-        if v.get("geo_id") != geo_id:
-            continue
+        geo_id = v.get("geo_id")
         val = v.get("value")
-        if val is None:
+        if geo_id is None or val is None:
             continue
+        ts = v.get("datetime_utc") or v.get("datetime") or ""
         # API retorna €/MWh
-        eur_per_mwh = float(val)
-        eur_per_kwh = eur_per_mwh / 1000.0
-        total += eur_per_kwh
-        count += 1
-    if count == 0:
-        return 0.0, 0
-    avg = total / count
-    # PVPC publicat sol ser terme energia; factura final sol portar ~2x (impostos, etc.)
-    if avg < 0.12:
-        avg = avg * 2.2
-    return round(avg, 4), count
+        by_geo.setdefault(int(geo_id), {})[ts] = float(val) / 1000.0
+    series = {geo: sorted(points.items()) for geo, points in by_geo.items()}
+    return PriceSnapshot(updated=updated, series=series)
+
+
+def _load_snapshot() -> Optional[dict[str, Any]]:
+    """Consulta l'API una vegada per a totes les zones; None si no hi ha dades."""
+    now = datetime.now(timezone(timedelta(hours=1)))
+    # Demanem avui i ahir per si avui encara no hi ha dades
+    start = (now - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    end = now
+
+    # Clau sense `end` (canvia cada segon): qui arriba mentre una consulta del
+    # mateix dia és en curs n'aprofita la resposta
+    values = _FETCHES.do(start.isoformat(), lambda: _fetch_esios(start, end))
+    if not values:
+        return None
+    snapshot = index_values(values, updated=now.strftime("%d/%m/%Y %H:%M"))
+    if not snapshot.series:
+        return None
+    return snapshot.to_json()
+
+
+_SNAPSHOT_MEMO: tuple[Any, Optional[PriceSnapshot]] = (None, None)
+
+
+def get_price_snapshot() -> Optional[PriceSnapshot]:
+    """
+    Instantània PVPC compartida (memòria cau en dos nivells), o None si
+    l'API no ha respost i no n'hi ha cap de guardada.
+    """
+    global _SNAPSHOT_MEMO
+    if get_esios_client().available:
+        raw = _CACHE.get_or_load(_SNAPSHOT_KEY, _load_snapshot)
+    else:
+        # API caiguda: res d'esperar una càrrega; només el que hi hagi guardat
+        entry = _CACHE.get(_SNAPSHOT_KEY)
+        raw = entry.value if entry is not None and entry.age() < _CACHE.stale_ttl_s else None
+    if raw is None:
+        return None
+    # Reutilitzem l'objecte mentre la memòria cau retorni la mateixa entrada
+    memo_raw, memo = _SNAPSHOT_MEMO
+    if memo_raw is not raw:
+        memo = PriceSnapshot.from_json(raw)
+        _SNAPSHOT_MEMO = (raw, memo)
+    return memo
+
+
+def refresh_snapshot() -> bool:
+    """Torna a consultar l'API i desa la instantània (per al refrescador)."""
+    return _CACHE.refresh(_SNAPSHOT_KEY, _load_snapshot) is not None
+
+
+def snapshot_age() -> Optional[float]:
+    """Antiguitat en segons de la instantània guardada, o None si no n'hi ha."""
+    entry = _CACHE.get(_SNAPSHOT_KEY)
+    return entry.age() if entry is not None else None
+
+
+def _fallback_price(geo_id: int) -> float:
+    if geo_id == GEO_CANARIAS:
+        return FALLBACK_PRICE_CANARIAS
+    if geo_id == GEO_BALEARS:
+        return FALLBACK_PRICE_BALEARS
+    return FALLBACK_PRICE_PENINSULA
 
 
 def get_pvpc_price_eur_per_kwh(region: str) -> tuple[float, Optional[str]]:
@@ -121,30 +224,12 @@ def get_pvpc_price_eur_per_kwh(region: str) -> tuple[float, Optional[str]]:
     aquí es retorna la mitjana horària del dia en curs o de l'últim dia disponible
     perquè la web es pugui anar regulant sola.
     """
-    now = datetime.now(timezone(timedelta(hours=1)))
-    cache_key = region
-    if cache_key in _CACHE:
-        price, msg, cached_at = _CACHE[cache_key]
-        if (now - cached_at).total_seconds() < _CACHE_TTL_MINUTES * 60:
-            return price, msg
-
     geo_id = REGION_TO_GEO.get(region, GEO_PENINSULA)
-    tz = timezone(timedelta(hours=1))
-    # Demanem avui i ahir per si avui encara no hi ha dades
-    start = (now - timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
-    end = now
-
-    values = _fetch_esios(start, end, geo_id)
-    if values:
-        price, n = _values_to_eur_per_kwh(values, geo_id)
-        if n > 0 and price > 0:
-            updated = now.strftime("%d/%m/%Y %H:%M")
-            _CACHE[cache_key] = (price, f"PVPC (actualitzat {updated})", now)
-            return price, f"PVPC (actualitzat {updated})"
-        # Si el preu surt 0, fem fallback
+    snapshot = get_price_snapshot()
+    if snapshot is not None:
+        price = snapshot.price(geo_id)
+        # Si el preu surt 0, fallback
+        if price is not None:
+            return price, f"PVPC (actualitzat {snapshot.updated})"
     # Fallback per zona
-    if geo_id == GEO_CANARIAS:
-        return FALLBACK_PRICE_CANARIAS, None
-    if geo_id == GEO_BALEARS:
-        return FALLBACK_PRICE_BALEARS, None
-    return FALLBACK_PRICE_PENINSULA, None
+    return _fallback_price(geo_id), None
@@ -0,0 +1,270 @@
+"""
+Descàrrega de l'històric de preus ESIOS al magatzem local (`price_store`).
+
+El rang es divideix en trossos de `--chunk-days` dies per indicador, que es
+demanen en paral·lel (com a molt `--workers` alhora i `--rate` peticions per
+segon) amb el client asíncron de `services.esios_client`. Els trossos
+encavalcats o repetits no dupliquen res: el magatzem conserva un sol valor
+per instant.
+
+Cada tros es reintenta fins a `--attempts` vegades, amb espera exponencial
+i passant sempre pel límit de peticions. El client té el seu propi
+interruptor, més tolerant que el per defecte: si s'obre, els trossos
+esperen que torni a deixar passar una prova en lloc de fallar tots seguits.
+
+Un fitxer de checkpoint (`backfill.done` al directori del magatzem) guarda
+els trossos ja baixats: tornar a llançar l'ordre continua on era. Els
+trossos que arriben fins avui no es marquen, perquè encara poden créixer,
+ni els que ESIOS ha tornat sense valors, que es tornen a demanar.
+
+Ús:
+    python -m services.pvpc_backfill --start 2023-01-01 --end 2025-12-31
+    python -m services.pvpc_backfill --start 2024-01-01 --indicator 1001 --indicator 600 --rate 1
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import random
+import sys
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+if __package__ in (None, ""):
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.esios_client import (
+    AsyncEsiosClient, CircuitBreaker, CircuitOpenError, EsiosError, NoValuesError,
+)
+from services.price_store import PriceStore, get_price_store
+
+DEFAULT_INDICATOR = 1001  # PVPC 2.0TD
+DEFAULT_CHUNK_DAYS = 31
+DEFAULT_WORKERS = 4
+DEFAULT_RATE = 2.0  # peticions per segon
+DEFAULT_ATTEMPTS = 4  # intents per tros
+RETRY_BACKOFF_S = 1.0  # primera espera entre intents (es dobla a cada intent)
+MAX_RETRY_BACKOFF_S = 30.0
+BREAKER_FAILURES = 8  # errors seguits que obren l'interruptor del backfill
+BREAKER_RESET_S = 30.0
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """Tros de descàrrega: un indicador entre `start` i `end` (exclusiu)."""
+    indicator: int
+    start: date
+    end: date
+
+    @property
+    def id(self) -> str:
+        return f"{self.indicator}:{self.start.isoformat()}:{self.end.isoformat()}"
+
+
+def plan_chunks(indicators: Iterable[int], start: date, end: date, chunk_days: int) -> list[Chunk]:
+    """Trossos consecutius de com a molt `chunk_days` dies entre `start` i `end` (inclòs)."""
+    chunks = []
+    stop = end + timedelta(days=1)
+    for indicator in indicators:
+        cursor = start
+        while cursor < stop:
+            nxt = min(cursor + timedelta(days=chunk_days), stop)
+            chunks.append(Chunk(indicator, cursor, nxt))
+            cursor = nxt
+    return chunks
+
+
+class RateLimiter:
+    """Espaia les peticions per no superar `rate` per segon."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+
+    async def acquire(self) -> None:
+        if not self.interval:
+            return
+        now = asyncio.get_running_loop().time()
+        wait = self._next - now
+        self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+def _retry_delay(attempt: int) -> float:
+    """Espera abans de l'intent `attempt` (1, 2, ...): exponencial amb jitter complet."""
+    return random.uniform(0, min(MAX_RETRY_BACKOFF_S, RETRY_BACKOFF_S * 2 ** (attempt - 1)))
+
+
+def backfill_client() -> AsyncEsiosClient:
+    """
+    Client per al backfill: sense reintents propis (els fa `_download`, a
+    través del límit de peticions) i amb un interruptor que aguanta més
+    errors seguits que el del client interactiu.
+    """
+    return AsyncEsiosClient(
+        retries=0,
+        breaker=CircuitBreaker(failure_threshold=BREAKER_FAILURES, reset_after_s=BREAKER_RESET_S),
+    )
+
+
+def _checkpoint_path(store: PriceStore) -> Path:
+    return store.root / "backfill.done"
+
+
+def _load_checkpoint(path: Path) -> set[str]:
+    if not path.exists():
+        return set()
+    with open(path, encoding="utf-8") as f:
+        return {line.rstrip("\n") for line in f if line.strip()}
+
+
+async def _download(
+    chunks: list[Chunk],
+    store: PriceStore,
+    client: AsyncEsiosClient,
+    workers: int,
+    rate: float,
+    attempts: int,
+    on_result: Callable[[Chunk, Optional[int], Optional[str]], None],
+) -> None:
+    slots = asyncio.Semaphore(workers)
+    limiter = RateLimiter(rate)
+
+    async def fetch(chunk: Chunk) -> tuple[Chunk, Optional[int], Optional[str]]:
+        """(tros, punts nous o None si no hi ha valors, error)."""
+        start = datetime(chunk.start.year, chunk.start.month, chunk.start.day)
+        end = datetime(chunk.end.year, chunk.end.month, chunk.end.day) - timedelta(minutes=1)
+        async with slots:
+            error = "cap intent"
+            for attempt in range(max(attempts, 1)):
+                if attempt:
+                    await asyncio.sleep(_retry_delay(attempt))
+                await limiter.acquire()
+                try:
+                    values = await client.get_indicator(chunk.indicator, start, end)
+                except NoValuesError:
+                    return chunk, None, None
+                except CircuitOpenError as e:
+                    # L'API es dona per caiguda: s'espera que l'interruptor deixi passar una prova
+                    error = str(e)
+                    await asyncio.sleep(client.breaker.reset_after_s)
+                    continue
+                except EsiosError as e:
+                    error = str(e)
+                    continue
+                written = await asyncio.to_thread(store.append_esios_values, chunk.indicator, values)
+                return chunk, written, None
+            return chunk, None, error
+
+    try:
+        for next_result in asyncio.as_completed([fetch(c) for c in chunks]):
+            on_result(*await next_result)
+    finally:
+        client.close()
+
+
+def run_backfill(
+    start: date,
+    end: date,
+    indicators: Iterable[int] = (DEFAULT_INDICATOR,),
+    chunk_days: int = DEFAULT_CHUNK_DAYS,
+    workers: int = DEFAULT_WORKERS,
+    rate: float = DEFAULT_RATE,
+    attempts: int = DEFAULT_ATTEMPTS,
+    resume: bool = True,
+    store: Optional[PriceStore] = None,
+    client: Optional[AsyncEsiosClient] = None,
+    progress: Optional[Callable[[int, int, Chunk, Optional[int], Optional[str]], None]] = None,
+) -> dict[str, int]:
+    """
+    Baixa l'històric dels indicadors entre `start` i `end` (inclosos) al magatzem.
+
+    Returns:
+        Recompte: {"ok": trossos baixats, "empty": sense valors, "error": n,
+        "skipped": ja fets, "points": punts nous}
+    """
+    store = store or get_price_store()
+    client = client or backfill_client()
+    checkpoint = _checkpoint_path(store)
+    done_ids = _load_checkpoint(checkpoint) if resume else set()
+
+    all_chunks = plan_chunks(indicators, start, end, chunk_days)
+    pending = [c for c in all_chunks if c.id not in done_ids]
+    counts = {"ok": 0, "empty": 0, "error": 0, "skipped": len(all_chunks) - len(pending), "points": 0}
+    if not pending:
+        return counts
+    today = date.today()
+
+    with open(checkpoint, "a" if resume else "w", encoding="utf-8") as ckpt:
+
+        def on_result(chunk: Chunk, written: Optional[int], error: Optional[str]) -> None:
+            if error is not None:
+                counts["error"] += 1
+            elif written is None:
+                counts["empty"] += 1  # sense valors: es torna a demanar la propera vegada
+            else:
+                counts["ok"] += 1
+                counts["points"] += written
+                # Els dies recents encara poden canviar: no es donen per fets
+                if chunk.end < today:
+                    ckpt.write(chunk.id + "\n")
+                    ckpt.flush()
+            if progress:
+                done = counts["ok"] + counts["empty"] + counts["error"]
+                progress(done, len(pending), chunk, written, error)
+
+        asyncio.run(_download(pending, store, client, workers, rate, attempts, on_result))
+    return counts
+
+
+def _print_progress(done: int, total: int, chunk: Chunk, written: Optional[int], error: Optional[str]) -> None:
+    detail = error or ("sense valors" if written is None else f"{written} punts nous")
+    print(f"[{done}/{total}] {chunk.indicator} {chunk.start} → {chunk.end}: {detail}", file=sys.stderr)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Baixa l'històric de preus ESIOS (PVPC i altres indicadors) al magatzem local.",
+    )
+    parser.add_argument("--start", required=True, type=date.fromisoformat, help="Primer dia (AAAA-MM-DD)")
+    parser.add_argument("--end", type=date.fromisoformat, help="Últim dia (per defecte, avui)")
+    parser.add_argument(
+        "--indicator", type=int, action="append",
+        help=f"Indicador ESIOS (es pot repetir; per defecte {DEFAULT_INDICATOR})",
+    )
+    parser.add_argument("--chunk-days", type=int, default=DEFAULT_CHUNK_DAYS, help="Dies per petició")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Peticions simultànies")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="Peticions per segon (0: sense límit)")
+    parser.add_argument("--attempts", type=int, default=DEFAULT_ATTEMPTS, help="Intents per tros")
+    parser.add_argument("--no-resume", action="store_true", help="Ignora el checkpoint i torna a començar")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Sense progrés per stderr")
+    args = parser.parse_args(argv)
+
+    t0 = time.monotonic()
+    counts = run_backfill(
+        args.start,
+        args.end or date.today(),
+        indicators=args.indicator or [DEFAULT_INDICATOR],
+        chunk_days=args.chunk_days,
+        workers=args.workers,
+        rate=args.rate,
+        attempts=args.attempts,
+        resume=not args.no_resume,
+        progress=None if args.quiet else _print_progress,
+    )
+    print(
+        f"Fet en {time.monotonic() - t0:.1f} s: {counts['ok']} trossos baixats ({counts['points']} punts nous), "
+        f"{counts['empty']} sense valors, {counts['error']} errors, {counts['skipped']} ja fets.",
+        file=sys.stderr,
+    )
+    if counts["error"] or counts["empty"]:
+        print("Torna a executar la mateixa ordre per reprendre els trossos pendents.", file=sys.stderr)
+    return 0 if counts["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
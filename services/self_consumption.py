@@ -0,0 +1,162 @@
+"""
+Simulació d'autoconsum: creua hora a hora el consum i la producció solar.
+
+- Consum: corba pujada per l'usuari (`services.load_curve`) passada a les
+  8760 hores de l'any de referència, o un perfil sintètic a partir del
+  consum anual amb la forma dels perfils de consum estàndard de REE per al
+  2.0TD (dia feiner / cap de setmana i festiu, pes de cada mes).
+- Producció: perfil horari de `services.solar_profile`.
+
+Per a cada hora: autoconsum = mín(consum, producció), excedent = producció -
+autoconsum, importació = consum - autoconsum. Tot en una passada vectoritzada
+(uns quants microsegons per a un any), i també amb una matriu de produccions
+(una fila per mida d'instal·lació) contra el mateix consum.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+
+from services.solar_profile import ANY_REFERENCIA, hourly_timestamps, monthly_totals
+from services.tariff_periods import valle_days
+
+# Forma horària (0-23 h) aproximada dels perfils inicials de REE per al 2.0TD.
+# Es normalitza en construir el perfil: només compta la proporció entre hores.
+PERFIL_FEINER: tuple[float, ...] = (
+    0.032, 0.026, 0.023, 0.022, 0.022, 0.024, 0.030, 0.038, 0.043, 0.043, 0.042, 0.042,
+    0.043, 0.045, 0.046, 0.042, 0.040, 0.041, 0.045, 0.052, 0.060, 0.063, 0.056, 0.044,
+)
+PERFIL_FESTIU: tuple[float, ...] = (
+    0.036, 0.030, 0.026, 0.024, 0.023, 0.023, 0.024, 0.027, 0.033, 0.040, 0.045, 0.047,
+    0.048, 0.050, 0.050, 0.045, 0.041, 0.041, 0.044, 0.049, 0.055, 0.058, 0.053, 0.043,
+)
+# Pes de cada mes (gener..desembre) en el consum anual residencial
+PES_MENSUAL: tuple[float, ...] = (
+    0.095, 0.085, 0.085, 0.077, 0.075, 0.076, 0.087, 0.085, 0.077, 0.077, 0.084, 0.097,
+)
+
+
+@dataclass
+class ResultatAutoconsum:
+    """Fluxos horaris (kWh) de la simulació i totals."""
+    consum: np.ndarray
+    produccio: np.ndarray
+    autoconsum: np.ndarray
+    excedent: np.ndarray
+    importacio: np.ndarray
+
+    @property
+    def autoconsum_kwh(self):
+        return self.autoconsum.sum(axis=-1)
+
+    @property
+    def excedent_kwh(self):
+        return self.excedent.sum(axis=-1)
+
+    @property
+    def importacio_kwh(self):
+        return self.importacio.sum(axis=-1)
+
+    @property
+    def pct_autoconsum(self):
+        """Fracció de la producció que es consumeix a casa."""
+        produccio = self.produccio.sum(axis=-1)
+        return np.divide(self.autoconsum_kwh, produccio, out=np.zeros_like(produccio), where=produccio > 0)
+
+    @property
+    def pct_autosuficiencia(self):
+        """Fracció del consum coberta amb producció pròpia."""
+        consum = self.consum.sum(axis=-1)
+        return np.divide(self.autoconsum_kwh, consum, out=np.zeros_like(consum), where=consum > 0)
+
+
+@lru_cache(maxsize=8)
+def _perfil_unitari(year: int) -> np.ndarray:
+    """Perfil sintètic de consum de l'any que suma 1."""
+    valle = valle_days(year)
+    feiner = np.asarray(PERFIL_FEINER) / sum(PERFIL_FEINER)
+    festiu = np.asarray(PERFIL_FESTIU) / sum(PERFIL_FESTIU)
+    per_dia = np.where(valle[:, None], festiu, feiner)
+    days = np.arange(f"{year:04d}-01-01", f"{year + 1:04d}-01-01", dtype="datetime64[D]")
+    months = days.astype("datetime64[M]").astype(np.int64) % 12
+    # Cada mes rep el seu pes repartit entre els seus dies
+    dies_mes = np.bincount(months, minlength=12)
+    per_dia = per_dia * (np.asarray(PES_MENSUAL) / sum(PES_MENSUAL) / dies_mes)[months][:, None]
+    profile = per_dia.ravel()
+    profile.setflags(write=False)
+    return profile
+
+
+def perfil_consum_sintetic(consum_anual_kwh: float, year: int = ANY_REFERENCIA) -> np.ndarray:
+    """Consum horari (kWh) de l'any amb la forma dels perfils estàndard."""
+    return _perfil_unitari(year) * consum_anual_kwh
+
+
+def consum_horari_des_de_corba(timestamps, kwh, year: int = ANY_REFERENCIA) -> np.ndarray:
+    """
+    Passa una corba de consum (horària o quarthorària, d'un any qualsevol) a
+    les hores de `year`, per mes, dia i hora. Si la corba cobreix més d'un
+    any se'n fan servir els últims 12 mesos. Les hores sense dades s'omplen
+    amb el perfil sintètic escalat al nivell mitjà de la corba.
+    """
+    ts = np.asarray(timestamps, dtype="datetime64[h]")
+    values = np.asarray(kwh, dtype=np.float64)
+    if len(ts):
+        # Només els últims 12 mesos: anys solapats no s'han de sumar al mateix slot
+        last = ts.max()
+        last_month = last.astype("datetime64[M]")
+        cutoff = (last_month - 12).astype("datetime64[h]") + (last - last_month.astype("datetime64[h]"))
+        recent = ts > cutoff
+        ts, values = ts[recent], values[recent]
+    grid = hourly_timestamps(year)
+    # Posició (mes, dia, hora) dins de l'any de referència
+    days = ts.astype("datetime64[D]")
+    months = days.astype("datetime64[M]")
+    month_day = (days - months).astype(np.int64)
+    month_no = months.astype(np.int64) % 12
+    hour = (ts - days).astype(np.int64)
+    target = (
+        np.datetime64(f"{year:04d}-01", "M") + month_no
+    ).astype("datetime64[D]") + month_day
+    slot = (target.astype("datetime64[h]") + hour - grid[0]).astype(np.int64)
+    # El 29 de febrer cau fora si l'any de referència no és de traspàs
+    valid = target.astype("datetime64[M]").astype(np.int64) % 12 == month_no
+    slot, values = slot[valid], values[valid]
+
+    consum = np.bincount(slot, weights=values, minlength=len(grid))
+    covered = np.bincount(slot, minlength=len(grid)) > 0
+    if covered.all():
+        return consum
+    sintetic = _perfil_unitari(year)
+    nivell = consum[covered].sum() / sintetic[covered].sum() if covered.any() else 0.0
+    consum[~covered] = sintetic[~covered] * nivell
+    return consum
+
+
+def simular_autoconsum(consum_kwh, produccio_kwh) -> ResultatAutoconsum:
+    """
+    Autoconsum, excedent i importació hora a hora.
+
+    `produccio_kwh` pot ser una matriu (K, hores) per simular K instal·lacions
+    alhora; els totals del resultat són llavors arrays (K,).
+    """
+    consum = np.asarray(consum_kwh, dtype=np.float64)
+    produccio = np.asarray(produccio_kwh, dtype=np.float64)
+    autoconsum = np.minimum(consum, produccio)
+    return ResultatAutoconsum(
+        consum=consum,
+        produccio=produccio,
+        autoconsum=autoconsum,
+        excedent=produccio - autoconsum,
+        importacio=consum - autoconsum,
+    )
+
+
+def totals_mensuals(resultat: ResultatAutoconsum, year: int = ANY_REFERENCIA) -> dict[str, np.ndarray]:
+    """Consum, producció, autoconsum, excedent i importació de cada mes (1D)."""
+    return {
+        nom: monthly_totals(getattr(resultat, nom), year)
+        for nom in ("consum", "produccio", "autoconsum", "excedent", "importacio")
+    }
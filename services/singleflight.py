@@ -0,0 +1,46 @@
+"""
+Agrupació de crides concurrents idèntiques ("single flight").
+
+Si diversos fils demanen el mateix `key` mentre una crida encara és en
+curs, només el primer l'executa; la resta esperen el mateix Future i
+reben el mateix resultat (o la mateixa excepció). Evita l'allau de
+peticions a l'API quan caduca un preu i moltes sessions el volen alhora.
+"""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Hashable, Optional
+
+
+class SingleFlight:
+    """Una crida en curs com a molt per clau; la resta comparteixen el resultat."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Executa `fn` si no hi ha cap crida en curs per `key`; si n'hi ha,
+        n'espera el resultat (com a molt `timeout` segons; TimeoutError si no arriba).
+        """
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._calls[key] = fut
+        if leader:
+            try:
+                fut.set_result(fn())
+            except BaseException as e:
+                fut.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._calls[key]
+        return fut.result(timeout=timeout)
+
+    def in_flight(self, key: Hashable) -> bool:
+        with self._lock:
+            return key in self._calls
@@ -0,0 +1,195 @@
+"""
+Perfil horari de producció fotovoltaica (8760 hores) per regió, inclinació
+i orientació.
+
+A partir de la irradiació global horitzontal mitjana de cada mes
+(`services.irradiance_data`):
+1. Irradiació diària: interpolació suau entre mesos que conserva el total
+   de cada mes.
+2. Repartiment horari: Collares-Pereira i Rabl per a la global i Liu-Jordan
+   per a la difusa, amb la fracció difusa diària d'Erbs segons l'índex de
+   claredat.
+3. Pla dels panells: model isotròpic (directa amb el factor geomètric,
+   difusa del cel i reflexió del terra).
+4. Producció: kWh per kWp amb les pèrdues del sistema.
+
+Tot es calcula vectoritzat sobre les hores de l'any en hora local de
+rellotge (amb canvi d'hora; Canàries en la seva hora), de manera que el
+perfil es pot creuar directament amb una corba de consum. El resultat es
+guarda en memòria per configuració.
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+
+import numpy as np
+
+from services.irradiance_data import ALBEDO, IRRADIACIO_REGIO, REGIO_PER_DEFECTE
+
+ANY_REFERENCIA = 2025  # any no de traspàs: 8760 hores
+INCLINACIO_PER_DEFECTE = 30.0  # graus
+PERDUES_SISTEMA = 0.14  # inversor, cablejat, temperatura, brutícia
+
+# Azimut (graus des del sud, positiu cap a l'oest) de les orientacions de la pàgina
+AZIMUT_ORIENTACIO: dict[str, float] = {
+    "Sud": 0.0,
+    "Sud-Est / Sud-Oest": 45.0,
+    "Est / Oest": 90.0,
+    "Nord": 180.0,
+}
+
+_SOLAR_CONSTANT = 1367.0  # W/m²
+_GEO_CANARIAS = 8742
+_GEO_PENINSULA = 8741
+
+
+def hourly_timestamps(year: int = ANY_REFERENCIA) -> np.ndarray:
+    """Inici de cada hora de l'any en hora local de rellotge (datetime64[h])."""
+    return np.arange(f"{year:04d}-01-01T00", f"{year + 1:04d}-01-01T00", dtype="datetime64[h]")
+
+
+def _daily_irradiation(monthly: tuple[float, ...], days: np.ndarray) -> np.ndarray:
+    """kWh/m² de cada dia: interpolació entre mitjans de mes, reescalada per mes."""
+    months = days.astype("datetime64[M]").astype(np.int64) % 12
+    doy = (days - days.astype("datetime64[Y]")).astype(np.int64)
+    centres = np.array([15, 45, 74, 105, 135, 166, 196, 227, 258, 288, 319, 349], dtype=np.float64)
+    values = np.asarray(monthly, dtype=np.float64)
+    # Extensió periòdica perquè desembre i gener enllacin
+    x = np.concatenate([centres[-1:] - 365, centres, centres[:1] + 365])
+    y = np.concatenate([values[-1:], values, values[:1]])
+    daily = np.interp(doy, x, y)
+    month_mean = np.bincount(months, weights=daily, minlength=12) / np.bincount(months, minlength=12)
+    return daily * (values / month_mean)[months]
+
+
+def _erbs_diffuse_fraction(kt: np.ndarray, sunset_deg: np.ndarray) -> np.ndarray:
+    """Fracció difusa diària (Erbs, Klein i Duffie, 1982)."""
+    short = np.where(
+        kt < 0.715,
+        1.0 - 0.2727 * kt + 2.4495 * kt**2 - 11.9514 * kt**3 + 9.3879 * kt**4,
+        0.143,
+    )
+    long = np.where(kt < 0.722, 1.0 + 0.2832 * kt - 2.5557 * kt**2 + 0.8448 * kt**3, 0.175)
+    return np.where(sunset_deg <= 81.4, short, long)
+
+
+def _per_day(values: np.ndarray) -> np.ndarray:
+    """Normalitza cada fila (dia) perquè sumi 1; els dies sense sol queden a 0."""
+    total = values.sum(axis=1, keepdims=True)
+    return np.divide(values, total, out=np.zeros_like(values), where=total > 0)
+
+
+@lru_cache(maxsize=128)
+def _profile_per_kwp(
+    region: str,
+    tilt: float,
+    azimuth: float,
+    year: int,
+    losses: float,
+) -> np.ndarray:
+    from services.price_store import utc_offsets
+
+    lat, lon, monthly = IRRADIACIO_REGIO.get(region, IRRADIACIO_REGIO[REGIO_PER_DEFECTE])
+    geo_id = _GEO_CANARIAS if region == "Canàries" else _GEO_PENINSULA
+    local = hourly_timestamps(year)
+    n_days = len(local) // 24
+
+    # Instant UTC del centre de cada hora local
+    local_s = local.astype("datetime64[s]").astype(np.int64)
+    base = 0 if geo_id == _GEO_CANARIAS else 3600
+    mid = local_s - utc_offsets(local_s - base, geo_id) + 1800
+
+    doy = (mid // 86400 - np.datetime64(f"{year:04d}-01-01", "D").astype(np.int64)).astype(np.float64)
+    b = 2 * np.pi * doy / 365
+    decl = (
+        0.006918 - 0.399912 * np.cos(b) + 0.070257 * np.sin(b) - 0.006758 * np.cos(2 * b)
+        + 0.000907 * np.sin(2 * b) - 0.002697 * np.cos(3 * b) + 0.00148 * np.sin(3 * b)
+    )
+    eot_min = 229.18 * (
+        0.000075 + 0.001868 * np.cos(b) - 0.032077 * np.sin(b)
+        - 0.014615 * np.cos(2 * b) - 0.04089 * np.sin(2 * b)
+    )
+    e0 = 1.000110 + 0.034221 * np.cos(b) + 0.001280 * np.sin(b) + 0.000719 * np.cos(2 * b)
+    solar_time = (mid % 86400) / 3600 + lon / 15 + eot_min / 60
+    omega = np.radians(15 * (solar_time - 12))
+
+    phi = np.radians(lat)
+    sin_d, cos_d = np.sin(decl), np.cos(decl)
+    cos_zenith = np.sin(phi) * sin_d + np.cos(phi) * cos_d * np.cos(omega)
+
+    # Magnituds diàries (dia local; s'agafa el migdia de cada dia)
+    noon = np.s_[12::24]
+    ws = np.arccos(np.clip(-np.tan(phi) * np.tan(decl[noon]), -1, 1))
+    h0 = (24 / np.pi) * _SOLAR_CONSTANT * e0[noon] / 1000 * (
+        np.cos(phi) * cos_d[noon] * np.sin(ws) + ws * np.sin(phi) * sin_d[noon]
+    )
+    h = _daily_irradiation(monthly, local[noon].astype("datetime64[D]"))
+    kt = np.clip(np.divide(h, h0, out=np.zeros_like(h), where=h0 > 0), 0, 1)
+    hd = h * _erbs_diffuse_fraction(kt, np.degrees(ws))
+
+    # Repartiment horari (files = dies)
+    cos_w = np.cos(omega).reshape(n_days, 24)
+    above = np.maximum(cos_w - np.cos(ws)[:, None], 0)
+    a = 0.409 + 0.5016 * np.sin(ws - np.pi / 3)
+    bb = 0.6609 - 0.4767 * np.sin(ws - np.pi / 3)
+    ghi = (h[:, None] * 1000 * _per_day(above * (a[:, None] + bb[:, None] * cos_w))).ravel()
+    dhi = np.minimum((hd[:, None] * 1000 * _per_day(above)).ravel(), ghi)
+    beam = ghi - dhi
+
+    # Pla inclinat
+    beta, gamma = np.radians(tilt), np.radians(azimuth)
+    cos_incidence = (
+        sin_d * np.sin(phi) * np.cos(beta)
+        - sin_d * np.cos(phi) * np.sin(beta) * np.cos(gamma)
+        + cos_d * np.cos(phi) * np.cos(beta) * np.cos(omega)
+        + cos_d * np.sin(phi) * np.sin(beta) * np.cos(gamma) * np.cos(omega)
+        + cos_d * np.sin(beta) * np.sin(gamma) * np.sin(omega)
+    )
+    rb = np.divide(
+        np.maximum(cos_incidence, 0), cos_zenith,
+        out=np.zeros_like(cos_zenith), where=cos_zenith > 0.05,
+    )
+    poa = (
+        beam * np.minimum(rb, 5.0)
+        + dhi * (1 + np.cos(beta)) / 2
+        + ghi * ALBEDO * (1 - np.cos(beta)) / 2
+    )
+    profile = poa / 1000 * (1 - losses)
+    profile.setflags(write=False)
+    return profile
+
+
+def hourly_production(
+    region: str,
+    kwp: float = 1.0,
+    tilt: float = INCLINACIO_PER_DEFECTE,
+    azimuth: float = 0.0,
+    year: int = ANY_REFERENCIA,
+    losses: float = PERDUES_SISTEMA,
+) -> np.ndarray:
+    """
+    Producció (kWh) de cada hora de l'any d'una instal·lació de `kwp` kWp.
+
+    Args:
+        region: Comunitat Autònoma (les desconegudes fan servir Catalunya)
+        kwp: Potència pic instal·lada
+        tilt: Inclinació dels panells en graus (0 = horitzontal)
+        azimuth: Graus des del sud, positiu cap a l'oest (-90 est, 90 oest)
+        year: Any del calendari (8760 hores, 8784 si és de traspàs)
+        losses: Pèrdues del sistema (fracció)
+
+    Returns:
+        Array alineat amb `hourly_timestamps(year)`.
+    """
+    profile = _profile_per_kwp(region, float(tilt), float(azimuth), int(year), float(losses))
+    return profile if kwp == 1.0 else profile * kwp
+
+
+def monthly_totals(hourly: np.ndarray, year: int = ANY_REFERENCIA) -> np.ndarray:
+    """
+    Suma per mes (12 valors a l'última dimensió) d'una sèrie o matriu
+    alineada amb `hourly_timestamps(year)`.
+    """
+    months = hourly_timestamps(year).astype("datetime64[M]").astype(np.int64)
+    starts = np.flatnonzero(np.diff(months, prepend=months[0] - 1))
+    return np.add.reduceat(np.asarray(hourly, dtype=np.float64), starts, axis=-1)
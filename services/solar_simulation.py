@@ -0,0 +1,228 @@
+"""
+Simulació solar completa a partir de les entrades del simulador: consum
+horari, producció, dimensionat, economia de la potència triada i bateria.
+
+És el motor de `pages/Simulador Solar.py`, que només pinta el resultat, i es
+pot fer servir igual des de processos per lots o benchmarks. Cada pas està
+memoritzat (LRU acotada) per la tupla d'entrades: Streamlit torna a executar
+la pàgina sencera a cada interacció, i amb les mateixes entrades el resultat
+surt de la memòria sense recalcular res. Per això les entrades han de ser
+hashables (la corba de consum es passa com els bytes del CSV) i els arrays
+dels resultats són de només lectura.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass, fields
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from services.battery import COST_KWH, CorbaBateria, corba_amortitzacio
+from services.load_curve import read_load_curve
+from services.pv_sizing import CorbaDimensionat, dimensionar_fv, mides_instalables
+from services.self_consumption import (
+    consum_horari_des_de_corba, perfil_consum_sintetic, simular_autoconsum, totals_mensuals,
+)
+from services.solar_profile import AZIMUT_ORIENTACIO, hourly_production
+
+MIDA_CACHE = 32  # combinacions d'entrades guardades per funció
+COMPENSACIO_FRACCIO = 0.5  # l'excedent es compensa a aquesta fracció del preu...
+COMPENSACIO_MAXIMA = 0.12  # ...amb aquest màxim (€/kWh)
+CO2_KG_KWH = 0.25  # emissions evitades per kWh solar
+
+
+@dataclass(frozen=True)
+class DimensionatSolar:
+    """Consum, perfil d'1 kWp i escombrat de totes les mides que caben a la teulada."""
+    consum_horari: np.ndarray  # kWh de cada hora de l'any de referència
+    consum_anual_kwh: float  # de la corba si n'hi ha, si no l'indicat
+    produccio_kwp: np.ndarray  # kWh de cada hora per kWp instal·lat
+    preu_kwh: float
+    preu_excedent: float
+    corba: CorbaDimensionat
+    kwh_corba: Optional[float] = None  # kWh llegits del CSV (abans de completar l'any)
+    avis_corba: Optional[str] = None  # motiu si el CSV no s'ha pogut llegir
+
+    @property
+    def opcions_kwp(self) -> list[float]:
+        return [float(k) for k in self.corba.kwp]
+
+    @property
+    def kwp_optim(self) -> float:
+        return float(self.corba.kwp[self.corba.millor])
+
+
+@dataclass(frozen=True)
+class SimulacioSolar:
+    """Resultat d'una potència concreta: energia, economia i totals mensuals."""
+    dimensionat: DimensionatSolar
+    kwp: float
+    produccio_horaria: np.ndarray
+    produccio_kwh: float
+    autoconsum_kwh: float
+    excedent_kwh: float
+    pct_autoconsum: float  # fracció de la producció consumida a casa
+    estalvi_any1: float  # €
+    cost: float  # €
+    retorn_anys: float  # inf si no es recupera
+    van: float
+    tir: float  # NaN si no està definida
+    estalvi_acumulat: np.ndarray  # € al final de cada any de la vida útil
+    produccio_mensual: np.ndarray
+    consum_mensual: np.ndarray
+    estalvi_mensual: np.ndarray  # € del primer any, amb la compensació limitada
+
+    @property
+    def cost_sense_solar(self) -> float:
+        return self.dimensionat.consum_anual_kwh * self.dimensionat.preu_kwh
+
+    @property
+    def pct_estalvi(self) -> float:
+        """Fracció de la factura d'energia sense solar que s'estalvia."""
+        base = self.cost_sense_solar
+        return self.estalvi_any1 / base if base > 0 else 0.0
+
+    @property
+    def importacio_kwh(self) -> float:
+        return max(self.dimensionat.consum_anual_kwh - self.autoconsum_kwh, 0.0)
+
+    @property
+    def co2_kg(self) -> float:
+        return self.produccio_kwh * CO2_KG_KWH
+
+
+def preu_compensacio(preu_kwh: float) -> float:
+    """€/kWh amb què es compensa l'excedent."""
+    return min(preu_kwh * COMPENSACIO_FRACCIO, COMPENSACIO_MAXIMA)
+
+
+def _nomes_lectura(*arrays: np.ndarray) -> None:
+    for a in arrays:
+        a.setflags(write=False)
+
+
+@lru_cache(maxsize=MIDA_CACHE)
+def dimensionar(
+    region: str,
+    orientacio: str,
+    superficie_m2: float,
+    consum_anual_kwh: float,
+    preu_kwh: float,
+    corba_csv: Optional[bytes] = None,
+) -> DimensionatSolar:
+    """
+    Consum horari (corba del CSV o perfil estàndard), producció d'1 kWp i
+    escombrat de mides. Si el CSV no es pot llegir es fa servir el perfil
+    estàndard i el motiu queda a `avis_corba`.
+
+    Args:
+        region: Comunitat Autònoma
+        orientacio: Clau de `AZIMUT_ORIENTACIO`
+        superficie_m2: Superfície de teulada disponible
+        consum_anual_kwh: Consum anual (s'ignora si la corba es llegeix bé)
+        preu_kwh: Preu de l'electricitat comprada €/kWh
+        corba_csv: Contingut del CSV de la corba de consum, opcional
+    """
+    consum = None
+    kwh_corba = avis = None
+    if corba_csv is not None:
+        try:
+            corba = read_load_curve(corba_csv)
+            consum = consum_horari_des_de_corba(corba.timestamps, corba.kwh)
+            kwh_corba = float(corba.total_kwh)
+            consum_anual_kwh = float(consum.sum())
+        except ValueError as e:
+            avis = str(e)
+    if consum is None:
+        consum = perfil_consum_sintetic(consum_anual_kwh)
+
+    produccio_kwp = hourly_production(region, azimuth=AZIMUT_ORIENTACIO[orientacio])
+    preu_excedent = preu_compensacio(preu_kwh)
+    escombrat = dimensionar_fv(
+        consum, produccio_kwp, mides_instalables(superficie_m2), preu_kwh, preu_excedent,
+    )
+    _nomes_lectura(consum, *(getattr(escombrat, f.name) for f in fields(escombrat)))
+    return DimensionatSolar(
+        consum_horari=consum,
+        consum_anual_kwh=float(consum_anual_kwh),
+        produccio_kwp=produccio_kwp,
+        preu_kwh=float(preu_kwh),
+        preu_excedent=preu_excedent,
+        corba=escombrat,
+        kwh_corba=kwh_corba,
+        avis_corba=avis,
+    )
+
+
+@lru_cache(maxsize=MIDA_CACHE)
+def simular_solar(
+    region: str,
+    orientacio: str,
+    superficie_m2: float,
+    consum_anual_kwh: float,
+    preu_kwh: float,
+    corba_csv: Optional[bytes] = None,
+    kwp: Optional[float] = None,
+) -> SimulacioSolar:
+    """
+    Simula una instal·lació de `kwp` kWp (per defecte, la de més VAN de
+    l'escombrat). Els altres arguments són els de `dimensionar`.
+    """
+    dim = dimensionar(region, orientacio, superficie_m2, consum_anual_kwh, preu_kwh, corba_csv)
+    kwp = dim.kwp_optim if kwp is None else float(kwp)
+    produccio = dim.produccio_kwp * kwp
+    flux = simular_autoconsum(dim.consum_horari, produccio)
+    # L'economia surt de l'escombrat: la degradació s'interpola sobre tota la
+    # corba de mides, de manera que una mida sola donaria un altre resultat
+    economia = dim.corba
+    i = int(np.searchsorted(economia.kwp, kwp))
+    if i == len(economia.kwp) or not np.isclose(economia.kwp[i], kwp):
+        economia = dimensionar_fv(
+            dim.consum_horari, dim.produccio_kwp, np.insert(economia.kwp, i, kwp),
+            dim.preu_kwh, dim.preu_excedent,
+        )
+    mensual = totals_mensuals(flux)
+    compensacio = np.minimum(mensual["excedent"] * dim.preu_excedent, mensual["importacio"] * dim.preu_kwh)
+    estalvi_mensual = mensual["autoconsum"] * dim.preu_kwh + compensacio
+    acumulat = economia.estalvi_acumulat(i)
+    _nomes_lectura(produccio, acumulat, mensual["produccio"], mensual["consum"], estalvi_mensual)
+    return SimulacioSolar(
+        dimensionat=dim,
+        kwp=kwp,
+        produccio_horaria=produccio,
+        produccio_kwh=float(produccio.sum()),
+        autoconsum_kwh=float(flux.autoconsum_kwh),
+        excedent_kwh=float(flux.excedent_kwh),
+        pct_autoconsum=float(flux.pct_autoconsum),
+        estalvi_any1=float(economia.estalvi_any1[i]),
+        cost=float(economia.cost[i]),
+        retorn_anys=float(economia.retorn_anys[i]),
+        van=float(economia.van[i]),
+        tir=float(economia.tir[i]),
+        estalvi_acumulat=acumulat,
+        produccio_mensual=mensual["produccio"],
+        consum_mensual=mensual["consum"],
+        estalvi_mensual=estalvi_mensual,
+    )
+
+
+@lru_cache(maxsize=MIDA_CACHE)
+def simular_bateria_solar(
+    region: str,
+    orientacio: str,
+    superficie_m2: float,
+    consum_anual_kwh: float,
+    preu_kwh: float,
+    corba_csv: Optional[bytes] = None,
+    kwp: Optional[float] = None,
+    cost_kwh: float = COST_KWH,
+) -> CorbaBateria:
+    """Corba d'amortització de les bateries sobre la instal·lació de `simular_solar`."""
+    sim = simular_solar(region, orientacio, superficie_m2, consum_anual_kwh, preu_kwh, corba_csv, kwp)
+    dim = sim.dimensionat
+    corba = corba_amortitzacio(
+        dim.consum_horari, sim.produccio_horaria, dim.preu_kwh, dim.preu_excedent, cost_kwh=cost_kwh,
+    )
+    _nomes_lectura(*(getattr(corba, f.name) for f in fields(corba)))
+    return corba
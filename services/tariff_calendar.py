@@ -0,0 +1,167 @@
+"""
+Calendari precalculat de períodes 2.0TD.
+
+Per a cada zona i any es construeix un array uint8 amb el període (1 punta,
+2 llano, 3 valle) de cada quart d'hora, es desa al directori de memòria cau
+i es llegeix amb `numpy.memmap`: classificar un rang d'instants és un tall
+de l'array, sense càlculs de dates.
+
+Zones:
+- "peninsula", "canarias", "balears": indexades en UTC (quart d'hora des de
+  l'1 de gener a les 00:00 UTC). Inclouen el canvi d'hora i el desplaçament
+  de Canàries, per a sèries en UTC com les del magatzem de preus.
+- "local": indexada en hora local de rellotge, la mateixa per a totes les
+  zones (corbes de consum de la distribuïdora).
+
+Els fitxers porten la versió de les regles (hores i festius) al nom: si
+canvien, es tornen a generar.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from datetime import datetime, timezone
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from services.tariff_periods import NATIONAL_HOLIDAYS, PERIOD_VALLE, WORKDAY_HOURS, valle_days
+
+SLOTS_PER_DAY = 96
+SLOT_MINUTES = 15
+ZONE_LOCAL = "local"
+ZONE_PENINSULA = "peninsula"
+ZONE_CANARIAS = "canarias"
+ZONE_BALEARS = "balears"
+ZONES = (ZONE_LOCAL, ZONE_PENINSULA, ZONE_CANARIAS, ZONE_BALEARS)
+
+_GEO_TO_ZONE = {8742: ZONE_CANARIAS, 8743: ZONE_BALEARS}
+_ZONE_TO_GEO = {ZONE_PENINSULA: 8741, ZONE_CANARIAS: 8742, ZONE_BALEARS: 8743}
+_WORKDAY_SLOTS = np.repeat(np.array(WORKDAY_HOURS, dtype=np.uint8), SLOTS_PER_DAY // 24)
+_BUILD_LOCK = threading.Lock()
+
+
+def zone_for_geo(geo_id: int) -> str:
+    """Zona del calendari per a un geo_id d'ESIOS."""
+    return _GEO_TO_ZONE.get(geo_id, ZONE_PENINSULA)
+
+
+def _rules_version() -> str:
+    rules = repr((WORKDAY_HOURS, sorted(NATIONAL_HOLIDAYS)))
+    return hashlib.sha256(rules.encode()).hexdigest()[:8]
+
+
+def _year_start_minutes(year: int) -> int:
+    return int(np.datetime64(f"{year:04d}-01-01", "m").astype(np.int64))
+
+
+def _build_local(year: int) -> np.ndarray:
+    """Quarts d'hora de l'any en hora local de rellotge."""
+    valle = valle_days(year)
+    periods = np.tile(_WORKDAY_SLOTS, len(valle))
+    periods.reshape(len(valle), SLOTS_PER_DAY)[valle] = PERIOD_VALLE
+    return periods
+
+
+def _build_utc(zone: str, year: int) -> np.ndarray:
+    """Quarts d'hora de l'any en UTC: hora local de la zona i calendari local."""
+    from services.price_store import utc_offsets
+
+    start = _year_start_minutes(year)
+    n = (_year_start_minutes(year + 1) - start) // SLOT_MINUTES
+    epoch = (start + np.arange(n, dtype=np.int64) * SLOT_MINUTES) * 60
+    local_minutes = (epoch + utc_offsets(epoch, _ZONE_TO_GEO[zone])) // 60
+    # L'hora local pot caure a l'any anterior o al següent
+    local = np.concatenate([_build_local(year - 1), _build_local(year), _build_local(year + 1)])
+    origin = _year_start_minutes(year - 1)
+    return local[(local_minutes - origin) // SLOT_MINUTES]
+
+
+def _calendar_path(zone: str, year: int) -> Optional[Path]:
+    try:
+        from services.cache_dir import get_cache_dir
+
+        folder = get_cache_dir() / "calendar"
+        folder.mkdir(parents=True, exist_ok=True)
+    except OSError:
+        return None
+    return folder / f"2.0TD-{zone}-{year}-{_rules_version()}.u8"
+
+
+@lru_cache(maxsize=64)
+def get_calendar(zone: str, year: int) -> np.ndarray:
+    """
+    Període de cada quart d'hora de l'any per a la zona (uint8, només
+    lectura). Es genera la primera vegada i després es llegeix del disc.
+    """
+    if zone not in ZONES:
+        raise ValueError(f"zona desconeguda: {zone!r}")
+    path = _calendar_path(zone, year)
+    if path is not None and path.exists():
+        return np.memmap(path, dtype=np.uint8, mode="r")
+    with _BUILD_LOCK:
+        periods = _build_local(year) if zone == ZONE_LOCAL else _build_utc(zone, year)
+        if path is not None:
+            try:
+                tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+                periods.tofile(tmp)
+                os.replace(tmp, path)
+                return np.memmap(path, dtype=np.uint8, mode="r")
+            except OSError:
+                pass  # sense disc: el calendari en memòria també serveix
+    periods.setflags(write=False)
+    return periods
+
+
+def _minutes(moment, zone: str) -> int:
+    if isinstance(moment, datetime):
+        if zone == ZONE_LOCAL:
+            moment = moment.replace(tzinfo=None)
+            return int((moment - datetime(1970, 1, 1)).total_seconds() // 60)
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return int(moment.timestamp() // 60)
+    return int(np.datetime64(moment, "m").astype(np.int64))
+
+
+def periods_between(zone: str, start, end) -> np.ndarray:
+    """
+    Períodes dels quarts d'hora entre `start` (inclòs) i `end` (exclòs).
+    Per a les zones UTC, un datetime sense zona es considera UTC; per a
+    "local", es pren l'hora de rellotge del datetime. Dins d'un mateix any és un tall sense còpia.
+    """
+    lo = _minutes(start, zone) // SLOT_MINUTES * SLOT_MINUTES
+    hi = _minutes(end, zone)
+    if hi <= lo:
+        return np.empty(0, dtype=np.uint8)
+    first = int(np.datetime64(lo, "m").astype("datetime64[Y]").astype(np.int64)) + 1970
+    last = int(np.datetime64(hi - 1, "m").astype("datetime64[Y]").astype(np.int64)) + 1970
+    parts = []
+    for year in range(first, last + 1):
+        origin = _year_start_minutes(year)
+        cal = get_calendar(zone, year)
+        i = max(lo - origin, 0) // SLOT_MINUTES
+        j = min(-(-(hi - origin) // SLOT_MINUTES), len(cal))
+        parts.append(cal[i:j])
+    return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+
+def periods_at(zone: str, timestamps) -> np.ndarray:
+    """
+    Període de cada instant (datetime64 o convertible): UTC per a les zones
+    peninsula/canarias/balears, hora de rellotge per a "local".
+    """
+    minutes = np.asarray(timestamps, dtype="datetime64[m]").astype(np.int64)
+    if minutes.size == 0:
+        return np.empty(0, dtype=np.uint8)
+    lo, hi = int(minutes.min()), int(minutes.max())
+    first = int(np.datetime64(lo, "m").astype("datetime64[Y]").astype(np.int64)) + 1970
+    last = int(np.datetime64(hi, "m").astype("datetime64[Y]").astype(np.int64)) + 1970
+    if first == last:
+        cal = get_calendar(zone, first)
+    else:
+        cal = np.concatenate([get_calendar(zone, y) for y in range(first, last + 1)])
+    return cal[(minutes - _year_start_minutes(first)) // SLOT_MINUTES]
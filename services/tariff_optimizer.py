@@ -0,0 +1,139 @@
+"""
+Optimitzador del contracte elèctric: potència contractada × tarifa ×
+desplaçament de consum de punta a valle.
+
+Totes les combinacions es valoren d'una sola vegada amb
+`simular_factures_lot`: una fila per esglaó de potència i una columna per
+parella (tarifa, desplaçament), amb el preu efectiu €/kWh de cada parella.
+Per a la graella habitual (~20 potències × 4 tarifes × 11 desplaçaments) és
+menys d'un mil·lisegon, prou per recalcular a cada canvi de la pàgina.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Collection, Optional, Sequence
+
+import numpy as np
+
+from services.invoice_simulator import DesglosFactura, simular_factures_lot
+from services.tariff_periods import PERIOD_LLANO, PERIOD_PUNTA, PERIOD_VALLE
+
+# Potències normalitzades en baixa tensió fins a 15 kW (2.0TD), en kW
+POTENCIES_NORMALITZADES: tuple[float, ...] = (
+    1.15, 1.725, 2.3, 3.45, 4.6, 5.75, 6.9, 8.05, 9.2, 10.35, 11.5, 13.8, 14.49, 15.0,
+)
+# Fracció del consum en punta que es desplaça a valle: 0%, 10%, ..., 50%
+DESPLACAMENTS: tuple[float, ...] = tuple(round(0.1 * i, 1) for i in range(6))
+# Estalvi (€ per factura) per sota del qual canviar de contracte no aporta res
+ESTALVI_MINIM = 0.5
+
+
+@dataclass
+class OpcioContracte:
+    """Una configuració avaluada per l'optimitzador."""
+    potencia_kw: float
+    nom_tarifa: str
+    desplacament: float  # fracció del consum en punta passada a valle
+    preu_kwh_energia: float  # €/kWh efectiu del terme d'energia
+    desglos: DesglosFactura
+
+
+def preus_efectius(
+    preu_pvpc: float,
+    factors_tarifa: Sequence[float],
+    pct_periode: Optional[tuple[float, float, float]],
+    factors_periode: Optional[dict[int, float]],
+    desplacaments: Sequence[float],
+    per_periode: Optional[Sequence[bool]] = None,
+) -> np.ndarray:
+    """
+    Preu mitjà €/kWh de cada tarifa (files) amb cada desplaçament (columnes).
+
+    Sense `pct_periode` (punta, llano, valle) el preu és pla i el
+    desplaçament no hi influeix. Amb `per_periode`, els factors de període
+    només s'apliquen a les tarifes marcades; les altres tenen preu fix.
+    """
+    preus = preu_pvpc * np.asarray(factors_tarifa, dtype=np.float64).reshape(-1, 1)
+    desp = np.asarray(desplacaments, dtype=np.float64).reshape(1, -1)
+    if pct_periode is None or factors_periode is None:
+        return np.broadcast_to(preus, (preus.shape[0], desp.shape[1])).copy()
+    punta, llano, valle = pct_periode
+    f = factors_periode
+    mix = (
+        punta * (1 - desp) * f[PERIOD_PUNTA]
+        + llano * f[PERIOD_LLANO]
+        + (valle + punta * desp) * f[PERIOD_VALLE]
+    )
+    if per_periode is None:
+        return preus * mix
+    return np.where(np.asarray(per_periode, dtype=bool).reshape(-1, 1), preus * mix, preus)
+
+
+def optimitzar_contracte(
+    consum_kwh: float,
+    dies: int,
+    preu_pvpc: float,
+    factors_tarifa: dict[str, float],
+    potencia_minima_kw: float = 0.0,
+    pct_periode: Optional[tuple[float, float, float]] = None,
+    factors_periode: Optional[dict[int, float]] = None,
+    tarifes_per_periode: Optional[Collection[str]] = None,
+    desplacaments: Sequence[float] = DESPLACAMENTS,
+    potencies: Sequence[float] = POTENCIES_NORMALITZADES,
+    top: int = 5,
+) -> list[OpcioContracte]:
+    """
+    Cerca les configuracions més barates del contracte.
+
+    Args:
+        consum_kwh: Consum del període en kWh
+        dies: Dies del període
+        preu_pvpc: Preu de referència PVPC €/kWh
+        factors_tarifa: {nom_tarifa: factor sobre el PVPC}, com a `comparar_tarifes`
+        potencia_minima_kw: Demanda màxima a cobrir; només es proven potències iguals o superiors
+        pct_periode: Repartiment del consum (punta, llano, valle) si hi ha discriminació horària
+        factors_periode: Preu de cada període relatiu a la mitjana ({PERIOD_PUNTA: 1.4, ...})
+        tarifes_per_periode: Tarifes amb preu per període; per defecte, totes
+        desplacaments: Fraccions del consum en punta que es proven de passar a valle
+        potencies: Esglaons de potència candidats
+        top: Nombre de configuracions a retornar
+
+    Returns:
+        Llista d'OpcioContracte ordenada per total (menor primer). Buida si cap
+        potència cobreix la demanda mínima.
+    """
+    candidates = np.array([p for p in potencies if p >= potencia_minima_kw], dtype=np.float64)
+    if candidates.size == 0 or not factors_tarifa:
+        return []
+    noms = list(factors_tarifa)
+    per_periode = None if tarifes_per_periode is None else [n in tarifes_per_periode for n in noms]
+    if pct_periode is None or factors_periode is None or (per_periode is not None and not any(per_periode)):
+        desplacaments = (0.0,)  # amb preu pla, desplaçar no canvia res
+    preus = preus_efectius(
+        preu_pvpc, [factors_tarifa[n] for n in noms], pct_periode, factors_periode, desplacaments, per_periode,
+    )
+    n_desp = preus.shape[1]
+
+    lot = simular_factures_lot(consum_kwh, candidates, dies, preus.ravel())
+    total = lot.total
+    if per_periode is not None and n_desp > 1:
+        # Les tarifes de preu fix repeteixen la mateixa columna per a cada
+        # desplaçament: només en compta la primera
+        repetida = ~np.asarray(per_periode, dtype=bool).reshape(-1, 1) & (np.arange(n_desp) > 0)
+        total = np.where(repetida.reshape(1, -1), np.inf, total)
+        top = min(top, total.size - int(repetida.sum()) * total.shape[0])
+    # Empats (p. ex. mateix preu amb més desplaçament): primer la potència
+    # més baixa i el menor desplaçament, que és l'ordre de la graella
+    ordre = np.argsort(total, axis=None, kind="stable")[:top]
+    opcions = []
+    for flat in ordre:
+        i, j = divmod(int(flat), lot.shape[1])
+        t, d = divmod(j, n_desp)
+        opcions.append(OpcioContracte(
+            potencia_kw=float(candidates[i]),
+            nom_tarifa=noms[t],
+            desplacament=float(desplacaments[d]) if per_periode is None or per_periode[t] else 0.0,
+            preu_kwh_energia=float(preus[t, d]),
+            desglos=lot.factura(i, j),
+        ))
+    return opcions
@@ -0,0 +1,91 @@
+"""
+Períodes horaris del peatge 2.0TD (punta, llano i valle).
+
+Dies feiners (hora local):
+- Punta (P1): 10-14 h i 18-22 h
+- Llano (P2): 8-10 h, 14-18 h i 22-24 h
+- Valle (P3): 0-8 h
+Caps de setmana i festius nacionals de data fixa: tot el dia valle.
+A Canàries s'aplica el mateix horari en hora local (una hora menys que a la
+Península); Balears, Ceuta i Melilla fan servir l'hora peninsular.
+
+`classify_periods` classifica sèries senceres (corbes de consum horàries o
+quarthoràries) sobre el calendari precalculat de `services.tariff_calendar`.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+
+PERIOD_PUNTA = 1
+PERIOD_LLANO = 2
+PERIOD_VALLE = 3
+
+PERIOD_NAMES: dict[int, str] = {
+    PERIOD_PUNTA: "punta",
+    PERIOD_LLANO: "llano",
+    PERIOD_VALLE: "valle",
+}
+
+# Període de cada hora d'un dia feiner (0-23)
+WORKDAY_HOURS: tuple[int, ...] = (
+    (PERIOD_VALLE,) * 8
+    + (PERIOD_LLANO,) * 2
+    + (PERIOD_PUNTA,) * 4
+    + (PERIOD_LLANO,) * 4
+    + (PERIOD_PUNTA,) * 4
+    + (PERIOD_LLANO,) * 2
+)
+
+# Festius nacionals de data fixa (mes, dia). Els festius mòbils (Divendres
+# Sant) i els autonòmics no compten per al 2.0TD.
+NATIONAL_HOLIDAYS: frozenset[tuple[int, int]] = frozenset({
+    (1, 1), (1, 6), (5, 1), (8, 15), (10, 12), (11, 1), (12, 6), (12, 8), (12, 25),
+})
+
+
+def is_valle_day(day: date) -> bool:
+    """Cert si tot el dia és valle (cap de setmana o festiu nacional)."""
+    return day.weekday() >= 5 or (day.month, day.day) in NATIONAL_HOLIDAYS
+
+
+def hour_period(day: date, hour: int) -> int:
+    """Període 2.0TD de l'hora local `hour` (0-23) del dia `day`."""
+    if is_valle_day(day):
+        return PERIOD_VALLE
+    return WORKDAY_HOURS[hour]
+
+
+def period_for(moment: datetime, canarias: bool = False) -> int:
+    """
+    Període 2.0TD d'un instant en hora peninsular (com les dades d'ESIOS).
+    Amb `canarias`, es classifica en hora local de Canàries.
+    """
+    if canarias:
+        moment = moment - timedelta(hours=1)
+    return hour_period(moment.date(), moment.hour)
+
+
+@lru_cache(maxsize=32)
+def valle_days(year: int) -> np.ndarray:
+    """Calendari de l'any: per a cada dia (0 = 1 de gener), cert si és tot valle."""
+    first = np.datetime64(f"{year:04d}-01-01", "D")
+    days = np.arange(first, np.datetime64(f"{year + 1:04d}-01-01", "D"))
+    # 1970-01-01 era dijous: (dies + 3) % 7 dona 0 = dilluns ... 6 = diumenge
+    valle = (days.astype(np.int64) + 3) % 7 >= 5
+    for month, day in NATIONAL_HOLIDAYS:
+        valle[date(year, month, day).timetuple().tm_yday - 1] = True
+    valle.setflags(write=False)
+    return valle
+
+
+def classify_periods(timestamps) -> np.ndarray:
+    """
+    Període 2.0TD (uint8: 1 punta, 2 llano, 3 valle) de cada interval,
+    donat l'instant d'inici en hora local (datetime64 o convertible).
+    """
+    from services.tariff_calendar import ZONE_LOCAL, periods_at
+
+    return periods_at(ZONE_LOCAL, timestamps)
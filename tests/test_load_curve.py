@@ -0,0 +1,34 @@
+"""Lectura de la columna d'hora de les corbes de la distribuïdora."""
+import numpy as np
+
+from services.load_curve import read_load_curve
+
+
+def _inicis(csv: str) -> list[str]:
+    return [str(t) for t in read_load_curve(csv).timestamps]
+
+
+def test_hora_hhmm_es_el_final_de_l_interval():
+    csv = "Fecha;Hora;Consumo_kWh\n01/01/2025;01:00;1\n01/01/2025;02:00;2\n01/01/2025;24:00;3\n"
+    assert _inicis(csv) == ["2025-01-01T00:00", "2025-01-01T01:00", "2025-01-01T23:00"]
+
+
+def test_hora_hhmm_quarthoraria():
+    csv = "Fecha;Hora;Consumo_kWh\n01/01/2025;00:15;1\n01/01/2025;00:30;1\n01/01/2025;24:00;3\n"
+    corba = read_load_curve(csv)
+    assert corba.interval_minutes == 15
+    assert str(corba.timestamps[-1]) == "2025-01-01T23:45"
+
+
+def test_hora_numerica_i_hhmm_coincideixen():
+    numerica = "Fecha;Hora;Consumo_kWh\n" + "".join(f"01/01/2025;{h};{h}\n" for h in range(1, 25))
+    hhmm = "Fecha;Hora;Consumo_kWh\n" + "".join(f"01/01/2025;{h:02d}:00;{h}\n" for h in range(1, 25))
+    assert _inicis(numerica) == _inicis(hhmm)
+
+
+def test_dia_de_25_hores_no_trepitja_l_endema():
+    csv = "Fecha;Hora;Consumo_kWh\n" + "".join(f"26/10/2025;{h};1\n" for h in range(1, 26))
+    csv += "27/10/2025;1;1\n"
+    ts = read_load_curve(csv).timestamps
+    assert str(ts[-2]) == "2025-10-26T23:00"
+    assert np.count_nonzero(ts == np.datetime64("2025-10-26T02:00")) == 2